@@ -0,0 +1,241 @@
+"""
+音频电平分析
+ffmpeg 把音频解码成 32 位浮点 PCM 按块输出，NumPy 逐块计算，一次读取得到
+采样峰值、真峰值（4倍过采样）、RMS、综合响度（ITU-R BS.1770 / EBU R128 的 LUFS）、
+削波采样数和静音比例；内存占用只与块大小有关，与音频时长无关。
+K 计权（响度计算用的两级 IIR 滤波）由 ffmpeg 的 biquad 滤镜完成，
+原始信号与 K 计权信号合并为同一路 PCM 输出，两者按采样对齐。
+"""
+import math
+import subprocess
+import threading
+from collections import deque
+
+import numpy as np
+
+from ffmpeg_runner import FFmpegError, ffmpeg_path
+from media_probe import MediaProbeError, ffmpeg_audio_stream, first_stream, probe_media
+
+# 每次读取的采样帧数（每帧包含所有声道）
+CHUNK_FRAMES = 65536
+# 削波判定电平：16 位整数满刻度（32767/32768），有损格式解码后可能超过 1.0
+CLIP_LEVEL = 32767 / 32768
+# 静音判定：100ms 片段的 RMS 低于该值（dBFS）
+SILENCE_THRESHOLD = -60.0
+
+# BS.1770 响度：400ms 块，75% 重叠（按 100ms 子块滑动），绝对门限 -70 LUFS，相对门限 -10 LU
+SUB_BLOCKS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# BS.1770-4 附录2 的 4 倍过采样真峰值滤波器（48 抽头，按相位分为 4 组）
+TRUE_PEAK_PHASES = np.array([
+    [0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500],
+    [-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375],
+    [-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875],
+    [-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750],
+], dtype=np.float32)
+# 任一相位的输出幅度不超过 输入最大幅度 × 该相位系数绝对值之和，用于跳过不可能刷新真峰值的块
+TRUE_PEAK_GAIN = float(np.abs(TRUE_PEAK_PHASES).sum(axis=1).max())
+
+def k_weighting(sample_rate):
+    """
+    K 计权滤波器系数（高架滤波 + 高通滤波），按采样率计算（与 libebur128 相同的推导）
+    返回: [(b0, b1, b2, a1, a2), (b0, b1, b2, a1, a2)]，a0 已归一化为 1
+    """
+    f0, gain, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    highpass = (1.0, -2.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    return [shelf, highpass]
+
+def channel_weights(channels):
+    """BS.1770 声道权重：5.1 声道的 LFE 不计入，环绕声道 1.41，其余 1.0"""
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+def _db(value, scale=10):
+    """能量/幅度转分贝，0 返回None（JSON 中无法表示 -inf）"""
+    return round(scale * math.log10(value), 2) if value > 0 else None
+
+class AudioAnalyzer:
+    """
+    逐块累积统计量，update() 接收 [帧数, 2*声道数] 的 float32 PCM：前一半声道为原始信号，后一半为 K 计权信号
+    跨块保留的只有真峰值滤波器的历史采样、不足 100ms 的尾部和每 100ms 一个的块能量（1小时约 280KB）
+    """
+
+    def __init__(self, sample_rate, channels, silence_threshold=SILENCE_THRESHOLD):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sub_block = max(1, round(sample_rate / 10))
+        self.weights = channel_weights(channels)
+        self.silence_level = 10 ** (silence_threshold / 10)
+        self.frames = 0
+        self.peak = 0.0
+        self.true_peak = 0.0
+        self.square_sum = 0.0
+        self.clipped = 0
+        self.sub_blocks = 0
+        self.silent_sub_blocks = 0
+        self._history = np.zeros((TRUE_PEAK_PHASES.shape[1] - 1, channels), dtype=np.float32)
+        self._pending = np.zeros((0, 2 * channels), dtype=np.float32)
+        self._energy_tail = np.zeros(0)
+        self._block_energies = []
+
+    def update(self, frames):
+        if not len(frames):
+            return
+        samples = frames[:, :self.channels]
+        self.frames += len(samples)
+        magnitude = np.abs(samples)
+        chunk_peak = float(magnitude.max())
+        self.clipped += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+        self.square_sum += float(np.square(samples, dtype=np.float64).sum())
+        self._update_true_peak(samples, chunk_peak)
+        self.peak = max(self.peak, chunk_peak)
+
+        # 凑满 100ms 的子块才计算能量，余下的留到下一块
+        combined = np.concatenate([self._pending, frames])
+        usable = len(combined) // self.sub_block * self.sub_block
+        self._pending = combined[usable:]
+        if not usable:
+            return
+        mean_square = np.square(combined[:usable], dtype=np.float64) \
+            .reshape(-1, self.sub_block, 2 * self.channels).mean(axis=1)
+        raw, k_weighted = mean_square[:, :self.channels], mean_square[:, self.channels:]
+        self.sub_blocks += len(raw)
+        self.silent_sub_blocks += int(np.count_nonzero(raw.mean(axis=1) < self.silence_level))
+
+        # 400ms 块的能量 = 连续 4 个子块能量的平均（子块等长）
+        energies = np.concatenate([self._energy_tail, k_weighted @ self.weights])
+        if len(energies) >= SUB_BLOCKS_PER_BLOCK:
+            self._block_energies.append(
+                np.convolve(energies, np.ones(SUB_BLOCKS_PER_BLOCK) / SUB_BLOCKS_PER_BLOCK, 'valid'))
+        self._energy_tail = energies[-(SUB_BLOCKS_PER_BLOCK - 1):]
+
+    def _update_true_peak(self, samples, chunk_peak):
+        """4 倍过采样后的最大幅度；比已有真峰值低 6dB 以上的块（如安静段落）不可能刷新结果，直接跳过"""
+        input_peak = max(chunk_peak, float(np.abs(self._history).max()))
+        padded = np.concatenate([self._history, samples])
+        self._history = padded[-(TRUE_PEAK_PHASES.shape[1] - 1):]
+        if input_peak * TRUE_PEAK_GAIN <= self.true_peak:
+            return
+        # 逐相位按抽头原地累加（所有声道一起算），比 np.convolve 和滑动窗口矩阵乘法都快
+        count, taps = len(samples), TRUE_PEAK_PHASES.shape[1]
+        upsampled = np.empty_like(samples)
+        for phase in TRUE_PEAK_PHASES:
+            np.multiply(padded[taps - 1:], phase[0], out=upsampled)
+            for tap in range(1, taps):
+                start = taps - 1 - tap
+                upsampled += phase[tap] * padded[start:start + count]
+            self.true_peak = max(self.true_peak, float(np.abs(upsampled).max()))
+
+    def integrated_loudness(self):
+        """门限处理后的综合响度（LUFS），有效音频不足 400ms 或全部低于绝对门限时返回None"""
+        if not self._block_energies:
+            return None
+        energies = np.concatenate(self._block_energies)
+        energies = energies[energies > 10 ** ((ABSOLUTE_GATE + 0.691) / 10)]
+        if not len(energies):
+            return None
+        gated = energies[energies > energies.mean() * 10 ** (RELATIVE_GATE / 10)]
+        return round(-0.691 + 10 * math.log10(gated.mean()), 2)
+
+    def result(self):
+        samples = self.frames * self.channels
+        momentary = max((float(e.max()) for e in self._block_energies), default=0.0)
+        return {
+            'duration': round(self.frames / self.sample_rate, 3),
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'sample_peak_dbfs': _db(self.peak, 20),
+            'true_peak_dbtp': _db(max(self.peak, self.true_peak), 20),
+            'rms_dbfs': _db(self.square_sum / samples) if samples else None,
+            'integrated_lufs': self.integrated_loudness(),
+            'momentary_max_lufs': round(-0.691 + 10 * math.log10(momentary), 2) if momentary > 0 else None,
+            'clipped_samples': self.clipped,
+            'silence_ratio': round(self.silent_sub_blocks / self.sub_blocks, 4) if self.sub_blocks else None,
+        }
+
+def analyze_audio(path, silence_threshold=SILENCE_THRESHOLD, info=None):
+    """
+    流式分析文件的第一条音轨（视频文件同样适用）
+    info: 已读取的文件信息（可选，省去一次 ffprobe）；其中没有采样率/声道数时从 ffmpeg 的流信息读取
+    返回: AudioAnalyzer.result() 的字典，分贝值为None表示无信号
+    失败时抛出 FFmpegError
+    """
+    if info is None:
+        try:
+            info = probe_media(path)
+        except MediaProbeError:
+            info = {}
+    stream = first_stream(info, 'audio')
+    if info and not stream:
+        raise FFmpegError("文件中没有音轨")
+    if not (stream.get('sample_rate') and stream.get('channels')):
+        # 按原始声道数分析：不能让 aformat 指定布局，否则单声道会被上混（每声道 -3dB）
+        try:
+            stream = {**ffmpeg_audio_stream(path), **{k: v for k, v in stream.items() if v}}
+        except MediaProbeError as e:
+            raise FFmpegError(str(e))
+        if not stream:
+            raise FFmpegError("文件中没有音轨")
+    sample_rate = stream.get('sample_rate')
+    channels = stream.get('channels')
+    if not (sample_rate and channels):
+        raise FFmpegError("无法确定音轨的采样率和声道数")
+    biquads = ','.join(f"biquad=b0={b0!r}:b1={b1!r}:b2={b2!r}:a0=1:a1={a1!r}:a2={a2!r}"
+                       for b0, b1, b2, a1, a2 in k_weighting(sample_rate))
+    # 双精度滤波（38Hz 高通在单精度下误差较大），原始信号在前、K 计权信号在后合并为 2*声道数 路
+    # amerge 要求两路输入的采样率确定，由 aformat 固定（与原采样率相同，不会重采样）
+    graph = (f"aformat=sample_fmts=dbl:sample_rates={sample_rate},asplit[raw][k];"
+             f"[k]{biquads}[weighted];[raw][weighted]amerge=inputs=2")
+    cmd = [ffmpeg_path(), '-hide_banner', '-nostdin', '-v', 'error', '-i', path,
+           '-map', '0:a:0', '-vn', '-af', graph, '-f', 'f32le', '-acodec', 'pcm_f32le', '-']
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_tail = deque(maxlen=20)
+    stderr_thread = threading.Thread(
+        target=lambda: stderr_tail.extend(line.decode('utf-8', 'replace') for line in process.stderr), daemon=True)
+    stderr_thread.start()
+
+    analyzer = AudioAnalyzer(sample_rate, channels, silence_threshold)
+    frame_bytes = 4 * 2 * channels
+    try:
+        while True:
+            data = process.stdout.read(CHUNK_FRAMES * frame_bytes)
+            if not data:
+                break
+            frames = np.frombuffer(data[:len(data) // frame_bytes * frame_bytes], dtype='<f4') \
+                .reshape(-1, 2 * channels)
+            analyzer.update(frames)
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        stderr_thread.join(timeout=5)
+    if process.returncode != 0:
+        raise FFmpegError(''.join(stderr_tail).strip() or f"ffmpeg 返回 {process.returncode}")
+    if not analyzer.frames:
+        raise FFmpegError("没有可分析的音频")
+    return analyzer.result()
+
+def analyze_file(path, silence_threshold=SILENCE_THRESHOLD):
+    """批量分析的工作函数（在子进程中运行），失败时返回带 error 字段的结果而不抛出异常"""
+    try:
+        return dict(file=path, **analyze_audio(path, silence_threshold))
+    except Exception as e:
+        return {'file': path, 'error': (str(e).strip() or repr(e)).splitlines()[-1]}
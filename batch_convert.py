@@ -0,0 +1,202 @@
+"""
+批量转换
+遍历目录/通配符得到输入文件，在进程池中并行转换（每个工作进程驱动一次 ffmpeg 转换），
+输出已是最新的文件直接跳过，结束后写入 JSON 汇总报告。
+"""
+import glob
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from tqdm import tqdm
+
+from convert_cache import hash_input
+from media_probe import MediaProbeError, probe_media
+
+def collect_inputs(targets, accept):
+    """
+    展开输入：目录递归遍历，文件直接使用，其余按通配符匹配（支持 **）
+    accept: 判断文件是否需要转换的函数
+    返回: [(输入文件, 所属根目录)]，根目录用于在输出目录中保留子目录结构
+    """
+    inputs = []
+    seen = set()
+
+    def add(path, root):
+        path = os.path.abspath(path)
+        if path not in seen and accept(path):
+            seen.add(path)
+            inputs.append((path, root))
+
+    for target in targets:
+        if os.path.isdir(target):
+            root = os.path.abspath(target)
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+                # 隐藏文件（包括转换中的临时文件 .name.xxxx.part.ext）不作为输入
+                for name in sorted(f for f in filenames if not f.startswith('.')):
+                    add(os.path.join(dirpath, name), root)
+        elif os.path.isfile(target):
+            add(target, os.path.dirname(os.path.abspath(target)))
+        else:
+            for path in sorted(glob.glob(target, recursive=True)):
+                if os.path.isfile(path):
+                    add(path, os.path.dirname(os.path.abspath(path)))
+    return inputs
+
+def output_path_for(input_file, root, to_format, speed=1.0, output_dir=None):
+    """输出文件路径：与交互模式相同的命名（name[_1.5x].fmt），指定输出目录时保留相对子目录"""
+    base = os.path.splitext(os.path.basename(input_file))[0]
+    if speed != 1.0:
+        base += f"_{speed}x"
+    if output_dir:
+        rel_dir = os.path.relpath(os.path.dirname(input_file), root)
+        directory = os.path.normpath(os.path.join(output_dir, rel_dir))
+    else:
+        directory = os.path.dirname(input_file)
+    return os.path.join(directory, f"{base}.{to_format}")
+
+def is_up_to_date(input_file, output_file):
+    """输出文件存在、非空且不早于输入文件"""
+    try:
+        out_stat = os.stat(output_file)
+    except OSError:
+        return False
+    return out_stat.st_size > 0 and out_stat.st_mtime >= os.path.getmtime(input_file)
+
+def is_fresh(input_file, output_file, cache=None, params=None):
+    """
+    输出是否仍然有效
+    有增量转换缓存（convert_cache.ConvertCache）时按记录比较输入、参数和输出；
+    没有记录的输出（旧版本生成）按修改时间判断，判断为最新时补登记，之后参数变化也能发现
+    （补登记不计算输入摘要，避免在规划阶段逐个完整读取输入）
+    """
+    if cache is None:
+        return is_up_to_date(input_file, output_file)
+    reason = cache.check(input_file, output_file, params)
+    if reason == 'no record' and is_up_to_date(input_file, output_file):
+        cache.record(input_file, output_file, params)
+        return True
+    return reason is None
+
+def plan_batch(inputs, to_format, speed=1.0, output_dir=None, force=False, cache=None, params=None):
+    """
+    生成任务列表
+    cache/params: 增量转换缓存和本次的转换参数，见 is_fresh
+    返回: (待转换 [(输入, 输出)], 跳过 [(输入, 输出, 原因)])
+    """
+    planned = [(path, output_path_for(path, root, to_format, speed, output_dir)) for path, root in inputs]
+    outputs = {os.path.abspath(output) for _, output in planned}
+    claimed = set()
+    tasks, skipped = [], []
+    for input_file, output_file in planned:
+        if input_file in outputs:
+            # 目录中已有的转换结果（如 a_1.5x.m4a）不再被当作输入
+            skipped.append((input_file, output_file, 'output of another input'))
+        elif os.path.abspath(output_file) in claimed:
+            # 同名不同扩展名的输入（如 a.wav 和 a.ogg）对应同一个输出，只转换排在前面的一个，
+            # 否则两个任务会同时写同一个文件，缓存记录也会在两个输入之间来回切换
+            skipped.append((input_file, output_file, 'output collision'))
+        elif os.path.abspath(output_file) == input_file:
+            skipped.append((input_file, output_file, 'same as input'))
+        elif not force and is_fresh(input_file, output_file, cache, params):
+            claimed.add(os.path.abspath(output_file))
+            skipped.append((input_file, output_file, 'up to date'))
+        else:
+            claimed.add(os.path.abspath(output_file))
+            tasks.append((input_file, output_file))
+    return tasks, skipped
+
+def _run_task(worker, input_file, output_file, options, hash_inputs=False):
+    """子进程中执行单个转换，异常转为结果记录；hash_inputs 时顺带计算输入摘要（input_hash）"""
+    start = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        method = worker(input_file, output_file, **options)
+        seconds = time.monotonic() - start
+        try:
+            media_seconds = probe_media(output_file)['duration']
+        except MediaProbeError:
+            media_seconds = None
+        result = {'input': input_file, 'output': output_file, 'status': 'converted', 'method': method,
+                  'seconds': round(seconds, 2), 'media_seconds': media_seconds,
+                  'realtime': round(media_seconds / seconds, 2) if media_seconds and seconds > 0 else None,
+                  'input_bytes': os.path.getsize(input_file), 'output_bytes': os.path.getsize(output_file)}
+        if hash_inputs:
+            result['input_hash'] = hash_input(input_file)
+        return result
+    except Exception as e:
+        return {'input': input_file, 'output': output_file, 'status': 'failed',
+                'seconds': round(time.monotonic() - start, 2), 'error': str(e).strip()[-500:]}
+
+def run_batch(tasks, worker, options=None, jobs=None, hash_inputs=False, on_result=None):
+    """
+    在进程池中执行转换任务
+    worker: 模块级转换函数 worker(input, output, **options)，返回转换方式，失败时抛出异常
+    jobs: 并行进程数，默认等于CPU核数
+    hash_inputs: 转换成功后在工作进程中计算输入文件摘要，结果中的 input_hash 见 convert_cache.hash_input
+    on_result: 每个任务完成时在主进程中调用 on_result(result)（如立即登记到转换缓存，中断时已完成的不会丢失）
+    同时在途的任务不超过 jobs 的两倍，文件数很多时内存占用保持稳定
+    返回: 结果列表（按完成顺序）
+    """
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    options = options or {}
+    results = []
+    task_iter = iter(tasks)
+    with ProcessPoolExecutor(max_workers=jobs) as executor, \
+            tqdm(total=len(tasks), desc="批量转换", unit="个") as pbar:
+        pending = set()
+        try:
+            while True:
+                for input_file, output_file in task_iter:
+                    pending.add(executor.submit(_run_task, worker, input_file, output_file, options, hash_inputs))
+                    if len(pending) >= jobs * 2:
+                        break
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if on_result is not None:
+                        on_result(result)
+                    results.append(result)
+                    pbar.update(1)
+                    if result['status'] == 'failed':
+                        pbar.write(f"失败: {os.path.basename(result['input'])}: {result['error'].splitlines()[-1]}")
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    return results
+
+def write_report(path, results, skipped, elapsed, settings):
+    """写入 JSON 汇总报告（先写临时文件再替换），返回汇总信息"""
+    converted = [r for r in results if r['status'] == 'converted']
+    failed = [r for r in results if r['status'] == 'failed']
+    summary = {
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'elapsed_seconds': round(elapsed, 2),
+        'settings': settings,
+        'converted': len(converted),
+        'skipped': len(skipped),
+        'failed': len(failed),
+        'methods': {},
+        # 整体实时倍数：转换得到的媒体总时长 / 实际用时，用于评估并行数设置
+        'realtime': round(sum(r.get('media_seconds') or 0 for r in converted) / elapsed, 2) if elapsed > 0 else None,
+        'input_bytes': sum(r['input_bytes'] for r in converted),
+        'output_bytes': sum(r['output_bytes'] for r in converted),
+    }
+    for r in converted:
+        method = r.get('method') or 'unknown'
+        summary['methods'][method] = summary['methods'].get(method, 0) + 1
+    report = dict(summary, files=results + [
+        {'input': input_file, 'output': output_file, 'status': 'skipped', 'reason': reason}
+        for input_file, output_file, reason in skipped
+    ])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return summary
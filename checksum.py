@@ -0,0 +1,167 @@
+"""
+边下载边计算校验和
+- 原生下载器按顺序写 .part 文件（分片下载也是按顺序追加），进度回调时读取新写入的部分
+  （刚写入的数据仍在页缓存中）增量计算 SHA-256，下载完成时摘要随即可用，不需要再从磁盘完整读一遍
+- 合并/修复等后处理会重写文件（mp4 的 faststart 会回头改写文件头，无法流式计算），
+  这类输出在后处理完成后立即计算，此时数据同样还在页缓存中
+- aria2c 多连接乱序写入，无法边下载边计算，计算校验和时下载改用原生下载器；
+  yt-dlp 合并音视频时总是加 faststart（写完后整体改写文件），合并输出只能在合并完成后计算（hashed_after 计数）
+- 摘要写入输出目录的 SHA256SUMS 清单（与 sha256sum -c 兼容）和媒体库索引
+- verify 命令按清单或索引并行重新校验文件
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = 'SHA256SUMS'
+CHUNK_SIZE = 1024 * 1024
+
+_manifest_lock = threading.Lock()
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """计算整个文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class IncrementalHasher:
+    """
+    通过 yt-dlp 的进度回调与 post_hooks 边下载边计算每个最终文件的 SHA-256
+
+    参数:
+      incremental: 下载器是否按顺序写文件（原生下载器为True；aria2c 等多连接下载器乱序写入，
+                   只能在完成后计算）
+    """
+
+    def __init__(self, incremental=True):
+        self.incremental = incremental
+        self.digests = {}     # 最终文件路径 -> 十六进制摘要
+        self._partial = {}    # 正在下载的临时文件 -> [hash对象, 已读取字节数]
+        self._finished = {}   # 下载完成的文件 -> (摘要, 大小, 修改时间)
+        self.hashed_after = 0  # 因后处理重写而在完成后计算的文件数
+
+    def _catch_up(self, path, state):
+        """读取文件中尚未计算的新增部分"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size < state[1]:
+            # 文件被截断（重新开始下载），从头计算
+            state[0], state[1] = hashlib.sha256(), 0
+        if size == state[1]:
+            return
+        with open(path, 'rb') as f:
+            f.seek(state[1])
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                state[0].update(chunk)
+                state[1] += len(chunk)
+
+    def progress_hook(self, d):
+        if not self.incremental:
+            return
+        status = d.get('status')
+        if status == 'downloading':
+            tmpfilename = d.get('tmpfilename') or d.get('filename')
+            if tmpfilename:
+                state = self._partial.setdefault(tmpfilename, [hashlib.sha256(), 0])
+                self._catch_up(tmpfilename, state)
+        elif status == 'finished':
+            filename = d.get('filename')
+            if not filename:
+                return
+            # .part 已改名为最终文件名，改名不改变内容
+            state = self._partial.pop(d.get('tmpfilename') or filename + '.part', None)
+            state = state or self._partial.pop(filename, None) or [hashlib.sha256(), 0]
+            self._catch_up(filename, state)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                return
+            if state[1] == stat.st_size:
+                self._finished[filename] = (state[0].hexdigest(), stat.st_size, stat.st_mtime_ns)
+
+    def post_hook(self, filepath):
+        finished = self._finished.pop(filepath, None)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return
+        if finished and finished[1:] == (stat.st_size, stat.st_mtime_ns):
+            self.digests[filepath] = finished[0]
+        else:
+            # 合并或修复后的新文件，刚写完仍在页缓存中
+            self.digests[filepath] = hash_file(filepath)
+            self.hashed_after += 1
+
+    def install(self, ydl_opts):
+        ydl_opts['progress_hooks'] = list(ydl_opts.get('progress_hooks') or []) + [self.progress_hook]
+        ydl_opts['post_hooks'] = list(ydl_opts.get('post_hooks') or []) + [self.post_hook]
+
+def read_manifest(manifest_path):
+    """
+    读取 SHA256SUMS 清单
+    返回: {文件绝对路径: 摘要}，同一文件出现多次时以最后一条为准
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            digest, _, name = line.partition('  ')
+            if not name:
+                digest, _, name = line.partition(' *')  # 二进制模式标记
+            if name:
+                entries[os.path.join(base_dir, name)] = digest.lower()
+    return entries
+
+def update_manifest(directory, digests):
+    """
+    把 {文件路径: 摘要} 写入 directory 下的 SHA256SUMS（同名文件的旧记录被替换）
+    先写临时文件再替换，读者不会看到写了一半的清单
+    """
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    names = {os.path.basename(path): digest for path, digest in digests.items()}
+    with _manifest_lock:
+        lines = []
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    name = line.rstrip('\n').partition('  ')[2]
+                    if name and name not in names:
+                        lines.append(line.rstrip('\n'))
+        except FileNotFoundError:
+            pass
+        lines.extend(f"{digest}  {name}" for name, digest in names.items())
+        tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+def verify_files(entries, jobs=4):
+    """
+    并行校验文件
+    entries: {文件路径: 预期摘要}
+    返回: [(路径, 状态)]，状态为 'ok'、'mismatch'、'missing' 或 'error: ...'
+    """
+    def check(item):
+        path, expected = item
+        if not os.path.exists(path):
+            return path, 'missing'
+        try:
+            return path, 'ok' if hash_file(path) == expected else 'mismatch'
+        except OSError as e:
+            return path, f'error: {e}'
+
+    # hashlib 在计算大块数据时释放 GIL，线程池即可利用多核和磁盘并发
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(check, sorted(entries.items())))
@@ -0,0 +1,333 @@
+"""
+自适应并发控制
+按主机维护并发下载数和分片并发数，采用AIMD（加性增、乘性减）策略:
+- 连续成功且错误率较低时，逐步提高并发
+- 遇到 HTTP 403/429 或机器人检测时，立即按比例降低并发
+
+另有分片并发自动调优（FragmentTuner）：根据实测吞吐逐级提高分片并发，
+直到吞吐不再明显增长（链路已饱和），结果持久化供后续运行使用。
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# 被视为限流信号的错误特征
+THROTTLE_MARKERS = (
+    'HTTP Error 403',
+    'HTTP Error 429',
+    '403: Forbidden',
+    '429: Too Many Requests',
+    "Sign in to confirm you're not a bot",
+    '确认你不是机器人',
+)
+
+# 只包含状态码的错误信息（HTTP 403、status code 429、ffmpeg 的 Server returned 403 Forbidden 等），
+# 要求状态码紧跟在 HTTP/status 之后或后接原因短语，避免把视频ID、文件大小等数字误判为限流
+THROTTLE_STATUS_RE = re.compile(
+    r'(?:\bHTTP(?:/[\d.]+)?(?: Error)?|\bstatus(?:[ _]code)?|\bServer returned)\s*[:=]?\s*(?:403|429)\b'
+    r'|\b(?:403|429):?\s+(?:Forbidden|Too Many Requests)',
+    re.IGNORECASE,
+)
+
+def get_host(url):
+    """从URL中提取主机名，去掉 www./m. 前缀以便同一站点共享状态"""
+    host = (urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host or 'unknown'
+
+def classify_error(error_str):
+    """
+    判断错误类型
+    返回:
+      'throttle': 限流/封禁类错误（403、429、机器人检测），需要降低并发
+      'error':    其他错误，只计入错误率
+    """
+    if any(marker in error_str for marker in THROTTLE_MARKERS):
+        return 'throttle'
+    # yt-dlp、aria2c、ffmpeg 的部分错误信息只包含状态码
+    if THROTTLE_STATUS_RE.search(error_str):
+        return 'throttle'
+    return 'error'
+
+class HostState:
+    """单个主机的并发状态"""
+
+    def __init__(self, downloads, fragments, window):
+        self.download_limit = downloads
+        self.fragment_limit = fragments
+        self.active = 0
+        self.successes = 0
+        self.errors = 0
+        self.throttles = 0
+        self.streak = 0
+        self.last_cut = 0.0
+        self.recent = deque(maxlen=window)  # True 表示失败
+
+    def error_rate(self):
+        if not self.recent:
+            return 0.0
+        return sum(self.recent) / len(self.recent)
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD并发控制器（线程安全）
+
+    参数:
+      min_downloads/max_downloads/initial_downloads: 每个主机的并发下载数范围与初始值
+      min_fragments/max_fragments/initial_fragments: 每个下载的分片并发数范围与初始值
+      increase_every: 连续成功多少次后加一档
+      decrease_factor: 限流时的乘性减少系数
+      error_threshold: 最近窗口内错误率超过该值时不再增加并发
+      window: 统计错误率的最近结果个数
+      cooldown: 两次降低之间的最短间隔（秒），避免同一波并发失败被重复惩罚
+    """
+
+    def __init__(self, min_downloads=1, max_downloads=8, initial_downloads=2,
+                 min_fragments=1, max_fragments=16, initial_fragments=4,
+                 increase_every=3, decrease_factor=0.5, error_threshold=0.1,
+                 window=20, cooldown=10.0):
+        self.min_downloads = min_downloads
+        self.max_downloads = max(min_downloads, max_downloads)
+        self.initial_downloads = min(max(initial_downloads, min_downloads), self.max_downloads)
+        self.min_fragments = min_fragments
+        self.max_fragments = max(min_fragments, max_fragments)
+        self.initial_fragments = min(max(initial_fragments, min_fragments), self.max_fragments)
+        self.increase_every = increase_every
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self._hosts = {}
+        self._cond = threading.Condition()
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = HostState(self.initial_downloads, self.initial_fragments, self.window)
+            self._hosts[host] = state
+        return state
+
+    @contextmanager
+    def slot(self, host):
+        """占用一个下载名额，超过当前并发上限时阻塞等待"""
+        with self._cond:
+            state = self._state(host)
+            while state.active >= state.download_limit:
+                self._cond.wait()
+            state.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                state.active -= 1
+                self._cond.notify_all()
+
+    def fragment_limit(self, host):
+        """当前主机建议的分片并发数"""
+        with self._cond:
+            return self._state(host).fragment_limit
+
+    def record_success(self, host):
+        """记录一次成功，满足条件时加性增加并发"""
+        with self._cond:
+            state = self._state(host)
+            state.successes += 1
+            state.streak += 1
+            state.recent.append(False)
+            if state.streak >= self.increase_every and state.error_rate() <= self.error_threshold:
+                state.streak = 0
+                state.download_limit = min(self.max_downloads, state.download_limit + 1)
+                state.fragment_limit = min(self.max_fragments, state.fragment_limit + 1)
+                self._cond.notify_all()
+
+    def record_error(self, host, kind='error'):
+        """
+        记录一次失败
+        kind 为 'throttle' 时乘性降低并发下载数和分片并发数
+        """
+        with self._cond:
+            state = self._state(host)
+            state.errors += 1
+            state.streak = 0
+            state.recent.append(True)
+            if kind != 'throttle':
+                return
+            state.throttles += 1
+            now = time.monotonic()
+            if now - state.last_cut < self.cooldown:
+                return
+            state.last_cut = now
+            state.download_limit = max(self.min_downloads, int(state.download_limit * self.decrease_factor))
+            state.fragment_limit = max(self.min_fragments, int(state.fragment_limit * self.decrease_factor))
+
+    def metrics(self):
+        """返回各主机当前的并发上限与统计信息"""
+        with self._cond:
+            return {
+                host: {
+                    'download_limit': state.download_limit,
+                    'fragment_limit': state.fragment_limit,
+                    'active': state.active,
+                    'successes': state.successes,
+                    'errors': state.errors,
+                    'throttles': state.throttles,
+                    'error_rate': round(state.error_rate(), 3),
+                }
+                for host, state in self._hosts.items()
+            }
+
+class TaskFeedback:
+    """
+    单个下载任务对控制器的反馈，保证一个任务在错误率窗口中只计一次结果:
+    - 第一次限流错误立即转发（尽快降低并发），之后的重试不再计入
+    - 其他错误先记下，任务最终失败时由 finish() 计入一次；重试后成功则只计成功
+    其余属性（slot、fragment_limit 等）直接转发给控制器
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.reported = False
+        self._pending = None  # (host, kind)
+
+    def __getattr__(self, name):
+        return getattr(self.controller, name)
+
+    def record_success(self, host):
+        if not self.reported:
+            self.reported = True
+            self.controller.record_success(host)
+
+    def record_error(self, host, kind='error'):
+        if self.reported:
+            return
+        if kind == 'throttle':
+            self.reported = True
+            self.controller.record_error(host, kind)
+        else:
+            self._pending = (host, kind)
+
+    def finish(self):
+        """任务结束（失败）时计入尚未转发的错误"""
+        if not self.reported and self._pending is not None:
+            self.reported = True
+            self.controller.record_error(*self._pending)
+
+class FragmentTuner:
+    """
+    分片并发数自动调优（线程安全）
+
+    对每个主机从 initial 开始逐级（翻倍）尝试更高的分片并发，
+    若吞吐提升超过 min_gain 则采用并继续尝试更高一级，否则认为链路已饱和。
+    每 reprobe_every 次下载重新尝试一次更高级别，以适应网络变化。
+
+    参数:
+      state_file: 调优结果保存路径（JSON），为None时不持久化
+    """
+
+    def __init__(self, min_fragments=1, max_fragments=16, initial=4, min_gain=0.1,
+                 reprobe_every=10, alpha=0.5, state_file=None):
+        self.levels = []
+        level = max(1, min_fragments)
+        while level < max_fragments:
+            self.levels.append(level)
+            level *= 2
+        self.levels.append(max(max_fragments, min_fragments))
+        self.initial = min(self.levels, key=lambda lv: abs(lv - initial))
+        self.min_gain = min_gain
+        self.reprobe_every = reprobe_every
+        self.alpha = alpha
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._hosts = self._load()
+
+    def _load(self):
+        if not self.state_file:
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # JSON 的键都是字符串，还原为整数级别
+        for state in data.values():
+            state['throughput'] = {int(k): v for k, v in state.get('throughput', {}).items()}
+            state['trying'] = None
+        return data
+
+    def _save(self):
+        if not self.state_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._hosts, f, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            print(f"警告: 保存分片调优结果失败: {e}")
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None or state.get('best') not in self.levels:
+            state = {'best': self.initial, 'trying': None, 'runs': 0, 'throughput': {}}
+            self._hosts[host] = state
+        return state
+
+    def _next_level(self, level):
+        higher = [lv for lv in self.levels if lv > level]
+        return higher[0] if higher else None
+
+    def suggest(self, host):
+        """下一次下载应使用的分片并发数"""
+        with self._lock:
+            state = self._state(host)
+            return state['trying'] or state['best']
+
+    def observe(self, host, level, nbytes, seconds):
+        """记录一次分片下载的实测结果（总字节数与耗时），并决定下一次尝试的级别"""
+        if not nbytes or not seconds or level not in self.levels:
+            return
+        with self._lock:
+            state = self._state(host)
+            throughput = nbytes / seconds
+            old = state['throughput'].get(level)
+            state['throughput'][level] = throughput if old is None else self.alpha * throughput + (1 - self.alpha) * old
+            state['runs'] += 1
+
+            best_tp = state['throughput'].get(state['best'])
+            if level != state['best'] and level == state['trying']:
+                if best_tp is None or state['throughput'][level] > best_tp * (1 + self.min_gain):
+                    state['best'] = level
+                    state['trying'] = self._next_level(level)
+                else:
+                    # 吞吐没有明显提升，链路已饱和
+                    state['trying'] = None
+            elif level == state['best']:
+                next_level = self._next_level(level)
+                untried = next_level is not None and next_level not in state['throughput']
+                if next_level is not None and (untried or state['runs'] % self.reprobe_every == 0):
+                    state['trying'] = next_level
+            self._save()
+
+    def metrics(self):
+        """各主机当前采用的分片并发数以及各级别实测吞吐（字节/秒）"""
+        with self._lock:
+            return {
+                host: {
+                    'best': state['best'],
+                    'trying': state['trying'],
+                    'runs': state['runs'],
+                    'throughput': {level: round(tp) for level, tp in sorted(state['throughput'].items())},
+                    'per_fragment_throughput': {
+                        level: round(tp / level) for level, tp in sorted(state['throughput'].items())
+                    },
+                }
+                for host, state in self._hosts.items()
+            }
@@ -0,0 +1,46 @@
+"""
+配置文件读取
+video_cli.py 与 convert.py 共用同一个配置文件：按 CONFIG_PATHS 的顺序查找，使用第一个能读取的非空文件。
+"""
+import os
+import sys
+
+CONFIG_PATHS = [
+    './config.yaml',
+    './config.yml',
+    '~/.videodownloader/config.yaml',
+    '~/.videodownloader/config.yml',
+]
+
+def deep_update(target, source):
+    """把 source 深度合并进 target（两边都是字典的键递归合并，其余直接覆盖）"""
+    for key, value in source.items():
+        if key in target and isinstance(target[key], dict) and isinstance(value, dict):
+            deep_update(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+def read_config_file():
+    """
+    读取用户配置文件（需要 PyYAML）
+    返回: (文件路径, 配置字典)，没有可用的配置文件时返回 (None, {})
+    """
+    for path in CONFIG_PATHS:
+        expanded_path = os.path.expanduser(path)
+        if not os.path.exists(expanded_path):
+            continue
+        try:
+            import yaml
+            with open(expanded_path, 'r', encoding='utf-8') as f:
+                user_config = yaml.safe_load(f)
+        except ImportError:
+            print(f"注意: 未安装PyYAML，无法读取配置文件 {expanded_path}", file=sys.stderr)
+            print("安装命令: pip install pyyaml", file=sys.stderr)
+            continue
+        except Exception as e:
+            print(f"警告: 读取配置文件失败 {expanded_path}: {e}", file=sys.stderr)
+            continue
+        if isinstance(user_config, dict) and user_config:
+            return expanded_path, user_config
+    return None, {}
@@ -1,9 +1,20 @@
 import os
 import sys
 import argparse
+import contextlib
+import json
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from pydub import AudioSegment
-from tqdm import tqdm
+from functools import partial
+import audio_analysis
+import batch_convert
+import encoding_profiles
+import parallel_transcode
+from convert_cache import ConvertCache, hash_input
+from ffmpeg_runner import FFmpegError, ProgressTelemetry, run_ffmpeg
+from media_probe import MediaProbeError, ffmpeg_audio_stream, first_stream, probe_media
 
 # Optional GUI imports
 GUI_AVAILABLE = False
@@ -14,67 +25,116 @@ try:
 except ImportError:
     pass
 
-def show_video_info(video):
-    """显示视频文件信息"""
+def show_video_info(info, input_file):
+    """显示视频文件信息
+    :param info: probe_media 返回的容器和流信息（只读文件头，不解码）
+    :param input_file: 文件路径
+    """
+    video = first_stream(info, 'video')
+    audio = first_stream(info, 'audio')
+    duration = info.get('duration') or video.get('duration') or 0
+    width, height = video.get('width'), video.get('height')
+    bit_rate = video.get('bit_rate') or info.get('bit_rate')
     print("\n视频文件信息：")
-    print(f"- 文件路径: {video.filename}" if hasattr(video, 'filename') else "- 文件路径: 未知")
-    print(f"- 创建时间: {datetime.fromtimestamp(os.path.getctime(video.filename)).strftime('%Y-%m-%d %H:%M:%S')}" if hasattr(video, 'filename') else "- 创建时间: 未知")
-    print(f"- 修改时间: {datetime.fromtimestamp(os.path.getmtime(video.filename)).strftime('%Y-%m-%d %H:%M:%S')}" if hasattr(video, 'filename') else "- 修改时间: 未知")
-    print(f"- 时长: {video.duration:.2f} 秒（{video.duration/60:.0f}分钟）")
-    print(f"- 分辨率: {video.size[0]}x{video.size[1]}（{'Full HD' if video.size[0] == 1920 and video.size[1] == 1080 else '其他'}）")
-    print(f"- 宽高比: {video.size[0]/video.size[1]:.2f}:1")
-    print(f"- 帧率: {video.fps} fps")
-    print(f"- 视频编码格式: {video.codec if hasattr(video, 'codec') else '未知'}")
-    print(f"- 比特率: {video.bitrate if hasattr(video, 'bitrate') else '未知'} kbps")
-    print(f"- 文件大小: {os.path.getsize(video.filename)/1000000:.1f} MB" if hasattr(video, 'filename') else "- 文件大小: 未知")
-    print(f"- 音频: {'有' if video.audio else '无'}")
-    if video.audio:
-        print(f"- 音频编码格式: {video.audio.codec if hasattr(video.audio, 'codec') else '未知'}")
-        print(f"- 音频比特率: {video.audio.bitrate if hasattr(video.audio, 'bitrate') else '未知'} kbps")
-        print(f"- 音频采样率: {video.audio.fps if hasattr(video.audio, 'fps') else '未知'} Hz")
-        print(f"- 音频通道布局: {video.audio.nchannels if hasattr(video.audio, 'nchannels') else '未知'} 声道")
-
-def convert_video(input_file, output_file, speed=1.0):
+    print(f"- 文件路径: {input_file}")
+    print(f"- 创建时间: {datetime.fromtimestamp(os.path.getctime(input_file)).strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"- 修改时间: {datetime.fromtimestamp(os.path.getmtime(input_file)).strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"- 时长: {duration:.2f} 秒（{duration/60:.0f}分钟）")
+    if width and height:
+        print(f"- 分辨率: {width}x{height}（{'Full HD' if width == 1920 and height == 1080 else '其他'}）")
+        print(f"- 宽高比: {width/height:.2f}:1")
+    else:
+        print("- 分辨率: 未知")
+    print(f"- 帧率: {video.get('frame_rate') or '未知'} fps")
+    print(f"- 视频编码格式: {video.get('codec_name') or '未知'}")
+    print(f"- 比特率: {bit_rate / 1000:.0f} kbps" if bit_rate else "- 比特率: 未知")
+    print(f"- 文件大小: {os.path.getsize(input_file)/1000000:.1f} MB")
+    print(f"- 音频: {'有' if audio else '无'}")
+    if audio:
+        print(f"- 音频编码格式: {audio.get('codec_name') or '未知'}")
+        print(f"- 音频比特率: {audio['bit_rate'] / 1000:.0f} kbps" if audio.get('bit_rate') else "- 音频比特率: 未知")
+        print(f"- 音频采样率: {audio.get('sample_rate') or '未知'} Hz")
+        print(f"- 音频通道布局: {audio.get('channels') or '未知'} 声道")
+
+# 转换方式的显示名称
+CONVERT_METHOD_NAMES = {
+    'remux': '无损封装转换（直接复制音视频流，未重新编码）',
+    'parallel': '分段并行重新编码',
+    'encode': '重新编码',
+    'audio': '音频转换',
+}
+
+def transcode_video(input_file, output_file, speed=1.0, preserve_pitch=True, show_progress=True, jobs=None,
+                    allow_remux=True, telemetry=None, profile=None):
+    """
+    转换视频，失败时抛出异常
+    源编码与目标容器兼容且不变速时只做封装转换；需要重新编码时，
+    长视频按关键帧分段、由多个 ffmpeg 进程并行编码（见 parallel_transcode），音轨只编码一次
+    jobs: 并行编码进程数，默认等于CPU核数
+    allow_remux: False 时总是重新编码
+    telemetry: ProgressTelemetry，输出 NDJSON 进度事件
+    profile: 编码配置（见 encoding_profiles），为None时按输出容器使用默认编码参数
+    返回: 实际采用的方式（CONVERT_METHOD_NAMES 的键）
+    """
+    info = probe_file(input_file)
+    stream = first_stream(info, 'audio')
+    filters = audio_filters(speed, stream.get('sample_rate'), preserve_pitch, input_file)
+    return parallel_transcode.transcode(input_file, output_file, speed, jobs=jobs, audio_filters=filters,
+                                        show_progress=show_progress, info=info, allow_remux=allow_remux,
+                                        telemetry=telemetry, profile=profile)
+
+def convert_video(input_file, output_file, speed=1.0, preserve_pitch=True, jobs=None, allow_remux=True,
+                  telemetry=None, profile=None):
     try:
-        from moviepy.editor import VideoFileClip
-        video = VideoFileClip(input_file)
-        show_video_info(video)
-        
-        if speed != 1.0:
-            video = video.speedx(speed)
-        video.write_videofile(output_file, codec='libx264')
-        
-        # 显示输出文件信息
-        output_video = VideoFileClip(output_file)
-        show_video_info(output_video)
-        output_video.close()
-        
-        return f"Success: Video converted to {output_file} (speed: {speed}x)"
-    except ImportError:
-        return "Error: moviepy not installed. Please install it with: pip install moviepy"
+        info = probe_file(input_file)
+        if info:
+            show_video_info(info, input_file)
+
+        start = time.monotonic()
+        method = transcode_video(input_file, output_file, speed, preserve_pitch, jobs=jobs, allow_remux=allow_remux,
+                                 telemetry=telemetry, profile=profile)
+        elapsed = time.monotonic() - start
+        print(f"\n转换方式: {CONVERT_METHOD_NAMES[method]}" +
+              (f"（编码配置: {profile['name']}）" if profile and method != 'remux' else ""))
+        if info and info.get('duration') and elapsed > 0:
+            print(f"处理速度: {info['duration'] / speed / elapsed:.1f}x 实时（用时 {elapsed:.1f} 秒）")
+
+        # 显示输出文件信息（只读文件头）
+        output_info = probe_file(output_file)
+        if output_info:
+            show_video_info(output_info, output_file)
+
+        return f"Success: Video converted to {output_file} (speed: {speed}x, {method})"
     except Exception as e:
         return f"Error converting video: {str(e)}"
 
-def show_audio_info(audio, input_file=None):
+def show_audio_info(info, input_file=None):
     """显示音频文件信息
-    :param audio: AudioSegment对象
+    :param info: probe_media 返回的容器和流信息（只读文件头，不解码）
     :param input_file: 输入文件路径
     """
+    stream = first_stream(info, 'audio')
+    duration = info.get('duration') or stream.get('duration') or 0
+    sample_rate = stream.get('sample_rate')
+    bit_rate = stream.get('bit_rate') or info.get('bit_rate')
     print("\n音频文件信息：")
-    print(f"- 时长: {len(audio)/1000:.2f} 秒（{len(audio)/60000:.1f}分钟）")
-    print(f"- 采样率: {audio.frame_rate} Hz")
-    print(f"- 声道数: {audio.channels}")
-    print(f"- 位深: {audio.sample_width * 8} bit")
-    print(f"- 比特率: {audio.frame_rate * audio.channels * audio.sample_width * 8 / 1000:.1f} kbps")
+    print(f"- 时长: {duration:.2f} 秒（{duration/60:.1f}分钟）")
+    print(f"- 采样率: {sample_rate or '未知'} Hz")
+    print(f"- 声道数: {stream.get('channels') or '未知'}")
+    print(f"- 比特率: {bit_rate / 1000:.1f} kbps" if bit_rate else "- 比特率: 未知")
     print(f"- 文件大小: {os.path.getsize(input_file)/1000000:.1f} MB" if input_file else "- 文件大小: 未知")
-    print(f"- 音频质量: {'CD级' if audio.frame_rate >= 44100 and audio.sample_width >= 2 else '普通'}")
-    # 从文件扩展名获取编码格式
+    print(f"- 音频质量: {'CD级' if (sample_rate or 0) >= 44100 else '普通'}")
+    print(f"- 编码格式: {(stream.get('codec_name') or '未知').upper()}")
     if input_file:
         ext = os.path.splitext(input_file)[1][1:].lower()
-        print(f"- 编码格式: {ext.upper()}")
-        print(f"- 压缩比: {'有损' if ext in ('mp3', 'aac', 'm4a') else '无损'}")
-    print(f"- 峰值电平: {audio.max:.1f} dBFS")
-    print(f"- 平均电平: {audio.rms:.1f} dBFS")
+        print(f"- 压缩比: {'有损' if ext in ('mp3', 'aac', 'm4a', 'ogg') else '无损'}")
+
+def probe_file(path):
+    """读取媒体文件信息（缓存），ffprobe 不可用时返回None（只影响信息显示和进度百分比）"""
+    try:
+        return probe_media(path)
+    except MediaProbeError:
+        return None
 
 # 音频格式到ffmpeg格式的映射
 AUDIO_FORMAT_MAPPING = {
@@ -86,41 +146,158 @@ AUDIO_FORMAT_MAPPING = {
     'aac': 'adts'  # aac in adts container
 }
 
-def convert_audio(input_file, output_file, speed=1.0):
+# 输出格式使用的编码器
+AUDIO_CODEC_MAPPING = {
+    'm4a': ['-c:a', 'aac', '-b:a', '192k'],
+    'mp3': ['-c:a', 'libmp3lame', '-q:a', '2'],
+    'wav': ['-c:a', 'pcm_s16le'],
+    'ogg': ['-c:a', 'libvorbis', '-q:a', '5'],
+    'flac': ['-c:a', 'flac'],
+    'aac': ['-c:a', 'aac', '-b:a', '192k'],
+}
+
+# 单个 atempo 滤镜的质量最佳区间，超出范围的倍速拆成多级串联
+ATEMPO_MIN = 0.5
+ATEMPO_MAX = 2.0
+
+def atempo_chain(speed):
+    """
+    把任意倍速拆成若干个 [0.5, 2.0] 区间内的 atempo 系数，乘积等于 speed
+    例如 3.0 -> [2.0, 1.5]，0.2 -> [0.5, 0.5, 0.8]
+    """
+    if speed <= 0:
+        raise ValueError("速度必须大于0")
+    factors = []
+    while speed > ATEMPO_MAX:
+        factors.append(ATEMPO_MAX)
+        speed /= ATEMPO_MAX
+    while speed < ATEMPO_MIN:
+        factors.append(ATEMPO_MIN)
+        speed /= ATEMPO_MIN
+    if abs(speed - 1.0) > 1e-9 or not factors:
+        factors.append(speed)
+    return factors
+
+def audio_filters(speed, sample_rate, preserve_pitch=True, input_file=None):
+    """
+    速度调整滤镜
+    preserve_pitch=True: atempo 时间伸缩，音调不变（适合讲座、播客）
+    preserve_pitch=False: 按比例改变采样率再重采样回原采样率，音调随速度变化（"变调"效果）
+    变调变速需要准确的原采样率（猜错时音调和时长都会偏差）：sample_rate 未知时从 input_file
+    的 ffmpeg 流信息读取，仍无法确定时抛出 ValueError；输入没有音轨时不需要滤镜
+    """
+    if speed == 1.0:
+        return []
+    if preserve_pitch:
+        return [f"atempo={factor:.6g}" for factor in atempo_chain(speed)]
+    if not sample_rate and input_file:
+        try:
+            stream = ffmpeg_audio_stream(input_file)
+        except MediaProbeError:
+            stream = None
+        if stream == {}:
+            return []
+        sample_rate = (stream or {}).get('sample_rate')
+    if not sample_rate:
+        raise ValueError("无法确定输入音频的采样率，不能做变调变速（可改用保持音调的变速）")
+    return [f"asetrate={round(sample_rate * speed)}", f"aresample={sample_rate}"]
+
+def transcode_audio(input_file, output_file, speed=1.0, preserve_pitch=True, show_progress=True, info=None,
+                    telemetry=None):
+    """
+    流式转换音频：解码、速度调整和编码在同一个 ffmpeg 进程中按块完成，
+    内存占用与音频时长无关（不再把整个文件解码成 PCM 放进内存）
+    preserve_pitch: 变速时保持音调，False 时使用重采样变速（音调随之升降）
+    info: 已读取的输入文件信息（可选，省去一次 ffprobe）
+    telemetry: ProgressTelemetry，输出 NDJSON 进度事件
+    返回: run_ffmpeg 的统计（耗时、实时倍数），失败时抛出 FFmpegError
+    """
+    info = info or probe_file(input_file) or {}
+    stream = first_stream(info, 'audio')
+    duration = info.get('duration')
+
+    output_format = os.path.splitext(output_file)[1][1:].lower()  # Get format from extension
+    ffmpeg_format = AUDIO_FORMAT_MAPPING.get(output_format, output_format)
+    args = ['-y', '-v', 'error', '-i', input_file, '-map', '0:a:0', '-vn']
+    filters = audio_filters(speed, stream.get('sample_rate'), preserve_pitch, input_file)
+    if filters:
+        args += ['-af', ','.join(filters)]
+    args += AUDIO_CODEC_MAPPING.get(output_format, []) + ['-f', ffmpeg_format, output_file]
+    return run_ffmpeg(args, duration=duration / speed if duration else None, show_progress=show_progress,
+                      telemetry=telemetry, label=os.path.basename(input_file))
+
+def convert_audio(input_file, output_file, speed=1.0, preserve_pitch=True, telemetry=None):
     try:
-        # 显示加载进度
-        print("\n加载音频文件中...")
-        with tqdm(total=100, desc="加载进度", unit="%") as pbar:
-            audio = AudioSegment.from_file(input_file)
-            pbar.update(100)
-            show_audio_info(audio, input_file)
-        
-        if speed != 1.0:
-            # 显示速度调整进度
-            print("\n调整音频速度中...")
-            with tqdm(total=100, desc="速度调整", unit="%") as pbar:
-                new_frame_rate = int(audio.frame_rate * speed)
-                audio = audio._spawn(audio.raw_data, overrides={
-                    'frame_rate': new_frame_rate
-                }).set_frame_rate(audio.frame_rate)
-                pbar.update(100)
-        
-        # 显示导出进度
-        print("\n导出音频文件中...")
-        output_format = os.path.splitext(output_file)[1][1:]  # Get format from extension
-        ffmpeg_format = AUDIO_FORMAT_MAPPING.get(output_format.lower(), output_format)
-        with tqdm(total=100, desc="导出进度", unit="%") as pbar:
-            audio.export(output_file, format=ffmpeg_format)
-            pbar.update(100)
-        
-        # 显示输出文件信息
-        output_audio = AudioSegment.from_file(output_file)
-        show_audio_info(output_audio, output_file)
-        
+        info = probe_file(input_file)
+        if info:
+            show_audio_info(info, input_file)
+
+        print("\n转换音频文件中...")
+        stats = transcode_audio(input_file, output_file, speed, preserve_pitch, info=info, telemetry=telemetry)
+        if stats['realtime']:
+            print(f"处理速度: {stats['realtime']:.1f}x 实时（用时 {stats['elapsed']:.1f} 秒）")
+
+        # 显示输出文件信息（只读文件头）
+        output_info = probe_file(output_file)
+        if output_info:
+            show_audio_info(output_info, output_file)
+
         return f"\nSuccess: Audio converted to {output_file} (speed: {speed}x)"
     except Exception as e:
         return f"Error converting audio: {str(e)}"
 
+def convert_file(input_file, output_file, speed=1.0, preserve_pitch=True, jobs=1, allow_remux=True,
+                 progress_json=None, profile=None):
+    """
+    无界面转换单个文件（批量转换的工作函数，在子进程中运行）
+    按输出扩展名选择音频或视频转换；视频转音频格式时提取音轨。
+    先写入临时文件再改名，中断时不会留下被误认为"已是最新"的半成品。
+    progress_json: NDJSON 进度事件的输出文件（'-' 为标准输出），各工作进程追加写入同一文件
+    返回: 转换方式（'audio' 或 CONVERT_METHOD_NAMES 的键），失败时抛出异常
+    """
+    # 临时文件名唯一（隐藏文件，保留扩展名供 ffmpeg 识别容器），并发任务不会写到同一个文件
+    base, ext = os.path.splitext(os.path.basename(output_file))
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{base}.", suffix=f".part{ext}",
+                                    dir=os.path.dirname(os.path.abspath(output_file)))
+    os.close(fd)
+    telemetry = ProgressTelemetry(progress_json) if progress_json else None
+    try:
+        if get_file_type(output_file) == 'audio':
+            transcode_audio(input_file, tmp_file, speed, preserve_pitch, show_progress=False, telemetry=telemetry)
+            method = 'audio'
+        else:
+            method = transcode_video(input_file, tmp_file, speed, preserve_pitch, show_progress=False, jobs=jobs,
+                                     allow_remux=allow_remux, telemetry=telemetry, profile=profile)
+        os.replace(tmp_file, output_file)
+        return method
+    finally:
+        if telemetry:
+            telemetry.close()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def conversion_params(output_file, speed=1.0, preserve_pitch=True, allow_remux=True, profile=None):
+    """影响输出内容的全部转换参数（增量转换缓存按其摘要判断输出是否需要重建）"""
+    params = {'format': os.path.splitext(output_file)[1][1:].lower(), 'speed': speed}
+    if speed != 1.0:
+        params['preserve_pitch'] = preserve_pitch
+    if get_file_type(output_file) != 'audio':
+        # 编码配置按完整内容参与比较，config.yaml 中修改配置后同名配置的输出也会重建
+        params.update(allow_remux=allow_remux, profile=profile)
+    return params
+
+def convert_cached(convert, input_file, output_file, params, cache=None, force=False):
+    """
+    交互模式的转换：输出仍然有效（输入、参数和输出都未变化）时跳过，成功后登记到缓存
+    convert: 无参数的转换函数，返回结果说明
+    """
+    if cache and not force and cache.check(input_file, output_file, params) is None:
+        return f"跳过: {output_file} 已是最新（输入和转换参数均未变化，使用 --force 重新转换）"
+    result = convert()
+    if cache and not result.startswith('Error'):
+        cache.record(input_file, output_file, params, hash_input(input_file) if cache.use_hash else None)
+    return result
+
 def get_file_type(file_path):
     if file_path.lower().endswith(('.mp3', '.wav', '.flac', '.ogg', '.m4a', '.aac')):
         return 'audio'
@@ -157,7 +334,8 @@ def select_input_file(file_type):
     print(f"选择的文件: {file_path}")
     return file_path
 
-def command_line_mode():
+def command_line_mode(preserve_pitch=True, jobs=None, allow_remux=True, telemetry=None, profile=None, cache=None,
+                      force=False):
     if not GUI_AVAILABLE:
         print("错误：需要Tkinter支持以使用文件选择对话框")
         print("请安装Tkinter或使用图形界面模式")
@@ -217,21 +395,25 @@ def command_line_mode():
         base_name += f"_{speed}x"
     output_file = base_name + '.' + output_format
     file_type = get_file_type(input_file)
+    params = conversion_params(output_file, speed, preserve_pitch, allow_remux, profile)
     
     if file_type == 'audio':
-        result = convert_audio(input_file, output_file, speed)
+        result = convert_cached(lambda: convert_audio(input_file, output_file, speed, preserve_pitch, telemetry),
+                                input_file, output_file, params, cache, force)
     elif file_type == 'video':
-        result = convert_video(input_file, output_file, speed)
+        result = convert_cached(lambda: convert_video(input_file, output_file, speed, preserve_pitch, jobs,
+                                                      allow_remux, telemetry, profile),
+                                input_file, output_file, params, cache, force)
     else:
         print("不支持的文件类型")
         return
     
     print(result)
 
-def gui_mode():
+def gui_mode(preserve_pitch=True, jobs=None, allow_remux=True, telemetry=None, profile=None, cache=None, force=False):
     if not GUI_AVAILABLE:
         print("GUI模式不可用，请安装Tkinter或使用命令行模式")
-        return command_line_mode()
+        return command_line_mode(preserve_pitch, jobs, allow_remux, telemetry, profile, cache, force)
         
     root = tk.Tk()
     root.withdraw()
@@ -271,30 +453,225 @@ def gui_mode():
     if speed != 1.0:
         base_name += f"_{speed}x"
     output_file = base_name + '.' + output_format
+    params = conversion_params(output_file, speed, preserve_pitch, allow_remux, profile)
     
     try:
         if file_type == 'audio':
-            result = convert_audio(file_path, output_file, speed)
+            result = convert_cached(lambda: convert_audio(file_path, output_file, speed, preserve_pitch, telemetry),
+                                    file_path, output_file, params, cache, force)
         else:
-            result = convert_video(file_path, output_file, speed)
+            result = convert_cached(lambda: convert_video(file_path, output_file, speed, preserve_pitch, jobs,
+                                                          allow_remux, telemetry, profile),
+                                    file_path, output_file, params, cache, force)
         messagebox.showinfo("结果", result)
     except Exception as e:
         messagebox.showerror("错误", f"转换失败: {str(e)}")
 
+def batch_command(argv):
+    """
+    批量转换子命令: convert.py batch <目录|通配符>... --to m4a [--speed 1.5] [--jobs N]
+    无界面运行，适合定时任务
+    """
+    parser = argparse.ArgumentParser(prog='convert.py batch', description='批量转换目录或通配符匹配的媒体文件')
+    parser.add_argument('targets', nargs='+', help='输入目录（递归遍历）、文件或通配符（如 "download/**/*.webm"）')
+    parser.add_argument('--to', required=True, choices=get_output_format('audio') + get_output_format('video'),
+                        help='输出格式；音频格式也可用于从视频中提取音轨')
+    parser.add_argument('--speed', type=float, default=1.0, help='播放速度（默认: 1.0）')
+    parser.add_argument('--pitch-shift', action='store_true', help='变速时音调随速度变化（默认保持音调）')
+    parser.add_argument('-o', '--output', help='输出目录（保留子目录结构，默认与源文件同目录）')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help=f'并行转换进程数（默认: CPU核数 {os.cpu_count() or 1}）')
+    parser.add_argument('--force', action='store_true', help='即使输出已是最新也重新转换')
+    parser.add_argument('--hash', action='store_true',
+                        help='输入文件修改时间变化时再比较内容摘要，内容相同则不重新转换（摘要在转换进程中顺带计算）')
+    parser.add_argument('--reencode', action='store_true', help='视频总是重新编码（默认编码兼容时只做无损封装转换）')
+    parser.add_argument('--report', help='汇总报告路径（默认: 输出目录或当前目录下的 convert_report_时间.json）')
+    parser.add_argument('--progress-json', metavar='PATH',
+                        help="把进度事件（百分比、剩余时间、实时倍数、码率）以NDJSON写入文件，'-' 表示标准输出")
+    parser.add_argument('--profile', help="视频编码配置（如 fast-preview、archive、small-mobile，见 config.yaml）")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error('速度必须大于0')
+    profile = select_profile(parser, args.profile)
+
+    # NDJSON 输出到标准输出时，其余提示信息改走 stderr，保证标准输出可直接被程序解析
+    with contextlib.redirect_stdout(sys.stderr if args.progress_json == '-' else sys.stdout):
+        allowed = ('audio', 'video') if get_file_type('x.' + args.to) == 'audio' else ('video',)
+        inputs = batch_convert.collect_inputs(args.targets, lambda path: get_file_type(path) in allowed)
+        # 增量转换缓存：输入、转换参数、ffmpeg 版本和输出都未变化的文件跳过
+        try:
+            cache = ConvertCache(use_hash=args.hash)
+        except FFmpegError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 1
+        params = conversion_params('x.' + args.to, args.speed, not args.pitch_shift, not args.reencode, profile)
+        tasks, skipped = batch_convert.plan_batch(inputs, args.to, args.speed, args.output, args.force, cache, params)
+        print(f"找到 {len(inputs)} 个文件：待转换 {len(tasks)}，跳过 {len(skipped)}")
+        for input_file, output_file, reason in skipped:
+            if reason == 'output collision':
+                print(f"警告: {input_file} 与其他输入对应同一个输出 {output_file}，已跳过")
+
+        start = time.monotonic()
+        # 文件间已经并行，单个视频的分段并行数按剩余核数分配
+        options = {'speed': args.speed, 'preserve_pitch': not args.pitch_shift,
+                   'jobs': max(1, (os.cpu_count() or 1) // max(1, args.jobs)), 'allow_remux': not args.reencode,
+                   'progress_json': os.path.abspath(args.progress_json) if args.progress_json not in (None, '-')
+                   else args.progress_json, 'profile': profile}
+
+        def record(result):
+            # 每完成一个就登记，中断时已完成的输出下次不会被重新转换，也不会按修改时间被误认
+            input_hash = result.pop('input_hash', None)
+            if result['status'] == 'converted':
+                cache.record(result['input'], result['output'], params, input_hash)
+
+        try:
+            results = batch_convert.run_batch(tasks, convert_file, options, jobs=args.jobs, hash_inputs=args.hash,
+                                              on_result=record) if tasks else []
+        finally:
+            cache.close()
+        report_path = args.report or os.path.join(args.output or os.getcwd(),
+                                                  f"convert_report_{datetime.now():%Y%m%d_%H%M%S}.json")
+        summary = batch_convert.write_report(report_path, results, skipped, time.monotonic() - start, {
+            'targets': args.targets, 'to': args.to, 'speed': args.speed, 'preserve_pitch': not args.pitch_shift,
+            'output': args.output, 'jobs': args.jobs, 'reencode': args.reencode, 'progress_json': args.progress_json,
+            'hash': args.hash,
+            'profile': profile['name'] if profile else None,
+        })
+        print(f"\n转换 {summary['converted']} 个，跳过 {summary['skipped']} 个，失败 {summary['failed']} 个，"
+              f"用时 {summary['elapsed_seconds']:.1f} 秒" +
+              (f"，整体 {summary['realtime']:.1f}x 实时" if summary['realtime'] else ""))
+        if summary['methods']:
+            print("转换方式: " + "，".join(f"{CONVERT_METHOD_NAMES.get(m, m)} {n}个" for m, n in summary['methods'].items()))
+        print(f"汇总报告: {report_path}")
+        return 1 if summary['failed'] else 0
+
+def select_profile(parser, name):
+    """按名称取编码配置；未指定时使用配置文件中的 convert.default_profile（也未设置时返回None）"""
+    profiles, default = encoding_profiles.load_profiles()
+    name = name or default
+    if name and name not in profiles:
+        parser.error(f"未知的编码配置: {name}（可用: {', '.join(profiles)}）")
+    return profiles[name] if name else None
+
+def bench_command(argv):
+    """
+    编码配置基准测试子命令: convert.py bench <输入视频> [--profiles a,b] [--seconds 30]
+    在本机依次用各配置编码同一段素材，报告编码帧率、实时倍数和输出大小
+    """
+    parser = argparse.ArgumentParser(prog='convert.py bench', description='在本机测试各编码配置的速度和输出大小')
+    parser.add_argument('input', help='测试用的视频文件')
+    parser.add_argument('--profiles', help='要测试的配置，逗号分隔（默认: 全部）')
+    parser.add_argument('--seconds', type=float, default=30, help='测试素材时长，取文件开头（默认: 30秒）')
+    parser.add_argument('--to', default='mp4', choices=get_output_format('video'), help='输出容器（默认: mp4）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    args = parser.parse_args(argv)
+
+    profiles, _ = encoding_profiles.load_profiles()
+    names = [n.strip() for n in args.profiles.split(',') if n.strip()] if args.profiles else list(profiles)
+    unknown = [n for n in names if n not in profiles]
+    if unknown:
+        parser.error(f"未知的编码配置: {', '.join(unknown)}（可用: {', '.join(profiles)}）")
+
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        print(f"测试素材: {args.input} 前 {args.seconds:g} 秒，CPU核数: {os.cpu_count()}")
+        results = encoding_profiles.bench(args.input, [profiles[n] for n in names], args.seconds, args.to,
+                                          show_progress=not args.json)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    # 中文表头每个字占两列宽，宽度按显示宽度对齐
+    print(f"\n{'配置':<14}{'编码帧率':>6}{'实时倍数':>8}{'输出大小':>10}{'码率':>11}  说明")
+    for r in results:
+        print(f"{r['profile']:<16}{r['fps'] or 0:>10.1f}{r['realtime'] or 0:>11.1f}x"
+              f"{r['size'] / 1000000:>12.2f}MB{r['bitrate_kbps']:>9.0f}kbps  "
+              f"{profiles[r['profile']].get('description', '')}")
+
+def analyze_command(argv):
+    """
+    音频电平分析子命令: convert.py analyze <目录|文件|通配符>... [--jobs N] [--json]
+    流式解码，一次读取得到峰值、真峰值、RMS、综合响度（LUFS）、削波采样数和静音比例，适合批量质检
+    """
+    parser = argparse.ArgumentParser(prog='convert.py analyze', description='分析音频的峰值、RMS、响度、削波和静音')
+    parser.add_argument('targets', nargs='+', help='输入目录（递归遍历）、文件或通配符；视频文件分析其音轨')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help=f'并行分析进程数（默认: CPU核数 {os.cpu_count() or 1}）')
+    parser.add_argument('--silence-threshold', type=float, default=audio_analysis.SILENCE_THRESHOLD,
+                        help=f'静音判定电平，100ms 片段 RMS 低于该值计为静音（默认: {audio_analysis.SILENCE_THRESHOLD:g} dBFS）')
+    parser.add_argument('--json', action='store_true', help='每个文件输出一行JSON（NDJSON）')
+    args = parser.parse_args(argv)
+
+    paths = [path for path, _ in batch_convert.collect_inputs(args.targets, lambda path: get_file_type(path) is not None)]
+    if not paths:
+        parser.error('没有找到音频或视频文件')
+    if not args.json:
+        print(f"{'峰值':>6}{'真峰值':>7}{'RMS':>8}{'响度':>7}{'削波':>6}{'静音':>5}  文件（dBFS / dBTP / dBFS / LUFS）")
+
+    def show(value, width):
+        # 无信号时分贝值为None
+        return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+
+    failed = 0
+    worker = partial(audio_analysis.analyze_file, silence_threshold=args.silence_threshold)
+    # 结果按输入顺序逐个输出，上千个文件时不必等全部完成
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        for result in executor.map(worker, paths):
+            failed += 'error' in result
+            if args.json:
+                print(json.dumps(result, ensure_ascii=False), flush=True)
+            elif 'error' in result:
+                print(f"{'失败':>48}  {result['file']}: {result['error']}")
+            else:
+                silence = result['silence_ratio']
+                print(f"{show(result['sample_peak_dbfs'], 8)}{show(result['true_peak_dbtp'], 10)}"
+                      f"{show(result['rms_dbfs'], 8)}{show(result['integrated_lufs'], 9)}{result['clipped_samples']:>8}"
+                      f"{f'{silence:.0%}' if silence is not None else '-':>7}  {result['file']}")
+    return 1 if failed else 0
+
 def main():
+    # 批量转换、编码配置基准测试、音频分析子命令
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        sys.exit(batch_command(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench_command(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'analyze':
+        sys.exit(analyze_command(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description="Convert media files between formats")
     parser.add_argument('--gui', action='store_true', help="使用图形界面模式")
+    parser.add_argument('--pitch-shift', action='store_true',
+                        help="音频变速时音调随速度变化（重采样变速），默认保持音调不变")
+    parser.add_argument('--jobs', type=int, help="视频分段并行编码的进程数（默认: CPU核数）")
+    parser.add_argument('--reencode', action='store_true', help="视频总是重新编码（默认编码兼容时只做无损封装转换）")
+    parser.add_argument('--progress-json', metavar='PATH',
+                        help="把进度事件（百分比、剩余时间、实时倍数、码率）以NDJSON写入文件，"
+                             "'-' 表示标准输出（此时菜单和提示改走 stderr）")
+    parser.add_argument('--profile', help="视频编码配置（如 fast-preview、archive、small-mobile，见 config.yaml）")
+    parser.add_argument('--force', action='store_true', help="即使输出已是最新（输入和转换参数均未变化）也重新转换")
     
     args = parser.parse_args()
+    profile = select_profile(parser, args.profile)
+    try:
+        cache = ConvertCache()
+    except FFmpegError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    telemetry = ProgressTelemetry(args.progress_json) if args.progress_json else None
     
-    if args.gui and not GUI_AVAILABLE:
-        print("警告：GUI模式不可用，将使用命令行模式")
-        print("要启用GUI模式，请确保Tkinter已正确安装")
-    
-    if args.gui and GUI_AVAILABLE:
-        gui_mode()
-    else:
-        command_line_mode()
+    # NDJSON 输出到标准输出时，菜单、提示和其余信息改走 stderr（input 的提示也随 sys.stdout 重定向），
+    # 标准输出只有进度事件，可直接被程序解析
+    with contextlib.redirect_stdout(sys.stderr if args.progress_json == '-' else sys.stdout):
+        if args.gui and not GUI_AVAILABLE:
+            print("警告：GUI模式不可用，将使用命令行模式")
+            print("要启用GUI模式，请确保Tkinter已正确安装")
+
+        if args.gui and GUI_AVAILABLE:
+            gui_mode(not args.pitch_shift, args.jobs, not args.reencode, telemetry, profile, cache, args.force)
+        else:
+            command_line_mode(not args.pitch_shift, args.jobs, not args.reencode, telemetry, profile, cache, args.force)
+    cache.close()
+    if telemetry:
+        telemetry.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+"""
+增量转换缓存（SQLite）
+每个转换成功的输出文件记录一行：输入文件的大小、修改时间（可选 SHA-256）、
+转换参数（格式、速度、音调、编码配置等）的摘要、ffmpeg 版本，以及输出文件自身的大小和修改时间。
+再次转换时，这些都没有变化的输出直接跳过；输入被修改、参数或工具版本变化、
+输出被删除或改动时重新转换（类似 make 的增量构建）。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from checksum import hash_file
+from ffmpeg_runner import ffmpeg_version
+
+DEFAULT_CACHE_DB = os.path.expanduser('~/.videodownloader/convert_cache.db')
+
+# 转换流程本身改变输出内容时加一，使旧记录全部失效
+CACHE_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversions (
+    output TEXT PRIMARY KEY,
+    input TEXT NOT NULL,
+    input_size INTEGER,
+    input_mtime_ns INTEGER,
+    input_sha256 TEXT,
+    params_hash TEXT,
+    params TEXT,
+    output_size INTEGER,
+    output_mtime_ns INTEGER,
+    converted_at REAL
+);
+"""
+
+def _fingerprint(path):
+    """(大小, 修改时间纳秒)，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def hash_input(path):
+    """
+    计算输入文件的 SHA-256 供 ConvertCache.record 使用（批量转换时在工作进程中调用，与转换一起并行）
+    返回: (sha256, 大小, 修改时间纳秒)，计算期间文件被修改或无法读取时返回None
+    """
+    before = _fingerprint(path)
+    try:
+        sha256 = hash_file(path)
+    except OSError:
+        return None
+    if before is None or _fingerprint(path) != before:
+        return None
+    return (sha256,) + before
+
+class ConvertCache:
+    """
+    增量转换缓存（多个进程可同时使用）
+
+    参数:
+      db_path: 数据库文件路径
+      use_hash: 输入文件修改时间变化但大小相同时，再比较内容的 SHA-256
+                （重新下载、复制得到的相同文件不必重新转换；摘要由调用方用 hash_input 计算后随登记传入）
+
+    创建时查询一次 ffmpeg 版本，ffmpeg 不可用时抛出 FFmpegError
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_DB, use_hash=False):
+        self.db_path = os.path.expanduser(db_path)
+        self.use_hash = use_hash
+        self.ffmpeg_version = ffmpeg_version()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        # 检查时的输入文件状态，登记时使用（转换期间输入被修改，下次会重新转换）
+        self._planned = {}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def params_hash(self, params):
+        """转换参数 + ffmpeg 版本 + 缓存版本的摘要"""
+        key = json.dumps({'params': params, 'ffmpeg': self.ffmpeg_version, 'version': CACHE_VERSION},
+                         sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def check(self, input_file, output_file, params):
+        """
+        判断输出是否仍然有效
+        返回: None 表示有效（可以跳过），否则为需要重新转换的原因:
+              'no record'、'output missing'、'output changed'、'input changed'、'parameters changed'
+        """
+        input_file, output_file = os.path.abspath(input_file), os.path.abspath(output_file)
+        input_fp = _fingerprint(input_file)
+        self._planned[output_file] = input_fp
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM conversions WHERE output = ?', (output_file,)).fetchone()
+        if row is None:
+            return 'no record'
+        output_fp = _fingerprint(output_file)
+        if output_fp is None:
+            return 'output missing'
+        if output_fp != (row['output_size'], row['output_mtime_ns']):
+            return 'output changed'
+        if row['input'] != input_file or input_fp is None or input_fp[0] != row['input_size']:
+            return 'input changed'
+        if row['params_hash'] != self.params_hash(params):
+            return 'parameters changed'
+        if input_fp[1] != row['input_mtime_ns']:
+            if not (self.use_hash and row['input_sha256'] and hash_file(input_file) == row['input_sha256']):
+                return 'input changed'
+            # 内容相同，只是修改时间变了：更新记录，下次不必再计算摘要
+            with self._lock:
+                self._conn.execute('UPDATE conversions SET input_mtime_ns = ? WHERE output = ?',
+                                   (input_fp[1], output_file))
+                self._conn.commit()
+        return None
+
+    def record(self, input_file, output_file, params, input_hash=None):
+        """
+        登记一次成功的转换（输入状态取 check 时的值，没有检查过时取当前值）
+        input_hash: hash_input 的结果（use_hash 时），计算时的输入状态与登记的一致才保存摘要
+        """
+        input_file, output_file = os.path.abspath(input_file), os.path.abspath(output_file)
+        input_fp = self._planned.pop(output_file, None) or _fingerprint(input_file)
+        output_fp = _fingerprint(output_file)
+        if input_fp is None or output_fp is None:
+            return
+        sha256 = None
+        if self.use_hash and input_hash and tuple(input_hash[1:]) == tuple(input_fp):
+            sha256 = input_hash[0]
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO conversions (output, input, input_size, input_mtime_ns, input_sha256, '
+                'params_hash, params, output_size, output_mtime_ns, converted_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (output_file, input_file, input_fp[0], input_fp[1], sha256, self.params_hash(params),
+                 json.dumps(params, ensure_ascii=False, sort_keys=True), output_fp[0], output_fp[1], time.time()),
+            )
+            self._conn.commit()
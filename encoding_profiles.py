@@ -0,0 +1,94 @@
+"""
+视频编码配置
+命名配置对应一组编码参数（编码器、preset、CRF/码率、tune、线程数、最大高度、音频编码和码率），
+每次转换可以选择不同配置；config.yaml 的 convert.profiles 可以覆盖内置配置或添加新配置。
+bench 在本机用同一段素材依次测试各配置，报告编码帧率、实时倍数和输出大小，用于选择配置和并行数。
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from config_loader import read_config_file
+from ffmpeg_runner import run_ffmpeg
+from parallel_transcode import encoder_args, video_filter_args
+
+# 内置配置；default 与 mp4 输出的默认编码参数相同
+# 与默认编码参数一样固定输出 yuv420p（4:4:4 或 10 位的源否则会编码成多数播放器不支持的 High 4:4:4 / High 10）
+BUILTIN_PROFILES = {
+    'default': {
+        'description': '通用（libx264 medium，CRF 23）',
+        'video_codec': 'libx264', 'preset': 'medium', 'crf': 23,
+        'audio_codec': 'aac', 'audio_bitrate': '160k',
+        'extra_args': ['-pix_fmt', 'yuv420p'],
+    },
+    'fast-preview': {
+        'description': '快速预览（veryfast，CRF 28，最高480p）',
+        'video_codec': 'libx264', 'preset': 'veryfast', 'crf': 28, 'max_height': 480,
+        'audio_codec': 'aac', 'audio_bitrate': '96k',
+        'extra_args': ['-pix_fmt', 'yuv420p'],
+    },
+    'archive': {
+        'description': '存档（slow，CRF 18，高码率音频）',
+        'video_codec': 'libx264', 'preset': 'slow', 'crf': 18,
+        'audio_codec': 'aac', 'audio_bitrate': '256k',
+        'extra_args': ['-pix_fmt', 'yuv420p'],
+    },
+    'small-mobile': {
+        'description': '手机小文件（faster，CRF 27，最高720p，兼容性好的 main profile）',
+        'video_codec': 'libx264', 'preset': 'faster', 'crf': 27, 'max_height': 720,
+        'audio_codec': 'aac', 'audio_bitrate': '96k',
+        'extra_args': ['-profile:v', 'main', '-pix_fmt', 'yuv420p'],
+    },
+}
+
+def load_convert_config():
+    """读取配置文件中的 convert 部分（与 video_cli.py 使用同一个配置文件），没有时返回空字典"""
+    return read_config_file()[1].get('convert') or {}
+
+def load_profiles(convert_config=None):
+    """
+    内置配置与配置文件中的配置合并（同名时配置文件的字段覆盖内置字段）
+    返回: ({配置名: 配置}, 配置文件指定的默认配置名或None)
+    未选择配置时按输出容器使用默认编码参数（webm 用 VP9/Opus 等），因此内置的 default 不自动生效
+    """
+    convert_config = load_convert_config() if convert_config is None else convert_config
+    profiles = {name: dict(profile, name=name) for name, profile in BUILTIN_PROFILES.items()}
+    for name, profile in (convert_config.get('profiles') or {}).items():
+        profiles[name] = dict(profiles.get(name, {}), **(profile or {}), name=name)
+    default = convert_config.get('default_profile')
+    if default and default not in profiles:
+        print(f"警告: 默认编码配置 {default} 不存在，已忽略", file=sys.stderr)
+        default = None
+    return profiles, default
+
+def bench(input_file, profiles, seconds=30, output_format='mp4', show_progress=True):
+    """
+    用输入文件的前 seconds 秒依次测试各编码配置（单进程编码，测的是编码器本身的速度）
+    返回: [{'profile', 'fps', 'realtime', 'elapsed', 'size', 'bitrate_kbps', 'frames'}]
+    """
+    work_dir = tempfile.mkdtemp(prefix='.bench_')
+    results = []
+    try:
+        for profile in profiles:
+            output_file = os.path.join(work_dir, f"{profile['name']}.{output_format}")
+            video_args, audio_args, filters = encoder_args(output_format, profile)
+            stats = run_ffmpeg(['-y', '-v', 'error', '-t', str(seconds), '-i', input_file,
+                                '-map', '0:v:0', '-map', '0:a:0?', *video_filter_args(1.0, filters),
+                                *video_args, *audio_args, output_file],
+                               duration=seconds, desc=profile['name'], show_progress=show_progress)
+            size = os.path.getsize(output_file)
+            media_seconds = stats['media_seconds'] or seconds
+            results.append({
+                'profile': profile['name'],
+                'fps': round(stats['frames'] / stats['elapsed'], 1) if stats['elapsed'] else None,
+                'realtime': stats['realtime'],
+                'elapsed': stats['elapsed'],
+                'frames': stats['frames'],
+                'size': size,
+                'bitrate_kbps': round(size * 8 / media_seconds / 1000, 1),
+            })
+            os.remove(output_file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
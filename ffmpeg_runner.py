@@ -0,0 +1,169 @@
+"""
+ffmpeg 进程封装
+以流水线方式运行 ffmpeg（解码 -> 滤镜 -> 编码都在 ffmpeg 内部流式完成），
+Python 端只读取 -progress 输出显示进度，内存占用与媒体时长无关。
+进度包括百分比、剩余时间、处理速度（实时倍数）和输出码率，也可以写成 NDJSON 事件供自动化使用。
+"""
+import json
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from tqdm import tqdm
+
+from media_probe import find_tool
+
+class FFmpegError(Exception):
+    """ffmpeg 不可用或执行失败"""
+
+def ffmpeg_path():
+    """ffmpeg 可执行文件路径，找不到时抛出 FFmpegError"""
+    path = find_tool('ffmpeg')
+    if not path:
+        raise FFmpegError("未找到 ffmpeg，请安装 ffmpeg 或 imageio-ffmpeg")
+    return path
+
+_version = None
+
+def ffmpeg_version():
+    """
+    ffmpeg 版本信息（-version 的第一行，进程内只查询一次），升级 ffmpeg 后增量转换缓存随之失效
+    ffmpeg 不存在或无法运行时抛出 FFmpegError
+    """
+    global _version
+    if _version is None:
+        try:
+            result = subprocess.run([ffmpeg_path(), '-version'], capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise FFmpegError(f"无法运行 ffmpeg: {e}") from e
+        if result.returncode != 0:
+            raise FFmpegError(f"ffmpeg -version 失败（返回码 {result.returncode}）")
+        _version = (result.stdout.splitlines() or ['unknown'])[0].strip()
+    return _version
+
+def parse_progress_time(fields):
+    """从 -progress 的一组字段中取出已处理的媒体时间（秒）"""
+    for key in ('out_time_us', 'out_time_ms'):
+        value = fields.get(key)
+        if value and value.lstrip('-').isdigit():
+            # 两个字段实际单位都是微秒（ffmpeg 的历史遗留）
+            return max(0, int(value)) / 1_000_000
+    return None
+
+def _parse_number(value, suffix=''):
+    """解析 -progress 中的数值字段（如 "1.5x"、"128.0kbits/s"），N/A 返回None"""
+    value = (value or '').strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+class ProgressTelemetry:
+    """
+    把转换进度写成 NDJSON 事件（每行一个 JSON 对象）
+    事件: start（开始）、progress（约每0.5秒一次）、end（结束，含平均实时倍数）
+    target: 文件路径（追加写入，多个进程可同时写同一文件）或 '-' 表示标准输出
+    """
+
+    def __init__(self, target):
+        self.target = target
+        if target == '-':
+            # 使用原始标准输出：批量模式会把普通输出重定向到 stderr，子进程也继承这一状态
+            self._file, self._owned = sys.__stdout__, False
+        else:
+            self._file, self._owned = open(target, 'a', encoding='utf-8'), True
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}, ensure_ascii=False) + '\n'
+        # 整行一次写入，追加模式下多个进程的事件不会交错
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+
+def run_ffmpeg(args, duration=None, desc="转换进度", show_progress=True, telemetry=None, label=None):
+    """
+    运行 ffmpeg 并显示进度
+    参数:
+      args: ffmpeg 参数（不含可执行文件本身）
+      duration: 输出的媒体时长（秒），用于计算百分比和剩余时间
+      telemetry: ProgressTelemetry，不为None时同时输出 NDJSON 进度事件
+      label: 事件中标识本次转换的名称（通常为文件名）
+    返回: {'elapsed': 耗时秒数, 'media_seconds': 已处理的媒体时长, 'frames': 输出视频帧数, 'realtime': 平均实时倍数}
+    失败时抛出 FFmpegError（附带 ffmpeg 最后几行错误输出）
+    """
+    cmd = [ffmpeg_path(), '-hide_banner', '-nostdin', '-nostats', '-progress', 'pipe:1', *args]
+    start = time.monotonic()
+    if telemetry:
+        telemetry.emit('start', file=label, duration=duration)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, encoding='utf-8', errors='replace')
+    # stderr 在后台线程中读取，只保留最后几行，避免管道写满导致 ffmpeg 阻塞
+    stderr_tail = deque(maxlen=20)
+    stderr_thread = threading.Thread(target=lambda: stderr_tail.extend(process.stderr), daemon=True)
+    stderr_thread.start()
+
+    total = round(duration, 1) if duration else None
+    pbar = tqdm(total=total, desc=desc, unit="秒", disable=not show_progress,
+                bar_format="{l_bar}{bar}| {n:.1f}/{total:.1f}秒 [{elapsed}<{remaining}{postfix}]" if total else None)
+    fields = {}
+    seconds = 0.0
+    frames = 0
+    try:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            fields[key] = value
+            if key != 'progress':
+                continue
+            # 每组进度信息以 progress=continue/end 结束
+            seconds = parse_progress_time(fields) or seconds
+            frames = int(_parse_number(fields.get('frame')) or frames)
+            elapsed = time.monotonic() - start
+            # ffmpeg 报告的速度是瞬时值，缺失时按累计值计算
+            speed = _parse_number(fields.get('speed'), 'x') or (seconds / elapsed if elapsed > 0 else None)
+            bitrate = _parse_number(fields.get('bitrate'), 'kbits/s')
+            pbar.update(max(0.0, min(seconds, total or seconds) - pbar.n))
+            if speed or bitrate:
+                pbar.set_postfix_str(', '.join(part for part in (
+                    f"{speed:.1f}x实时" if speed else '', f"{bitrate:.0f}kbps" if bitrate else '') if part))
+            if telemetry:
+                percent = min(100.0, seconds / duration * 100) if duration else None
+                telemetry.emit(
+                    'progress', file=label, time=round(seconds, 2), duration=duration,
+                    percent=round(percent, 1) if percent is not None else None,
+                    eta=round((duration - seconds) / speed, 1) if duration and speed else None,
+                    speed=round(speed, 2) if speed else None,
+                    bitrate_kbps=bitrate, size=int(_parse_number(fields.get('total_size')) or 0) or None,
+                    fps=_parse_number(fields.get('fps')), elapsed=round(elapsed, 2),
+                )
+            fields = {}
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        if telemetry:
+            telemetry.emit('end', file=label, status='interrupted', elapsed=round(time.monotonic() - start, 2))
+        raise
+    finally:
+        pbar.close()
+        stderr_thread.join(timeout=5)
+
+    elapsed = time.monotonic() - start
+    stats = {'elapsed': round(elapsed, 2), 'media_seconds': round(seconds, 2), 'frames': frames,
+             'realtime': round(seconds / elapsed, 2) if elapsed > 0 and seconds else None}
+    if process.returncode != 0:
+        message = ''.join(stderr_tail).strip() or f"ffmpeg 返回 {process.returncode}"
+        if telemetry:
+            telemetry.emit('end', file=label, status='failed', error=message.splitlines()[-1], **stats)
+        raise FFmpegError(message)
+    if telemetry:
+        telemetry.emit('end', file=label, status='ok', **stats)
+    return stats
@@ -0,0 +1,121 @@
+"""
+格式可用性探测
+遇到 HTTP 403 时，不再逐个尝试备选格式做完整下载，而是对 info 中各格式的URL
+并行发送小范围请求（Range: bytes=0-1023），挑选确实返回 200/206 的最佳格式。
+DASH/HLS 格式探测各自的第一个分片（或分片基地址、媒体播放列表），
+不探测所有格式共用的 manifest_url，否则一个清单可用就会把全部分片格式误判为可用。
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+import yt_dlp
+
+def probe_url(fmt):
+    """
+    格式的探测地址：分片格式取第一个分片，其次分片基地址，否则取格式自身的 url
+    （HLS 格式的 url 是该格式的媒体播放列表）。没有可探测地址时返回None
+    """
+    fragments = fmt.get('fragments')
+    if fragments:
+        first = fragments[0]
+        if first.get('url'):
+            return first['url']
+        if first.get('path'):
+            return urljoin(fmt.get('fragment_base_url') or fmt.get('url') or '', first['path'])
+    return fmt.get('fragment_base_url') or fmt.get('url')
+
+def probe_format(fmt, proxy=None, timeout=5):
+    """
+    对单个格式发送小范围 GET 请求
+    返回: HTTP状态码，网络错误时返回None
+    """
+    url = probe_url(fmt)
+    if not url:
+        return None
+    headers = dict(fmt.get('http_headers') or {})
+    headers['Range'] = 'bytes=0-1023'
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout, stream=True,
+                                proxies={'http': proxy, 'https': proxy} if proxy else None)
+        response.close()
+        return response.status_code
+    except requests.RequestException:
+        return None
+
+def probe_formats(formats, proxy=None, timeout=5, max_workers=16):
+    """
+    并行探测所有格式
+    返回: {format_id: status_code}
+    """
+    candidates = [f for f in formats if f.get('format_id') and probe_url(f)]
+    if not candidates:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(candidates))) as executor:
+        statuses = executor.map(lambda f: probe_format(f, proxy, timeout), candidates)
+        return {f['format_id']: status for f, status in zip(candidates, statuses)}
+
+def pick_available_format(formats, ok_ids, max_height=None):
+    """
+    在探测可用的格式中挑选最佳组合（yt-dlp 的 formats 按质量从低到高排列）
+    结果总是包含音频：只有纯视频流可用时与 bestaudio 组合，交给 yt-dlp 选择音频
+    返回: 格式字符串（如 '137+140'、'18' 或 '137+bestaudio'），没有可用格式时返回None
+    """
+    def usable(f):
+        return f.get('format_id') in ok_ids and (not max_height or (f.get('height') or 0) <= max_height)
+
+    best_single = best_video = best_audio = None
+    for f in reversed(formats):
+        if not usable(f):
+            continue
+        has_video = f.get('vcodec', 'none') != 'none'
+        has_audio = f.get('acodec', 'none') != 'none'
+        if has_video and has_audio and best_single is None:
+            best_single = f
+        elif has_video and not has_audio and best_video is None:
+            best_video = f
+        elif has_audio and not has_video and best_audio is None:
+            best_audio = f
+
+    if best_video and best_audio and (
+            best_single is None or (best_video.get('height') or 0) > (best_single.get('height') or 0)):
+        return f"{best_video['format_id']}+{best_audio['format_id']}"
+    if best_single:
+        return best_single['format_id']
+    if best_video:
+        return f"{best_video['format_id']}+bestaudio"
+    return None
+
+def requested_max_height(requested, formats):
+    """从原先请求的格式字符串推断分辨率上限（格式ID对应的高度，或 height<=N 条件）"""
+    by_id = {f.get('format_id'): f for f in formats}
+    heights = [by_id[part].get('height') or 0 for part in re.split(r'[+/]', requested or '') if part in by_id]
+    if any(heights):
+        return max(heights)
+    match = re.search(r'height<=\??(\d+)', requested or '')
+    return int(match.group(1)) if match else None
+
+def probe_fallback_format(page_url, ydl_opts, max_height=None, timeout=5):
+    """
+    重新解析视频（不下载），并行探测所有格式URL，返回确实可下载的最佳格式字符串。
+    未指定 max_height 时不超过原先请求格式的分辨率。
+    解析失败或没有可用格式时返回None。
+    """
+    opts = dict(ydl_opts)
+    opts.pop('format', None)
+    opts.update({'quiet': True, 'skip_download': True, 'ignoreerrors': False})
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(page_url, download=False)
+    except Exception as e:
+        print(f"探测前解析失败: {e}")
+        return None
+    formats = (info or {}).get('formats') or []
+    if max_height is None:
+        max_height = requested_max_height(ydl_opts.get('format'), formats)
+
+    statuses = probe_formats(formats, proxy=ydl_opts.get('proxy'), timeout=timeout)
+    ok_ids = {format_id for format_id, status in statuses.items() if status in (200, 206)}
+    print(f"并行探测 {len(statuses)} 个格式，{len(ok_ids)} 个可用")
+    return pick_available_format(formats, ok_ids, max_height)
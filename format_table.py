@@ -0,0 +1,48 @@
+"""
+精简的格式记录
+yt-dlp 的 info/formats 中每个格式都带有URL、HTTP头、分片列表、清单数据等，
+格式选择只需要其中少数几个字段。解析后立即转换为 __slots__ 记录并丢弃原始 info，
+批量并发解析时内存占用只与格式数量成正比，与分片数、清单大小无关。
+下载时由 yt-dlp 按 format_id 重新解析获取URL等数据。
+"""
+
+# 格式选择（categorize_formats / pick_resolution / select_plan_formats）和体积估算用到的字段
+FORMAT_FIELDS = ('format_id', 'ext', 'vcodec', 'acodec', 'height', 'abr', 'tbr',
+                 'filesize', 'filesize_approx', 'protocol')
+
+class FormatRecord:
+    """
+    单个格式的精简记录
+    提供与 dict 相同的 get/[] 访问方式，原始数据中缺失的字段同样视为缺失（get 返回默认值）
+    """
+    __slots__ = FORMAT_FIELDS
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def from_dict(cls, fmt):
+        return cls(**{key: fmt[key] for key in FORMAT_FIELDS if key in fmt})
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in FORMAT_FIELDS else default
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in FORMAT_FIELDS and hasattr(self, key)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in FORMAT_FIELDS if hasattr(self, key)}
+
+    def __repr__(self):
+        return f"FormatRecord({self.to_dict()!r})"
+
+def compact_formats(formats):
+    """把 yt-dlp 的格式列表（或缓存中的格式字典）转换为精简记录列表，保持原有顺序"""
+    return [FormatRecord.from_dict(f) for f in formats or []]
@@ -0,0 +1,189 @@
+"""
+对冲解析（hedged extraction）
+先用历史表现最好的 YouTube player_client（如 web、android、mweb）调用 extract_info，
+超过延迟阈值仍未返回（或失败）时才启动下一个客户端，采用最先返回完整格式列表的结果。
+yt-dlp 的解析无法中途取消，已启动的落后请求在后台线程中自然结束，
+延迟启动保证了正常情况下只发出一个请求，不会成倍增加对站点的请求量。
+每个客户端的成功率和耗时会被记录并持久化，用于决定以后优先使用哪些客户端。
+"""
+import copy
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import yt_dlp
+
+DEFAULT_CLIENTS = ('web', 'android', 'mweb')
+DEFAULT_STATS_FILE = os.path.expanduser('~/.videodownloader/client_stats.json')
+
+# 只有这些站点支持 player_client 参数
+HEDGE_HOSTS = ('youtube.com', 'youtu.be', 'music.youtube.com')
+
+# 记住胜出客户端的URL数上限（只用于紧接着的下载，批量任务中按最近使用淘汰）
+MAX_WINNERS = 256
+
+class HedgedExtractor:
+    """
+    并发使用多个客户端配置解析视频（线程安全）
+
+    参数:
+      clients: 参与竞速的 player_client 列表
+      max_parallel: 最多启动的客户端数（按历史表现挑选）
+      hedge_delay: 启动下一个客户端前的最短等待（秒），实际取该值与当前客户端平均耗时1.5倍中的较大者
+      stats_file: 客户端统计数据保存路径，为None时不持久化
+      alpha: 耗时滑动平均系数
+
+    与"竞速后取消落后者"不同，落后的请求不会被取消（yt-dlp 的解析不支持中断），
+    而是在后台守护线程中结束，结果只计入统计
+    """
+
+    def __init__(self, clients=DEFAULT_CLIENTS, max_parallel=3, hedge_delay=2.0, stats_file=DEFAULT_STATS_FILE,
+                 alpha=0.3):
+        self.clients = list(clients)
+        self.max_parallel = max(1, max_parallel)
+        self.hedge_delay = hedge_delay
+        self.stats_file = stats_file
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._stats = self._load()
+        self._winners = OrderedDict()  # URL -> 胜出客户端，最多 MAX_WINNERS 条
+
+    def _load(self):
+        if not self.stats_file:
+            return {}
+        try:
+            with open(self.stats_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.stats_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+            tmp_path = f"{self.stats_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._stats, f, indent=2)
+            os.replace(tmp_path, self.stats_file)
+        except OSError as e:
+            print(f"警告: 保存客户端统计失败: {e}")
+
+    def _record(self, client, ok, seconds, won=False):
+        with self._lock:
+            stats = self._stats.setdefault(client, {'successes': 0, 'failures': 0, 'wins': 0, 'latency': None})
+            if ok:
+                stats['successes'] += 1
+                old = stats['latency']
+                stats['latency'] = seconds if old is None else self.alpha * seconds + (1 - self.alpha) * old
+            else:
+                stats['failures'] += 1
+            if won:
+                stats['wins'] += 1
+            self._save()
+
+    def preferred_clients(self):
+        """按历史成功率（高优先）和平均耗时（低优先）排序的客户端列表"""
+        with self._lock:
+            def key(client):
+                stats = self._stats.get(client)
+                if not stats:
+                    return (0, 0.0)  # 没有数据的客户端排在中间，保证会被尝试
+                total = stats['successes'] + stats['failures']
+                rate = stats['successes'] / total if total else 0
+                return (-rate, stats['latency'] or 0.0)
+            return sorted(self.clients, key=key)
+
+    def _hedge_after(self, client):
+        """启动该客户端后，等多久仍无结果才启动下一个"""
+        with self._lock:
+            latency = (self._stats.get(client) or {}).get('latency')
+        return max(self.hedge_delay, 1.5 * latency) if latency else self.hedge_delay
+
+    def winner(self, url):
+        """该URL最近一次对冲解析胜出的客户端"""
+        with self._lock:
+            client = self._winners.get(url)
+            if client is not None:
+                self._winners.move_to_end(url)
+            return client
+
+    def metrics(self):
+        with self._lock:
+            return copy.deepcopy(self._stats)
+
+    def extract(self, url, ydl_opts):
+        """
+        按历史表现依次启动客户端解析（前一个超过延迟阈值或失败时才启动下一个），
+        返回最先得到完整格式列表的 info。
+        非 YouTube 链接直接普通解析。全部失败时抛出第一个客户端的异常。
+        """
+        if not any(host in url for host in HEDGE_HOSTS):
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                return ydl.extract_info(url, download=False)
+
+        clients = self.preferred_clients()[:self.max_parallel]
+        results = queue.Queue()
+
+        def run(client):
+            opts = dict(ydl_opts)
+            extractor_args = copy.deepcopy(opts.get('extractor_args') or {})
+            extractor_args.setdefault('youtube', {})['player_client'] = [client]
+            opts['extractor_args'] = extractor_args
+            start = time.monotonic()
+            try:
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    info = ydl.extract_info(url, download=False)
+                ok = bool(info and info.get('formats'))
+                results.put((client, info if ok else None, None, time.monotonic() - start))
+            except Exception as e:
+                results.put((client, None, e, time.monotonic() - start))
+
+        def start(client):
+            # 使用守护线程：胜出后不等待其余请求，进程退出时也不会被它们拖住
+            threading.Thread(target=run, args=(client,), name=f'hedge-{client}', daemon=True).start()
+
+        waiting = list(clients)
+        started = received = 0
+        first_error = None
+        while received < started or waiting:
+            if received == started:
+                # 没有进行中的请求（刚开始或已启动的都失败了），立即启动下一个
+                client = waiting.pop(0)
+                start(client)
+                started += 1
+                hedge_after = self._hedge_after(client)
+            try:
+                client, info, error, seconds = results.get(timeout=hedge_after if waiting else None)
+            except queue.Empty:
+                print(f"对冲解析: {hedge_after:.1f}秒内未返回，追加 {waiting[0]} 客户端")
+                client = waiting.pop(0)
+                start(client)
+                started += 1
+                hedge_after = self._hedge_after(client)
+                continue
+            received += 1
+            if info is not None:
+                with self._lock:
+                    self._winners[url] = client
+                    self._winners.move_to_end(url)
+                    while len(self._winners) > MAX_WINNERS:
+                        self._winners.popitem(last=False)
+                self._record(client, True, seconds, won=True)
+                print(f"对冲解析: {client} 客户端最先返回（{seconds:.1f}秒）")
+                # 已启动的落后请求在后台线程中收集结果，只用于统计；未启动的不再发出
+                if started > received:
+                    threading.Thread(target=self._drain, args=(results, started - received), daemon=True).start()
+                return info
+            self._record(client, False, seconds)
+            if first_error is None:
+                first_error = error or yt_dlp.utils.ExtractorError(f"{client} 客户端未返回任何格式")
+        raise first_error
+
+    def _drain(self, results, remaining):
+        for _ in range(remaining):
+            client, info, error, seconds = results.get()
+            self._record(client, info is not None, seconds)
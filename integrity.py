@@ -0,0 +1,144 @@
+"""
+下载完整性校验
+yt-dlp 在 ignoreerrors 模式下，截断的分片或不完整的合并也可能被当作下载成功。
+下载结束后对每个最终文件做快速头部探测，与解析得到的信息比对:
+- 容器时长与 info 中的 duration 一致（允许少量误差）
+- 所选格式包含视频/音频时，文件中存在对应的流
+- 文件大小不明显小于实际下载的字节数
+- 可选：只解码关键帧扫描整个文件
+校验失败的文件会被删除（否则 yt-dlp 重试时会认为"已下载"而跳过），交给重试逻辑重新下载。
+"""
+import os
+
+from media_probe import MediaProbeError, find_tool, keyframe_scan, probe_media
+
+# 时长允许的误差：绝对秒数与相对比例中较大的一个
+DURATION_TOLERANCE = 2.0
+DURATION_TOLERANCE_RATIO = 0.01
+# 文件大小不得小于下载字节数的该比例（合并时容器开销会有少量差异）
+MIN_SIZE_RATIO = 0.9
+
+class IntegrityError(Exception):
+    """下载的文件未通过完整性校验"""
+
+def check_file(path, expected, keyframes=False):
+    """
+    校验单个文件
+    expected: {'duration': 秒或None, 'video': bool, 'audio': bool, 'bytes': 下载字节数}
+    返回: 问题描述列表，为空表示通过
+    """
+    problems = []
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return [f"文件不存在: {path}"]
+    if size == 0:
+        return ["文件为空"]
+    if expected.get('bytes') and size < expected['bytes'] * MIN_SIZE_RATIO:
+        problems.append(f"文件大小 {size} 字节，明显小于下载的 {expected['bytes']} 字节")
+
+    if not find_tool('ffprobe'):
+        return problems
+    try:
+        info = probe_media(path)
+    except MediaProbeError as e:
+        return problems + [f"无法读取容器信息: {e}"]
+
+    codec_types = [s['codec_type'] for s in info['streams']]
+    if expected.get('video') and 'video' not in codec_types:
+        problems.append("缺少视频流")
+    if expected.get('audio') and 'audio' not in codec_types:
+        problems.append("缺少音频流")
+
+    expected_duration = expected.get('duration')
+    if expected_duration:
+        actual = info['duration']
+        tolerance = max(DURATION_TOLERANCE, expected_duration * DURATION_TOLERANCE_RATIO)
+        if actual is None:
+            problems.append("容器中没有时长信息")
+        elif abs(actual - expected_duration) > tolerance:
+            problems.append(f"时长 {actual:.1f} 秒，预期 {expected_duration:.1f} 秒")
+
+    if keyframes and not problems and find_tool('ffmpeg'):
+        try:
+            errors = keyframe_scan(path)
+        except MediaProbeError as e:
+            errors = [str(e)]
+        if errors:
+            problems.append(f"关键帧扫描发现错误: {errors[0]}" + (f" 等{len(errors)}处" if len(errors) > 1 else ""))
+    return problems
+
+class DownloadVerifier:
+    """
+    收集一次下载中每个最终文件的预期信息，下载结束后逐个校验。
+    progress_hook 加入 progress_hooks，post_hook 加入 post_hooks:
+    yt-dlp 逐个视频处理（下载各格式 -> 合并 -> post_hooks），
+    所以上一个 post_hook 之后完成的格式都属于下一个最终文件。
+    """
+
+    def __init__(self, keyframes=False):
+        self.keyframes = keyframes
+        self.files = []
+        self._pending = []
+
+    def progress_hook(self, d):
+        if d.get('status') != 'finished':
+            return
+        info = d.get('info_dict') or {}
+        self._pending.append({
+            'duration': info.get('duration'),
+            'video': info.get('vcodec', 'none') not in ('none', None),
+            'audio': info.get('acodec', 'none') not in ('none', None),
+            'bytes': d.get('total_bytes') or d.get('downloaded_bytes') or 0,
+            'is_live': info.get('is_live') or info.get('was_live'),
+        })
+
+    def post_hook(self, filepath):
+        pieces, self._pending = self._pending, []
+        if not pieces:
+            # 文件已存在、未实际下载：没有预期信息，只确认文件存在
+            self.files.append((filepath, None))
+            return
+        self.files.append((filepath, {
+            # 直播录像的时长不可靠，不做比较
+            'duration': None if any(p['is_live'] for p in pieces) else pieces[0]['duration'],
+            'video': any(p['video'] for p in pieces),
+            'audio': any(p['audio'] for p in pieces),
+            'bytes': sum(p['bytes'] for p in pieces),
+        }))
+
+    def install(self, ydl_opts):
+        ydl_opts['progress_hooks'] = list(ydl_opts.get('progress_hooks') or []) + [self.progress_hook]
+        ydl_opts['post_hooks'] = list(ydl_opts.get('post_hooks') or []) + [self.post_hook]
+
+    def reset(self):
+        self.files = []
+        self._pending = []
+
+    def verify(self):
+        """
+        校验本次下载的所有文件，失败的文件会被删除
+        一个输出文件都没有记录到（下载失败被 ignoreerrors 吞掉）同样视为失败
+        失败时抛出 IntegrityError
+        """
+        if not self.files:
+            self.reset()
+            raise IntegrityError("完整性校验失败 - 没有得到任何输出文件")
+        failures = []
+        for path, expected in self.files:
+            if expected is None:
+                if not os.path.exists(path):
+                    failures.append(f"{os.path.basename(path)}: 文件不存在")
+                continue
+            problems = check_file(path, expected, keyframes=self.keyframes)
+            if problems:
+                failures.append(f"{os.path.basename(path)}: {'；'.join(problems)}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                print(f"完整性校验通过: {os.path.basename(path)}")
+        self.reset()
+        if failures:
+            raise IntegrityError("完整性校验失败 - " + " | ".join(failures))
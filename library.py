@@ -0,0 +1,290 @@
+"""
+受管理的下载库（容量配额 + LRU淘汰）
+把下载目录当作转码任务前面的媒体缓存使用:
+- 索引文件记录每个文件的来源URL、存档ID（提取器名 + 视频ID）、大小、下载时间、最近使用时间，
+  按存档ID判断视频是否已在库中，与下载存档的判断一致
+- 新下载即将超出配额时，先淘汰超过保留期限的文件，再按最近最少使用（LRU）淘汰
+- 与 yt-dlp 的下载存档（download archive）联动：淘汰文件时同时删除存档中的记录，
+  以后再次请求该视频时会重新下载
+"""
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.utils import make_archive_id
+
+INDEX_FILE = '.library_index.json'
+ARCHIVE_FILE = '.download_archive'
+
+@lru_cache(maxsize=1024)
+def url_archive_id(url):
+    """
+    不联网地由URL得到下载存档ID（提取器名 + 视频ID，与 yt-dlp 的 download_archive 一致），
+    youtu.be/ID、watch?v=ID 等不同写法得到同一个ID；只有通用提取器能处理的URL返回None
+    """
+    for ie in gen_extractor_classes():
+        if ie.ie_key() == 'Generic' or not ie.suitable(url):
+            continue
+        video_id = ie.get_temp_id(url)
+        return make_archive_id(ie, video_id) if video_id else None
+    return None
+
+class Library:
+    """
+    下载库索引（线程安全）
+
+    参数:
+      root: 库目录（即下载目录）
+      quota_bytes: 容量上限（字节），为None时不限制
+      max_age_days: 超过该天数未使用的文件会被淘汰，为None时不按时间淘汰
+      on_evict: 文件被淘汰后的回调（参数为文件路径），如同步媒体库索引
+    """
+
+    def __init__(self, root, quota_bytes=None, max_age_days=None, on_evict=None):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        os.makedirs(self.root, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.max_age_days = max_age_days
+        self.on_evict = on_evict
+        self.index_file = os.path.join(self.root, INDEX_FILE)
+        self.archive_file = os.path.join(self.root, ARCHIVE_FILE)
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._entries = self._load()
+        self.sync()
+
+    def _load(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.index_file)
+        except OSError as e:
+            print(f"警告: 保存下载库索引失败: {e}")
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _last_used(self, name, entry):
+        """最近使用时间：索引中记录的使用时间与文件访问时间中较晚的一个"""
+        try:
+            atime = os.stat(self._path(name)).st_atime
+        except OSError:
+            atime = 0
+        return max(entry.get('last_used', 0), atime)
+
+    def _remove_archive_ids(self, archive_ids):
+        """从下载存档中删除记录，返回是否有记录被删除"""
+        archive_ids = {a for a in archive_ids if a}
+        if not archive_ids:
+            return False
+        try:
+            with open(self.archive_file, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+        kept = [line for line in lines if line.strip() not in archive_ids]
+        if len(kept) == len(lines):
+            return False
+        tmp_path = f"{self.archive_file}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in kept))
+        os.replace(tmp_path, self.archive_file)
+        return True
+
+    def _evict(self, name):
+        """删除文件、索引记录和存档记录（调用方持有锁）"""
+        entry = self._entries.pop(name)
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+        # 同一视频的其他文件仍在库中时保留存档记录
+        archive_id = entry.get('archive_id')
+        if archive_id and not any(e.get('archive_id') == archive_id for e in self._entries.values()):
+            self._remove_archive_ids([archive_id])
+        if self.on_evict is not None:
+            self.on_evict(self._path(name))
+        return entry
+
+    def sync(self):
+        """清除文件已被手动删除的索引记录（及对应存档记录）"""
+        with self._lock:
+            missing = [name for name in self._entries if not os.path.exists(self._path(name))]
+            for name in missing:
+                self._evict(name)
+            if missing:
+                self._save()
+        return missing
+
+    def unarchive_missing(self, url):
+        """
+        该URL的视频仍在下载存档中、库里却没有对应文件（文件被手动删除、登记失败等）时删除存档记录，
+        否则 yt-dlp 会以"已在存档中"为由跳过下载
+        返回: 是否删除了存档记录
+        """
+        self.sync()
+        archive_id = url_archive_id(url)
+        if not archive_id:
+            return False
+        with self._lock:
+            if any(entry.get('archive_id') == archive_id and os.path.exists(self._path(name))
+                   for name, entry in self._entries.items()):
+                return False
+            return self._remove_archive_ids([archive_id])
+
+    def usage(self):
+        """库中文件总字节数"""
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values())
+
+    def lookup(self, url):
+        """
+        查找该URL对应视频已下载的文件（按存档ID匹配，URL写法不同也能命中；
+        没有存档ID的旧记录按URL匹配），命中时更新最近使用时间
+        返回: 文件路径列表，未命中时返回空列表
+        """
+        archive_id = url_archive_id(url)
+        with self._lock:
+            names = [name for name, entry in self._entries.items()
+                     if ((archive_id and entry.get('archive_id') == archive_id) or entry.get('url') == url)
+                     and os.path.exists(self._path(name))]
+            if names:
+                now = time.time()
+                for name in names:
+                    self._entries[name]['last_used'] = now
+                self._save()
+            return [self._path(name) for name in names]
+
+    def touch(self, path):
+        """标记文件被使用（如被转码任务读取）"""
+        name = os.path.relpath(os.path.abspath(path), self.root)
+        with self._lock:
+            if name in self._entries:
+                self._entries[name]['last_used'] = time.time()
+                self._save()
+
+    def reserve(self, nbytes):
+        """为正在进行的下载预留空间，必要时先淘汰旧文件"""
+        with self._lock:
+            self._reserved += nbytes
+            if self._make_room(0, ()):
+                self._save()
+
+    def release(self, nbytes):
+        with self._lock:
+            self._reserved = max(0, self._reserved - nbytes)
+
+    def add(self, path, url, archive_id=None, size=None):
+        """
+        把下载完成的文件登记到库中，并在超出配额时淘汰其他文件
+        size: 文件大小，文件仍在暂存目录搬运时由调用方提供
+        """
+        name = os.path.relpath(os.path.abspath(path), self.root)
+        if size is None:
+            try:
+                size = os.path.getsize(self._path(name))
+            except OSError:
+                size = 0
+        now = time.time()
+        with self._lock:
+            self._entries[name] = {
+                'url': url,
+                'archive_id': archive_id,
+                'size': size,
+                'added': now,
+                'last_used': now,
+            }
+            evicted = self._make_room(0, (name,))
+            self._save()
+        return evicted
+
+    def ensure_space(self, incoming=0):
+        """
+        为即将写入的 incoming 字节腾出空间，并执行保留期限策略
+        返回: 被淘汰的文件名列表
+        """
+        with self._lock:
+            evicted = self._make_room(incoming, ())
+            if evicted:
+                self._save()
+            return evicted
+
+    def _make_room(self, incoming, keep):
+        evicted = []
+        now = time.time()
+        if self.max_age_days:
+            max_age = self.max_age_days * 86400
+            for name, entry in list(self._entries.items()):
+                if name not in keep and now - self._last_used(name, entry) > max_age:
+                    self._evict(name)
+                    evicted.append(name)
+
+        if self.quota_bytes:
+            used = sum(entry['size'] for entry in self._entries.values())
+            needed = used + self._reserved + incoming - self.quota_bytes
+            if needed > 0:
+                candidates = sorted(
+                    ((self._last_used(name, entry), name) for name, entry in self._entries.items()
+                     if name not in keep),
+                )
+                for _, name in candidates:
+                    if needed <= 0:
+                        break
+                    needed -= self._evict(name)['size']
+                    evicted.append(name)
+                if needed > 0:
+                    print(f"警告: 下载库空间不足，超出配额 {needed} 字节")
+
+        for name in evicted:
+            print(f"下载库已淘汰: {name}")
+        return evicted
+
+class DownloadTracker:
+    """
+    跟踪单个下载任务：按文件预留空间，记录存档ID，下载完成后登记到库中。
+    progress_hook 需加入 yt-dlp 的 progress_hooks。
+    """
+
+    def __init__(self, library, url):
+        self.library = library
+        self.url = url
+        # 下载开始后以 info 中的提取器名和ID为准，未收到进度信息时退回由URL得到的ID
+        self.archive_id = None
+        self._url_archive_id = url_archive_id(url)
+        self._reserved = {}
+
+    def progress_hook(self, d):
+        info = d.get('info_dict') or {}
+        if self.archive_id is None and info.get('id') and info.get('extractor_key'):
+            self.archive_id = make_archive_id(info['extractor_key'], info['id'])
+        if d.get('status') != 'downloading':
+            return
+        filename = d.get('filename')
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if filename and total and filename not in self._reserved:
+            self._reserved[filename] = int(total)
+            self.library.reserve(int(total))
+
+    def finish(self, files, output_dir, success):
+        """释放预留空间，成功时把最终文件（按输出目录中的路径）登记到库中"""
+        self.library.release(sum(self._reserved.values()))
+        self._reserved.clear()
+        if not success:
+            return
+        for filepath in files:
+            dest = os.path.join(output_dir, os.path.basename(filepath))
+            source = filepath if os.path.exists(filepath) else dest
+            if os.path.exists(source):
+                self.library.add(dest, self.url, self.archive_id or self._url_archive_id,
+                                 size=os.path.getsize(source))
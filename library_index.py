@@ -0,0 +1,232 @@
+"""
+本地媒体库索引（SQLite）
+每个下载完成的文件记录一行：视频ID、标题、上传者、时长、所选格式、分辨率、路径等，
+标题和上传者建立 FTS5 全文索引。查询只读数据库，不访问网络，也不扫描目录。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_INDEX_DB = os.path.expanduser('~/.videodownloader/library.db')
+
+# metadata 列中保留的 info 字段（完整 info 太大，只留检索和溯源有用的部分）
+METADATA_FIELDS = ('id', 'title', 'uploader', 'channel', 'upload_date', 'duration', 'webpage_url',
+                   'extractor_key', 'view_count', 'tags', 'categories')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT,
+    extractor TEXT,
+    url TEXT,
+    title TEXT,
+    uploader TEXT,
+    duration REAL,
+    format_id TEXT,
+    height INTEGER,
+    ext TEXT,
+    filesize INTEGER,
+    path TEXT UNIQUE,
+    downloaded_at REAL,
+    present INTEGER NOT NULL DEFAULT 1,
+    metadata TEXT,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS media_video_id ON media(video_id);
+CREATE INDEX IF NOT EXISTS media_url ON media(url);
+CREATE INDEX IF NOT EXISTS media_downloaded_at ON media(downloaded_at);
+-- 统计查询只扫描这些覆盖索引，不读取含标题和元数据的整行
+CREATE INDEX IF NOT EXISTS media_stats ON media(present, filesize, duration, downloaded_at);
+CREATE INDEX IF NOT EXISTS media_present_video ON media(present, video_id);
+CREATE INDEX IF NOT EXISTS media_uploader ON media(present, uploader);
+CREATE INDEX IF NOT EXISTS media_height ON media(present, height);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5(
+    title, uploader, content='media', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS media_ai AFTER INSERT ON media BEGIN
+    INSERT INTO media_fts(rowid, title, uploader) VALUES (new.id, new.title, new.uploader);
+END;
+CREATE TRIGGER IF NOT EXISTS media_ad AFTER DELETE ON media BEGIN
+    INSERT INTO media_fts(media_fts, rowid, title, uploader) VALUES ('delete', old.id, old.title, old.uploader);
+END;
+CREATE TRIGGER IF NOT EXISTS media_au AFTER UPDATE OF title, uploader ON media BEGIN
+    INSERT INTO media_fts(media_fts, rowid, title, uploader) VALUES ('delete', old.id, old.title, old.uploader);
+    INSERT INTO media_fts(rowid, title, uploader) VALUES (new.id, new.title, new.uploader);
+END;
+"""
+
+LIST_COLUMNS = ('id', 'video_id', 'title', 'uploader', 'duration', 'format_id', 'height', 'ext',
+                'filesize', 'path', 'downloaded_at', 'present', 'url')
+
+class LibraryIndex:
+    """
+    SQLite 媒体库索引（线程安全，多个进程可同时使用）
+
+    参数:
+      db_path: 数据库文件路径
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_DB):
+        self.db_path = os.path.expanduser(db_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(media)')}
+        if 'sha256' not in columns:
+            # 旧版本创建的数据库
+            self._conn.execute('ALTER TABLE media ADD COLUMN sha256 TEXT')
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite 未编译 FTS5（或不支持 trigram）时退化为 LIKE 查询
+            self.fts = False
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, path, info, format_id=None, height=None, filesize=None, sha256=None):
+        """
+        记录一个下载完成的文件，同一路径重复下载时覆盖旧记录
+        filesize: 文件大小，文件仍在暂存目录搬运时由调用方提供
+        sha256: 下载时计算的文件摘要（可选）
+        """
+        path = os.path.abspath(path)
+        if filesize is None:
+            try:
+                filesize = os.path.getsize(path)
+            except OSError:
+                filesize = info.get('filesize') or info.get('filesize_approx')
+        metadata = {key: info.get(key) for key in METADATA_FIELDS if info.get(key) is not None}
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM media WHERE path = ?', (path,))
+            self._conn.execute(
+                'INSERT INTO media (video_id, extractor, url, title, uploader, duration, format_id, height, ext,'
+                ' filesize, path, downloaded_at, present, metadata, sha256)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?)',
+                (info.get('id'), info.get('extractor_key'), info.get('webpage_url') or info.get('original_url'),
+                 info.get('title'), info.get('uploader') or info.get('channel'), info.get('duration'),
+                 format_id or info.get('format_id'), height or info.get('height'),
+                 os.path.splitext(path)[1].lstrip('.') or info.get('ext'), filesize, path, time.time(),
+                 json.dumps(metadata, ensure_ascii=False), sha256),
+            )
+
+    def checksums(self):
+        """所有仍在库中且记录了摘要的文件: {路径: 摘要}"""
+        with self._lock:
+            return {row[0]: row[1] for row in self._conn.execute(
+                'SELECT path, sha256 FROM media WHERE present = 1 AND sha256 IS NOT NULL')}
+
+    def mark_removed(self, path):
+        """文件被删除（如下载库淘汰）时标记为不在库中，记录本身保留"""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE media SET present = 0 WHERE path = ?', (os.path.abspath(path),))
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def list(self, limit=50, include_removed=False):
+        """最近下载的记录（按时间倒序）"""
+        where = '' if include_removed else 'WHERE present = 1'
+        return self._rows(f"SELECT {', '.join(LIST_COLUMNS)} FROM media {where} "
+                          "ORDER BY downloaded_at DESC LIMIT ?", (limit,))
+
+    def search(self, query, limit=50, include_removed=False):
+        """
+        按标题/上传者全文检索，同时精确匹配视频ID和URL
+        返回: 记录列表，全文匹配按相关度排序
+        """
+        present = '' if include_removed else 'AND m.present = 1'
+        columns = ', '.join(f'm.{c}' for c in LIST_COLUMNS)
+        exact = self._rows(f"SELECT {columns} FROM media m WHERE (m.video_id = ? OR m.url = ?) {present} "
+                           "ORDER BY m.downloaded_at DESC LIMIT ?", (query, query, limit))
+        if self.fts and len(query) >= 3:
+            # trigram 分词对中文同样有效；把查询作为短语，避免用户输入被当作 FTS 语法
+            phrase = '"' + query.replace('"', '""') + '"'
+            matched = self._rows(f"SELECT {columns} FROM media_fts f JOIN media m ON m.id = f.rowid "
+                                 f"WHERE media_fts MATCH ? {present} ORDER BY rank LIMIT ?", (phrase, limit))
+        else:
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            matched = self._rows(f"SELECT {columns} FROM media m WHERE (m.title LIKE ? ESCAPE '\\' "
+                                 f"OR m.uploader LIKE ? ESCAPE '\\') {present} "
+                                 "ORDER BY m.downloaded_at DESC LIMIT ?", (pattern, pattern, limit))
+        seen = set()
+        results = []
+        for row in exact + matched:
+            if row['id'] not in seen:
+                seen.add(row['id'])
+                results.append(row)
+        return results[:limit]
+
+    def stats(self):
+        """文件数、总大小、总时长、按分辨率和上传者的分布"""
+        with self._lock:
+            total = dict(self._conn.execute(
+                'SELECT COUNT(*) AS files, COALESCE(SUM(filesize), 0) AS bytes, '
+                'COALESCE(SUM(duration), 0) AS duration, '
+                'MIN(downloaded_at) AS first, MAX(downloaded_at) AS last FROM media WHERE present = 1').fetchone())
+            total['videos'] = self._conn.execute(
+                'SELECT COUNT(*) FROM (SELECT DISTINCT video_id FROM media WHERE present = 1)').fetchone()[0]
+            total['removed'] = self._conn.execute('SELECT COUNT(*) FROM media WHERE present = 0').fetchone()[0]
+            total['by_height'] = {
+                str(row[0] or 'unknown'): row[1] for row in self._conn.execute(
+                    'SELECT height, COUNT(*) FROM media WHERE present = 1 GROUP BY height ORDER BY height DESC')
+            }
+            total['top_uploaders'] = [
+                {'uploader': row[0], 'files': row[1]} for row in self._conn.execute(
+                    'SELECT uploader, COUNT(*) AS n FROM media WHERE present = 1 AND uploader IS NOT NULL '
+                    'GROUP BY uploader ORDER BY n DESC LIMIT 10')
+            ]
+        return total
+
+class IndexRecorder:
+    """
+    在下载过程中收集每个最终文件对应的 info，下载成功后写入索引。
+    与完整性校验相同：上一个 post_hook 之后完成的格式都属于下一个最终文件。
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.files = []
+        self._pending = []
+
+    def progress_hook(self, d):
+        if d.get('status') == 'finished' and d.get('info_dict'):
+            self._pending.append(d['info_dict'])
+
+    def post_hook(self, filepath):
+        pieces, self._pending = self._pending, []
+        if pieces:
+            self.files = [f for f in self.files if f[0] != filepath] + [(filepath, pieces)]
+
+    def install(self, ydl_opts):
+        ydl_opts['progress_hooks'] = list(ydl_opts.get('progress_hooks') or []) + [self.progress_hook]
+        ydl_opts['post_hooks'] = list(ydl_opts.get('post_hooks') or []) + [self.post_hook]
+
+    def commit(self, output_dir=None, digests=None):
+        """
+        写入索引；output_dir 不为None时（暂存目录模式）记录文件在输出目录中的最终路径
+        digests: 下载时计算的 {文件路径: SHA-256}（可选）
+        """
+        for filepath, pieces in self.files:
+            path = os.path.join(output_dir, os.path.basename(filepath)) if output_dir else filepath
+            format_id = '+'.join(p.get('format_id') or '' for p in pieces)
+            height = max((p.get('height') or 0 for p in pieces), default=0) or None
+            filesize = os.path.getsize(filepath) if os.path.exists(filepath) else None
+            try:
+                self.index.add(path, pieces[0], format_id=format_id, height=height, filesize=filesize,
+                               sha256=(digests or {}).get(filepath))
+            except sqlite3.Error as e:
+                print(f"警告: 写入媒体库索引失败: {e}")
+        self.files = []
@@ -0,0 +1,289 @@
+"""
+直播录制
+跟随直播的 HLS 媒体播放列表，把新出现的分片按原样（stream copy）追加写入滚动文件:
+- 按媒体时长轮换文件（默认每小时一个），每个文件都可独立播放
+- 以媒体序号（EXT-X-MEDIA-SEQUENCE）去重和检测缺口，断线重连后从上次的序号继续
+- 播放列表地址过期（403/404/410）时重新解析直播页面获取新地址
+- 分片以流式分块写盘，内存占用与录制时长无关
+- fMP4 直播（带 EXT-X-MAP 初始化段）写为 .mp4，每个文件以初始化段开头；MPEG-TS 直播写为 .ts
+"""
+import os
+import re
+import time
+from datetime import datetime
+from urllib.parse import urljoin
+
+import requests
+import yt_dlp
+
+CHUNK_SIZE = 256 * 1024
+
+# 播放列表地址失效、需要重新解析的状态码
+EXPIRED_STATUS = (403, 404, 410)
+
+def parse_attributes(line):
+    """解析 #EXT-X-...:KEY=VALUE,KEY="VALUE" 形式的属性列表"""
+    return {key: value.strip('"') for key, value in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', line)}
+
+def parse_master_playlist(text, base_url):
+    """
+    解析主播放列表
+    返回: [(带宽, 高度, 媒体播放列表URL)]，不是主播放列表时返回空列表
+    """
+    variants = []
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if not line.startswith('#EXT-X-STREAM-INF:'):
+            continue
+        attrs = parse_attributes(line.split(':', 1)[1])
+        uri = next((l.strip() for l in lines[i + 1:] if l.strip() and not l.startswith('#')), None)
+        if uri:
+            height = int(attrs['RESOLUTION'].split('x')[1]) if 'x' in attrs.get('RESOLUTION', '') else 0
+            variants.append((int(attrs.get('BANDWIDTH', 0)), height, urljoin(base_url, uri)))
+    return variants
+
+def parse_media_playlist(text, base_url):
+    """
+    解析媒体播放列表
+    返回: {'target_duration', 'media_sequence', 'init', 'endlist', 'segments': [(序号, URL, 时长)]}
+    """
+    playlist = {'target_duration': 6.0, 'media_sequence': 0, 'init': None, 'endlist': False, 'segments': []}
+    seq = None
+    duration = 0.0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist['target_duration'] = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist['media_sequence'] = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = parse_attributes(line.split(':', 1)[1]).get('URI')
+            playlist['init'] = urljoin(base_url, uri) if uri else None
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',')[0] or 0)
+        elif line.startswith('#EXT-X-ENDLIST'):
+            playlist['endlist'] = True
+        elif not line.startswith('#'):
+            if seq is None:
+                seq = playlist['media_sequence']
+            playlist['segments'].append((seq, urljoin(base_url, line), duration))
+            seq += 1
+            duration = 0.0
+    return playlist
+
+def resolve_live_playlist(page_url, ydl_opts=None, max_height=None):
+    """
+    解析直播页面，返回 (媒体播放列表URL, HTTP头)
+    直接给出 .m3u8 地址时不经过 yt-dlp 解析
+    """
+    if '.m3u8' in page_url:
+        return page_url, {}
+    opts = {'quiet': True, 'skip_download': True, **(ydl_opts or {})}
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(page_url, download=False)
+    formats = [f for f in info.get('formats') or []
+               if (f.get('protocol') or '').startswith('m3u8') and f.get('url')
+               and (not max_height or (f.get('height') or 0) <= max_height)]
+    if not formats:
+        raise yt_dlp.utils.DownloadError("未找到可录制的HLS直播流")
+    # yt-dlp 的格式按质量从低到高排列，优先选择同时含音视频的流
+    muxed = [f for f in formats if f.get('acodec', 'none') != 'none' and f.get('vcodec', 'none') != 'none']
+    best = (muxed or formats)[-1]
+    return best['url'], best.get('http_headers') or {}
+
+class LiveRecorder:
+    """
+    直播录制器
+
+    参数:
+      page_url: 直播页面地址或 .m3u8 地址
+      output_dir: 输出目录
+      name: 输出文件名前缀
+      segment_time: 每个输出文件的媒体时长（秒）
+      idle_timeout: 超过该秒数没有新分片时认为直播已结束
+      max_height: 最高分辨率（可选）
+      ydl_opts: 解析直播页面时使用的 yt-dlp 参数（认证、代理等）
+      proxy: 下载分片使用的代理
+    """
+
+    def __init__(self, page_url, output_dir, name, segment_time=3600, idle_timeout=300,
+                 max_height=None, ydl_opts=None, proxy=None, timeout=30, retries=5):
+        self.page_url = page_url
+        self.output_dir = output_dir
+        self.name = name
+        self.segment_time = segment_time
+        self.idle_timeout = idle_timeout
+        self.max_height = max_height
+        self.ydl_opts = ydl_opts or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.session = requests.Session()
+        if proxy:
+            self.session.proxies = {'http': proxy, 'https': proxy}
+        self.playlist_url = None
+        self.last_seq = None
+        self.stopped = False
+        self._file = None
+        self._file_path = None
+        self._file_media_time = 0.0
+        self._init_url = None
+        self._init_data = None
+        self.stats = {'segments': 0, 'bytes': 0, 'files': [], 'gaps': 0, 'missed_segments': 0, 'reconnects': 0}
+
+    def stop(self):
+        self.stopped = True
+
+    def _resolve(self):
+        """（重新）解析播放列表地址，主播放列表时选择带宽最高的变体"""
+        url, headers = resolve_live_playlist(self.page_url, self.ydl_opts, self.max_height)
+        self.session.headers.update(headers)
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        variants = parse_master_playlist(response.text, response.url)
+        if variants:
+            if self.max_height:
+                variants = [v for v in variants if not v[1] or v[1] <= self.max_height] or variants
+            url = max(variants)[2]
+        self.playlist_url = url
+
+    def _fetch_playlist(self):
+        response = self.session.get(self.playlist_url, timeout=self.timeout)
+        response.raise_for_status()
+        return parse_media_playlist(response.text, response.url)
+
+    def _open_file(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        part = len(self.stats['files']) + 1
+        # 初始化段 + 各 .m4s 分片拼接起来就是分片式 MP4
+        ext = 'mp4' if self._init_data else 'ts'
+        self._file_path = os.path.join(self.output_dir, f"{self.name}_{stamp}_{part:03d}.{ext}")
+        self._file = open(self._file_path + '.part', 'wb')
+        self._file_media_time = 0.0
+        if self._init_data:
+            # fMP4 分片需要初始化段，每个文件都写一份以便独立播放
+            self._file.write(self._init_data)
+        print(f"开始写入: {self._file_path}")
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._file_path + '.part', self._file_path)
+        self.stats['files'].append(self._file_path)
+        print(f"文件已完成: {self._file_path}（{self._file_media_time / 60:.1f}分钟）")
+        self._file = None
+
+    def _download_segment(self, url):
+        """把分片流式追加到当前文件，失败时回滚到分片开始的位置重试"""
+        start = self._file.tell()
+        for attempt in range(1, self.retries + 1):
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        self._file.write(chunk)
+                return self._file.tell() - start
+            except requests.RequestException as e:
+                self._file.seek(start)
+                self._file.truncate()
+                print(f"分片下载失败（第{attempt}次）: {e}")
+                time.sleep(min(2 ** attempt, 10))
+        return None
+
+    def _fetch_init(self, url):
+        """下载 fMP4 初始化段，与分片相同的重试退避，全部失败时抛出最后一次的异常"""
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                return response.content
+            except requests.RequestException as e:
+                print(f"初始化段下载失败（第{attempt}次）: {e}")
+                if attempt == self.retries:
+                    raise
+                time.sleep(min(2 ** attempt, 10))
+
+    def _update_init(self, playlist):
+        """初始化段地址变化时（首次或重新解析后）重新下载，内容不同则从新文件开始写"""
+        if not playlist['init'] or playlist['init'] == self._init_url:
+            return
+        data = self._fetch_init(playlist['init'])
+        self._init_url = playlist['init']
+        if data != self._init_data:
+            if self._init_data is not None:
+                self._close_file()
+            self._init_data = data
+
+    def _record_segments(self, playlist):
+        """写入播放列表中尚未录制的分片，返回新写入的分片数"""
+        new_segments = [s for s in playlist['segments'] if self.last_seq is None or s[0] > self.last_seq]
+        if new_segments and self.last_seq is not None and new_segments[0][0] > self.last_seq + 1:
+            missed = new_segments[0][0] - self.last_seq - 1
+            self.stats['gaps'] += 1
+            self.stats['missed_segments'] += missed
+            print(f"警告: 直播窗口已滑过 {missed} 个分片，录像存在缺口")
+
+        for seq, url, duration in new_segments:
+            if self.stopped:
+                break
+            if self._file is None or self._file_media_time >= self.segment_time:
+                self._close_file()
+                self._open_file()
+            nbytes = self._download_segment(url)
+            self.last_seq = seq
+            if nbytes is None:
+                self.stats['missed_segments'] += 1
+                continue
+            self._file_media_time += duration
+            self.stats['segments'] += 1
+            self.stats['bytes'] += nbytes
+            self._file.flush()
+        return len(new_segments)
+
+    def record(self):
+        """
+        录制直到直播结束（ENDLIST 或长时间无新分片）或调用 stop()
+        返回: 统计信息
+        """
+        last_progress = time.monotonic()
+        backoff = 1
+        try:
+            while not self.stopped:
+                try:
+                    if self.playlist_url is None:
+                        self._resolve()
+                    playlist = self._fetch_playlist()
+                    self._update_init(playlist)
+                    backoff = 1
+                except (requests.RequestException, yt_dlp.utils.DownloadError) as e:
+                    status = getattr(getattr(e, 'response', None), 'status_code', None)
+                    if status in EXPIRED_STATUS or isinstance(e, yt_dlp.utils.DownloadError):
+                        self.playlist_url = None  # 地址过期，下次重新解析
+                    self.stats['reconnects'] += 1
+                    if time.monotonic() - last_progress > self.idle_timeout:
+                        print(f"超过 {self.idle_timeout} 秒无法获取直播数据，停止录制")
+                        break
+                    print(f"获取直播播放列表失败，{backoff}秒后重连: {e}")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 30)
+                    continue
+
+                if self._record_segments(playlist):
+                    last_progress = time.monotonic()
+                if playlist['endlist']:
+                    print("直播已结束")
+                    break
+                if time.monotonic() - last_progress > self.idle_timeout:
+                    print(f"超过 {self.idle_timeout} 秒没有新分片，认为直播已结束")
+                    break
+                # HLS 规范建议以目标时长为间隔刷新播放列表，这里取一半以减少延迟
+                time.sleep(max(playlist['target_duration'] / 2, 0.5))
+        except KeyboardInterrupt:
+            print("\n录制已手动停止")
+        finally:
+            self._close_file()
+            self.session.close()
+        return self.stats
@@ -0,0 +1,239 @@
+"""
+媒体文件探测
+通过 ffprobe 只读取容器头信息（时长、编码、码率、采样率、声道、分辨率、帧率），不解码，速度很快；
+结果按 (路径, 大小, 修改时间) 缓存，同一文件在一次转换中多次查询只调用一次 ffprobe。
+另提供只解码关键帧的快速扫描，用于发现数据损坏。
+"""
+import copy
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+
+# 探测结果缓存: (绝对路径, 大小, 修改时间) -> 结果，文件被改写后键随之变化
+PROBE_CACHE_SIZE = 256
+_probe_cache = OrderedDict()
+_probe_cache_lock = threading.Lock()
+
+class MediaProbeError(Exception):
+    """ffprobe/ffmpeg 不可用或无法解析文件"""
+
+def find_tool(name):
+    """
+    查找 ffprobe/ffmpeg 可执行文件，找不到时返回None
+    系统中没有 ffmpeg 时使用 imageio-ffmpeg 自带的可执行文件（moviepy 的依赖）
+    """
+    path = shutil.which(name)
+    if path or name != 'ffmpeg':
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _frame_rate(value):
+    """ffprobe 的帧率字段（如 "30000/1001"）转为浮点数"""
+    if not value:
+        return None
+    num, _, den = str(value).partition('/')
+    num, den = _to_float(num), _to_float(den or 1)
+    return round(num / den, 3) if num and den else None
+
+def probe_media(path, timeout=30, use_cache=True):
+    """
+    读取媒体文件的容器和流信息（结果按路径、大小和修改时间缓存）
+    返回:
+      {'duration': 秒或None, 'size': 字节, 'format_name': 容器格式,
+       'bit_rate': 总码率或None,
+       'streams': [{'index', 'codec_type', 'codec_name', 'duration', 'bit_rate',
+                    'sample_rate', 'channels', 'width', 'height', 'frame_rate'}]}
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise MediaProbeError(f"无法读取文件: {e}")
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if use_cache:
+        with _probe_cache_lock:
+            if key in _probe_cache:
+                _probe_cache.move_to_end(key)
+                return copy.deepcopy(_probe_cache[key])
+
+    ffprobe = find_tool('ffprobe')
+    if not ffprobe:
+        raise MediaProbeError("未找到 ffprobe")
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise MediaProbeError(f"ffprobe 超时: {path}")
+    if result.returncode != 0:
+        raise MediaProbeError(result.stderr.strip() or f"ffprobe 返回 {result.returncode}")
+    try:
+        data = json.loads(result.stdout)
+    except ValueError:
+        raise MediaProbeError("无法解析 ffprobe 输出")
+
+    fmt = data.get('format') or {}
+    info = {
+        'duration': _to_float(fmt.get('duration')),
+        'size': int(fmt.get('size') or 0),
+        'format_name': fmt.get('format_name'),
+        'bit_rate': _to_int(fmt.get('bit_rate')),
+        'streams': [
+            {
+                'index': s.get('index'),
+                'codec_type': s.get('codec_type'),
+                'codec_name': s.get('codec_name'),
+                'duration': _to_float(s.get('duration')),
+                'bit_rate': _to_int(s.get('bit_rate')),
+                'sample_rate': _to_int(s.get('sample_rate')),
+                'channels': _to_int(s.get('channels')),
+                'width': _to_int(s.get('width')),
+                'height': _to_int(s.get('height')),
+                'frame_rate': _frame_rate(s.get('avg_frame_rate')) or _frame_rate(s.get('r_frame_rate')),
+            }
+            for s in data.get('streams') or []
+        ],
+    }
+    with _probe_cache_lock:
+        _probe_cache[key] = info
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    return copy.deepcopy(info)
+
+def first_stream(info, codec_type):
+    """取第一个指定类型（'video'/'audio'）的流，没有时返回空字典"""
+    return next((s for s in (info or {}).get('streams', []) if s['codec_type'] == codec_type), {})
+
+_channel_layouts = None
+
+def channel_layouts():
+    """ffmpeg 标准声道布局名 -> 声道数（如 mono 1、5.1(side) 6），读取 ffmpeg -layouts"""
+    global _channel_layouts
+    if _channel_layouts is None:
+        ffmpeg = find_tool('ffmpeg')
+        if not ffmpeg:
+            raise MediaProbeError("未找到 ffmpeg")
+        result = subprocess.run([ffmpeg, '-hide_banner', '-layouts'], capture_output=True, text=True, timeout=30)
+        layouts = {}
+        standard = False
+        for line in result.stdout.splitlines():
+            if line.startswith('Standard channel layouts'):
+                standard = True
+            elif standard and len(line.split()) == 2 and line.split()[0] != 'NAME':
+                name, decomposition = line.split()
+                layouts[name] = decomposition.count('+') + 1
+        _channel_layouts = layouts
+    return _channel_layouts
+
+def ffmpeg_audio_stream(path, timeout=30):
+    """
+    ffprobe 不可用或没有给出采样率/声道数时，从 ffmpeg 的输入流信息行读取第一条音轨的参数
+    （如 "Audio: aac (LC), 48000 Hz, 5.1(side), fltp"）
+    返回: {'sample_rate', 'channels'}，取不到的值为None；文件没有音轨时返回空字典
+    """
+    ffmpeg = find_tool('ffmpeg')
+    if not ffmpeg:
+        raise MediaProbeError("未找到 ffmpeg")
+    try:
+        # 不指定输出时 ffmpeg 打印输入信息后以非零状态退出，只需要它的 stderr
+        result = subprocess.run([ffmpeg, '-hide_banner', '-nostdin', '-i', path],
+                                capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise MediaProbeError(f"ffmpeg 读取流信息超时: {path}")
+    line = next((l for l in result.stderr.splitlines() if l.lstrip().startswith('Stream #') and ': Audio: ' in l), None)
+    if line is None:
+        return {}
+    match = re.search(r'(\d+) Hz, ([^,]+)', line)
+    if not match:
+        return {'sample_rate': None, 'channels': None}
+    layout = match.group(2).strip()
+    channels = re.fullmatch(r'(\d+) channels', layout)
+    return {
+        'sample_rate': int(match.group(1)),
+        'channels': int(channels.group(1)) if channels else channel_layouts().get(layout),
+    }
+
+def keyframe_scan(path, timeout=300):
+    """
+    只解码关键帧扫描整个文件（比完整解码快一个数量级）
+    返回: 解码器报告的错误行列表，为空表示未发现损坏
+    """
+    ffmpeg = find_tool('ffmpeg')
+    if not ffmpeg:
+        raise MediaProbeError("未找到 ffmpeg")
+    try:
+        result = subprocess.run(
+            [ffmpeg, '-nostdin', '-v', 'error', '-skip_frame', 'nokey', '-i', path,
+             '-map', '0:v?', '-map', '0:a?', '-f', 'null', '-'],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise MediaProbeError(f"关键帧扫描超时: {path}")
+    errors = [line for line in result.stderr.splitlines() if line.strip()]
+    if result.returncode != 0 and not errors:
+        errors.append(f"ffmpeg 返回 {result.returncode}")
+    return errors
+
+def keyframe_times(path, timeout=600):
+    """
+    视频关键帧的时间点（秒，升序）
+    优先用 ffprobe 读取数据包标志（只解复用、不解码）；
+    不可用时用 ffmpeg 只解码关键帧并读取 showinfo 输出
+    """
+    times = []
+    ffprobe = find_tool('ffprobe')
+    if ffprobe:
+        try:
+            result = subprocess.run(
+                [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+                 '-of', 'csv=print_section=0', path],
+                capture_output=True, text=True, timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise MediaProbeError(f"读取关键帧超时: {path}")
+        for line in result.stdout.splitlines():
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags:
+                try:
+                    times.append(float(pts_time))
+                except ValueError:
+                    pass
+    if not times:
+        ffmpeg = find_tool('ffmpeg')
+        if not ffmpeg:
+            raise MediaProbeError("未找到 ffmpeg")
+        try:
+            result = subprocess.run(
+                [ffmpeg, '-nostdin', '-hide_banner', '-skip_frame', 'nokey', '-i', path,
+                 '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-'],
+                capture_output=True, text=True, timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise MediaProbeError(f"读取关键帧超时: {path}")
+        for line in result.stderr.splitlines():
+            if 'Parsed_showinfo' in line and 'pts_time:' in line:
+                try:
+                    times.append(float(line.split('pts_time:')[1].split()[0]))
+                except (IndexError, ValueError):
+                    pass
+    return sorted(set(times))
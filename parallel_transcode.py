@@ -0,0 +1,252 @@
+"""
+分段并行视频转码
+单个 libx264 编码进程无法用满多核机器，长视频按关键帧切成若干段并行编码:
+1. 读取关键帧时间点，按时长均分选出切分点（切分点都落在关键帧上）
+2. 视频流按切分点无损切段（-c copy，只有读写开销）
+3. 各段由独立的 ffmpeg 进程同时编码；音频只单独编码一次，与视频段同时进行
+4. 用 concat 分离器按顺序无损拼接各段并混入音轨
+短视频或只有一个并行进程时直接单次编码；
+源编码与目标容器兼容且无需变速时不编码，只做无损封装转换。
+"""
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from ffmpeg_runner import run_ffmpeg
+from media_probe import MediaProbeError, keyframe_times, probe_media
+
+# 每段的最短时长（秒），太短的段编码器启动开销占比过高
+MIN_SEGMENT_SECONDS = 30
+# 段数为并行数的倍数，内容复杂度不均时各进程负载更平衡
+SEGMENTS_PER_JOB = 2
+
+# 输出容器 -> (视频编码参数, 音频编码参数)
+# libx264 固定输出 yuv420p：4:4:4 或 10 位的源默认会编码成 High 4:4:4 / High 10，浏览器和手机无法播放
+VIDEO_CODEC_MAPPING = {
+    'mp4': (['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'], ['-c:a', 'aac', '-b:a', '160k']),
+    'm4v': (['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'], ['-c:a', 'aac', '-b:a', '160k']),
+    'mov': (['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'], ['-c:a', 'aac', '-b:a', '160k']),
+    'mkv': (['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'], ['-c:a', 'aac', '-b:a', '160k']),
+    'flv': (['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'], ['-c:a', 'aac', '-b:a', '160k']),
+    'avi': (['-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p'], ['-c:a', 'libmp3lame', '-b:a', '192k']),
+    'webm': (['-c:v', 'libvpx-vp9', '-crf', '32', '-b:v', '0', '-row-mt', '1'], ['-c:a', 'libopus', '-b:a', '128k']),
+    'wmv': (['-c:v', 'wmv2', '-q:v', '4'], ['-c:a', 'wmav2', '-b:a', '192k']),
+}
+
+# 各容器可直接封装（无需重新编码）的编码格式: 容器 -> (视频编码集合, 音频编码集合)，None 表示不限
+_MP4_VIDEO = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+_MP4_AUDIO = {'aac', 'mp3', 'alac', 'opus', 'flac', 'ac3', 'eac3'}
+REMUX_COMPATIBILITY = {
+    'mp4': (_MP4_VIDEO, _MP4_AUDIO),
+    'm4v': (_MP4_VIDEO, _MP4_AUDIO),
+    'mov': ({'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, {'aac', 'alac', 'mp3', 'pcm_s16le', 'pcm_s24le'}),
+    'mkv': (None, None),
+    'webm': ({'vp8', 'vp9', 'av1'}, {'vorbis', 'opus'}),
+    'flv': ({'h264', 'flv1'}, {'aac', 'mp3'}),
+    'avi': ({'h264', 'mpeg4', 'msmpeg4v3', 'mjpeg'}, {'mp3', 'ac3', 'pcm_s16le'}),
+    'wmv': ({'wmv1', 'wmv2', 'wmv3', 'vc1'}, {'wmav1', 'wmav2'}),
+}
+
+def remux_compatible(info, output_format):
+    """源文件的首个视频流和音频流（即输出会包含的流）能否直接封装进目标容器"""
+    if output_format not in REMUX_COMPATIBILITY:
+        return False
+    video_codecs, audio_codecs = REMUX_COMPATIBILITY[output_format]
+    video = next((s for s in info['streams'] if s['codec_type'] == 'video'), None)
+    audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'), None)
+    if video is None:
+        return False
+    if video_codecs is not None and video['codec_name'] not in video_codecs:
+        return False
+    if audio is not None and audio_codecs is not None and audio['codec_name'] not in audio_codecs:
+        return False
+    return True
+
+def plan_segments(keyframes, duration, segments):
+    """
+    在关键帧中选出切分点，使各段时长尽量相等
+    返回: 切分时间点列表（不含0），为空表示不切分
+    """
+    if segments <= 1 or not duration:
+        return []
+    segments = min(segments, int(duration // MIN_SEGMENT_SECONDS))
+    cuts = []
+    candidates = [t for t in keyframes if MIN_SEGMENT_SECONDS <= t <= duration - MIN_SEGMENT_SECONDS]
+    for i in range(1, segments):
+        target = duration * i / segments
+        # 离目标最近、且与上一个切分点相距足够远的关键帧
+        last = cuts[-1] if cuts else 0
+        usable = [t for t in candidates if t - last >= MIN_SEGMENT_SECONDS]
+        if not usable:
+            break
+        cuts.append(min(usable, key=lambda t: abs(t - target)))
+    return cuts
+
+# 编码器 -> 产生的编码格式（用于检查编码配置与输出容器是否兼容）
+ENCODER_CODECS = {
+    'libx264': 'h264', 'h264_nvenc': 'h264', 'h264_qsv': 'h264', 'h264_videotoolbox': 'h264', 'h264_vaapi': 'h264',
+    'libx265': 'hevc', 'hevc_nvenc': 'hevc', 'hevc_qsv': 'hevc', 'hevc_videotoolbox': 'hevc', 'hevc_vaapi': 'hevc',
+    'libvpx': 'vp8', 'libvpx-vp9': 'vp9', 'libaom-av1': 'av1', 'libsvtav1': 'av1', 'mpeg4': 'mpeg4',
+    'wmv2': 'wmv2', 'aac': 'aac', 'libfdk_aac': 'aac', 'libmp3lame': 'mp3', 'libopus': 'opus',
+    'libvorbis': 'vorbis', 'flac': 'flac', 'wmav2': 'wmav2', 'ac3': 'ac3',
+}
+
+def encoder_args(output_format, profile=None):
+    """
+    编码参数
+    profile: 编码配置（见 encoding_profiles），为None时使用容器的默认编码参数
+    返回: (视频编码参数, 音频编码参数, 视频滤镜列表)
+    编码配置的编码器不能放进目标容器时抛出 ValueError
+    """
+    if not profile:
+        video_args, audio_args = VIDEO_CODEC_MAPPING.get(output_format, VIDEO_CODEC_MAPPING['mp4'])
+        return list(video_args), list(audio_args), []
+
+    video_codecs, audio_codecs = REMUX_COMPATIBILITY.get(output_format, (None, None))
+    for encoder, allowed in ((profile.get('video_codec'), video_codecs), (profile.get('audio_codec'), audio_codecs)):
+        codec = ENCODER_CODECS.get(encoder)
+        if allowed is not None and codec is not None and codec not in allowed:
+            raise ValueError(f"编码配置 {profile.get('name', '')} 的编码器 {encoder} 不能用于 {output_format} 容器")
+
+    video_args = ['-c:v', profile.get('video_codec') or 'libx264']
+    for option, key in (('-preset', 'preset'), ('-tune', 'tune'), ('-crf', 'crf'), ('-b:v', 'video_bitrate'),
+                        ('-threads', 'threads')):
+        if profile.get(key) is not None:
+            video_args += [option, str(profile[key])]
+    video_args += [str(arg) for arg in profile.get('extra_args') or []]
+    audio_args = ['-c:a', profile.get('audio_codec') or 'aac']
+    if profile.get('audio_bitrate'):
+        audio_args += ['-b:a', str(profile['audio_bitrate'])]
+    filters = []
+    if profile.get('max_height'):
+        # 只缩小不放大，宽度按比例取偶数
+        filters.append(f"scale=-2:'min(ih,{int(profile['max_height'])})'")
+    return video_args, audio_args, filters
+
+def video_filter_args(speed, filters=()):
+    """视频滤镜参数：编码配置的滤镜（如缩放）加变速（调整时间戳，帧率随之变化）"""
+    filters = list(filters) + ([] if speed == 1.0 else [f"setpts=PTS/{speed:.6g}"])
+    return ['-vf', ','.join(filters)] if filters else []
+
+def transcode(input_file, output_file, speed=1.0, jobs=None, audio_filters=None, show_progress=True, info=None,
+              allow_remux=True, telemetry=None, profile=None):
+    """
+    转换视频，失败时抛出 FFmpegError
+    未指定编码配置、不变速、不加滤镜且源编码可直接放进目标容器时只做无损封装转换
+    （-c copy，只有读写开销），否则重新编码
+    参数:
+      jobs: 并行编码进程数，默认等于CPU核数；为1时单次编码
+      audio_filters: 音频滤镜列表（如变速用的 atempo 链），由调用方根据 speed 生成
+      info: 已读取的输入文件信息（可选，省去一次 ffprobe）
+      allow_remux: False 时总是重新编码
+      telemetry: ProgressTelemetry，输出 NDJSON 进度事件（分段模式下每段单独报告，另有整体的 start/end）
+      profile: 编码配置（编码器、preset、CRF、线程数、最大高度、音频参数），指定时总是重新编码
+    返回: 实际采用的方式，'remux'、'parallel' 或 'encode'
+    """
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    output_format = os.path.splitext(output_file)[1][1:].lower()
+    video_args, audio_args, scale_filters = encoder_args(output_format, profile)
+    audio_args = (['-af', ','.join(audio_filters)] if audio_filters else []) + audio_args
+    faststart = ['-movflags', '+faststart'] if output_format in ('mp4', 'm4v', 'mov') else []
+
+    if info is None:
+        try:
+            info = probe_media(input_file)
+        except MediaProbeError:
+            info = {'duration': None, 'streams': []}
+    duration = info['duration']
+    label = os.path.basename(input_file)
+    has_audio = any(s['codec_type'] == 'audio' for s in info['streams'])
+
+    video = next((s for s in info['streams'] if s['codec_type'] == 'video'), {})
+    # 指定了编码配置就按配置重新编码（配置的编码器、CRF、附加参数都要生效），不做封装转换
+    if (allow_remux and profile is None and speed == 1.0 and not audio_filters
+            and remux_compatible(info, output_format)):
+        # Apple 播放器只识别 hvc1 标记的 HEVC
+        tag = ['-tag:v', 'hvc1'] if video['codec_name'] == 'hevc' and output_format in ('mp4', 'm4v', 'mov') else []
+        run_ffmpeg(['-y', '-v', 'error', '-i', input_file, '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy',
+                    *tag, *faststart, output_file],
+                   duration=duration, desc="封装转换", show_progress=show_progress, telemetry=telemetry, label=label)
+        return 'remux'
+    cuts = []
+    if jobs > 1 and duration and duration >= MIN_SEGMENT_SECONDS * 2:
+        try:
+            cuts = plan_segments(keyframe_times(input_file), duration, jobs * SEGMENTS_PER_JOB)
+        except MediaProbeError:
+            cuts = []
+
+    if not cuts:
+        run_ffmpeg(['-y', '-v', 'error', '-i', input_file, '-map', '0:v:0', '-map', '0:a:0?',
+                    *video_filter_args(speed, scale_filters), *video_args, *audio_args, *faststart, output_file],
+                   duration=duration / speed if duration else None, show_progress=show_progress,
+                   telemetry=telemetry, label=label)
+        return 'encode'
+
+    start = time.monotonic()
+    if telemetry:
+        telemetry.emit('start', file=label, duration=duration / speed, segments=len(cuts) + 1)
+    work_dir = tempfile.mkdtemp(prefix='.transcode_', dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        # 1. 按关键帧无损切段
+        run_ffmpeg(['-y', '-v', 'error', '-i', input_file, '-map', '0:v:0', '-c', 'copy',
+                    '-f', 'segment', '-segment_times', ','.join(f"{t - 0.001:.3f}" for t in cuts),
+                    '-reset_timestamps', '1', os.path.join(work_dir, 'src_%04d.mkv')], show_progress=False)
+        sources = sorted(name for name in os.listdir(work_dir) if name.startswith('src_'))
+        bounds = [0.0] + cuts + [duration]
+        lengths = [bounds[i + 1] - bounds[i] for i in range(len(sources))] if len(sources) == len(cuts) + 1 \
+            else [duration / len(sources)] * len(sources)
+
+        # 2. 各段并行编码，音频单独编码一次；编码配置未指定线程数时，每个 ffmpeg 分到的线程数按并行数均分
+        threads = [] if '-threads' in video_args else ['-threads', str(max(1, (os.cpu_count() or 1) // jobs))]
+
+        def encode_segment(name):
+            # 编码后的段使用与最终输出相同的容器，帧率/时间戳处理与单次编码一致
+            encoded = os.path.join(work_dir, name.replace('src_', 'enc_').replace('.mkv', '.' + output_format))
+            run_ffmpeg(['-y', '-v', 'error', '-i', os.path.join(work_dir, name), '-map', '0:v:0',
+                        *video_filter_args(speed, scale_filters), *video_args, *threads, encoded], show_progress=False,
+                       telemetry=telemetry, label=f"{label}#{name[4:8]}")
+            return encoded
+
+        audio_file = os.path.join(work_dir, 'audio.mka')
+
+        def encode_audio():
+            run_ffmpeg(['-y', '-v', 'error', '-i', input_file, '-map', '0:a:0', '-vn', *audio_args, audio_file],
+                       show_progress=False, telemetry=telemetry, label=f"{label}#audio")
+
+        with ThreadPoolExecutor(max_workers=jobs + 1) as executor, \
+                tqdm(total=round(duration, 1), desc="分段编码", unit="秒", disable=not show_progress) as pbar:
+            audio_future = executor.submit(encode_audio) if has_audio else None
+            futures = [executor.submit(encode_segment, name) for name in sources]
+            encoded = []
+            for future, length in zip(futures, lengths):
+                encoded.append(future.result())
+                pbar.update(round(length, 1))
+                pbar.set_postfix_str(f"{pbar.n / speed / (time.monotonic() - start):.1f}x实时")
+            if audio_future:
+                audio_future.result()
+
+        # 3. concat 分离器无损拼接
+        list_file = os.path.join(work_dir, 'concat.txt')
+        with open(list_file, 'w', encoding='utf-8') as f:
+            for path in encoded:
+                f.write("file '" + path.replace("'", "'\\''") + "'\n")
+        args = ['-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_file]
+        if has_audio:
+            args += ['-i', audio_file, '-map', '0:v:0', '-map', '1:a:0']
+        run_ffmpeg(args + ['-c', 'copy', *faststart, output_file], show_progress=False)
+        if telemetry:
+            elapsed = time.monotonic() - start
+            telemetry.emit('end', file=label, status='ok', method='parallel', elapsed=round(elapsed, 2),
+                           media_seconds=round(duration / speed, 2), realtime=round(duration / speed / elapsed, 2))
+        return 'parallel'
+    except BaseException as e:
+        if telemetry:
+            telemetry.emit('end', file=label, status='failed', method='parallel',
+                           elapsed=round(time.monotonic() - start, 2), error=(str(e).strip().splitlines() or [''])[-1])
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
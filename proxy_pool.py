@@ -0,0 +1,208 @@
+"""
+代理池
+从配置读取多个代理，后台定期探测健康状况，按延迟/吞吐/错误率打分选择代理:
+- 同一个下载任务固定使用同一个代理（粘性分配），失败时才切换
+- 连续失败达到阈值的代理被剔除，后台探测恢复后自动重新加入
+- 没有可用代理时返回 None，即直连（与原先禁用代理的回退行为一致）
+"""
+import threading
+import time
+
+import requests
+
+class ProxyState:
+    """单个代理的统计状态"""
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None      # 探测延迟（秒，指数滑动平均）
+        self.throughput = None   # 下载吞吐（字节/秒，指数滑动平均）
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected = False
+        self.ejected_at = 0.0
+        self.assigned = 0        # 当前粘性分配到该代理的任务数
+
+    def error_rate(self):
+        total = self.successes + self.failures
+        return self.failures / total if total else 0.0
+
+class ProxyPool:
+    """
+    代理池（线程安全）
+
+    参数:
+      proxies: 代理URL列表，如 ['http://10.0.0.1:3128', 'socks5://10.0.0.2:1080']
+      probe_url: 健康探测地址（可指向本地替身服务器做测试）
+      probe_interval: 后台探测间隔（秒）
+      probe_timeout: 单次探测超时（秒）
+      eject_after: 连续失败多少次后剔除
+      readmit_after: 剔除后至少等待多久才允许探测恢复（秒）
+      alpha: 延迟/吞吐滑动平均系数
+    """
+
+    def __init__(self, proxies, probe_url='https://www.youtube.com/generate_204',
+                 probe_interval=60, probe_timeout=10, eject_after=3,
+                 readmit_after=120, alpha=0.3):
+        self.probe_url = probe_url
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.eject_after = eject_after
+        self.readmit_after = readmit_after
+        self.alpha = alpha
+        self._states = {url: ProxyState(url) for url in proxies}
+        self._assignments = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ewma(self, old, new):
+        return new if old is None else self.alpha * new + (1 - self.alpha) * old
+
+    def start(self):
+        """先同步探测一轮，再启动后台探测线程"""
+        self.probe_all()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._probe_loop, name='proxy-probe', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.probe_timeout)
+            self._thread = None
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe_all()
+
+    def probe(self, url):
+        """
+        通过指定代理请求 probe_url，记录延迟
+        只有 2xx/3xx 算成功：407（代理要求认证）等 4xx 说明代理本身不可用，
+        HTTPS 地址的 CONNECT 被拒绝时 requests 抛出 ProxyError，同样算失败
+        返回: 是否成功
+        """
+        start = time.monotonic()
+        try:
+            response = requests.get(self.probe_url, proxies={'http': url, 'https': url},
+                                    timeout=self.probe_timeout, stream=True)
+            response.close()
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.monotonic() - start
+
+        with self._lock:
+            state = self._states[url]
+            if ok:
+                state.latency = self._ewma(state.latency, elapsed)
+                state.consecutive_failures = 0
+                if state.ejected and time.monotonic() - state.ejected_at >= self.readmit_after:
+                    state.ejected = False
+                    print(f"代理恢复可用: {url}")
+            else:
+                self._mark_failure(state)
+        return ok
+
+    def probe_all(self):
+        """并行探测所有代理"""
+        threads = [threading.Thread(target=self.probe, args=(url,), daemon=True) for url in self._states]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _mark_failure(self, state):
+        state.failures += 1
+        state.consecutive_failures += 1
+        if not state.ejected and state.consecutive_failures >= self.eject_after:
+            state.ejected = True
+            state.ejected_at = time.monotonic()
+            print(f"代理连续失败 {state.consecutive_failures} 次，已剔除: {state.url}")
+
+    def _score(self, state):
+        """分数越低越好：延迟按错误率放大，吞吐越高越好，并按当前负载分摊"""
+        latency = state.latency if state.latency is not None else self.probe_timeout
+        score = latency * (1 + 4 * state.error_rate())
+        if state.throughput:
+            score /= max(state.throughput / 1e6, 0.1)
+        return score * (1 + 0.5 * state.assigned)
+
+    def _pick(self, exclude=None):
+        candidates = [s for s in self._states.values() if not s.ejected and s.url != exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=self._score)
+
+    def acquire(self, job_key):
+        """为任务分配代理（粘性），无可用代理时返回 None 表示直连"""
+        with self._lock:
+            url = self._assignments.get(job_key)
+            if url is not None:
+                if not self._states[url].ejected:
+                    return url
+                self._states[url].assigned -= 1
+            state = self._pick()
+            if state is None:
+                self._assignments.pop(job_key, None)
+                return None
+            state.assigned += 1
+            self._assignments[job_key] = state.url
+            return state.url
+
+    def release(self, job_key):
+        """任务结束，释放粘性分配"""
+        with self._lock:
+            url = self._assignments.pop(job_key, None)
+            if url is not None:
+                self._states[url].assigned -= 1
+
+    def reassign(self, job_key):
+        """当前代理对该任务失败，记录失败并换一个代理（可能返回 None 表示直连）"""
+        with self._lock:
+            current = self._assignments.pop(job_key, None)
+            if current is not None:
+                state = self._states[current]
+                state.assigned -= 1
+                self._mark_failure(state)
+            new_state = self._pick(exclude=current)
+            if new_state is None:
+                return None
+            new_state.assigned += 1
+            self._assignments[job_key] = new_state.url
+            return new_state.url
+
+    def report_success(self, url, nbytes=None, seconds=None):
+        """记录一次成功的下载，可附带字节数和耗时以更新吞吐"""
+        if url not in self._states:
+            return
+        with self._lock:
+            state = self._states[url]
+            state.successes += 1
+            state.consecutive_failures = 0
+            if nbytes and seconds:
+                state.throughput = self._ewma(state.throughput, nbytes / seconds)
+
+    def report_failure(self, url):
+        if url not in self._states:
+            return
+        with self._lock:
+            self._mark_failure(self._states[url])
+
+    def metrics(self):
+        """各代理当前的评分数据"""
+        with self._lock:
+            return {
+                url: {
+                    'ejected': state.ejected,
+                    'latency': round(state.latency, 3) if state.latency is not None else None,
+                    'throughput': round(state.throughput) if state.throughput else None,
+                    'successes': state.successes,
+                    'failures': state.failures,
+                    'error_rate': round(state.error_rate(), 3),
+                    'assigned': state.assigned,
+                }
+                for url, state in self._states.items()
+            }
@@ -0,0 +1,91 @@
+"""
+本地暂存目录
+下载中的 .part 文件、分片和合并用的临时文件全部写在暂存目录（如本地SSD或tmpfs），
+完成后由后台线程移动到最终输出目录（如网络挂载盘）:
+- 同一文件系统时直接 os.replace
+- 跨文件系统时先复制为目标目录下的临时文件，再原子改名，读者不会看到不完整的文件
+- 移动在后台进行，与下一个下载任务重叠
+"""
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+def atomic_move(src, dest_dir):
+    """
+    把文件原子地移动到目标目录
+    返回: 目标文件路径
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = os.path.join(dest_dir, os.path.basename(src))
+    try:
+        os.replace(src, dest)
+        return dest
+    except OSError:
+        pass  # 跨文件系统，改为复制后改名
+
+    tmp_dest = os.path.join(dest_dir, f".{os.path.basename(src)}.{os.getpid()}.partial")
+    try:
+        with open(src, 'rb') as fsrc, open(tmp_dest, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, 4 * 1024 * 1024)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        shutil.copystat(src, tmp_dest)
+        os.replace(tmp_dest, dest)
+    except BaseException:
+        try:
+            os.remove(tmp_dest)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+    return dest
+
+class StagingMover:
+    """
+    暂存目录与后台搬运（线程安全）
+
+    参数:
+      scratch_dir: 暂存目录，下载和合并都在这里进行
+      workers: 同时搬运的文件数
+    """
+
+    def __init__(self, scratch_dir, workers=1):
+        self.scratch_dir = os.path.abspath(os.path.expanduser(scratch_dir))
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='stage-move')
+        self._lock = threading.Lock()
+        self._futures = []
+        self.moved = []
+        self.failed = []
+
+    def submit(self, src, dest_dir):
+        """提交一个完成的文件，立即返回，搬运在后台进行"""
+        future = self._executor.submit(self._move, src, dest_dir)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def _move(self, src, dest_dir):
+        try:
+            dest = atomic_move(src, dest_dir)
+        except OSError as e:
+            print(f"警告: 移动文件失败，文件保留在暂存目录: {src} ({e})")
+            with self._lock:
+                self.failed.append(src)
+            return None
+        print(f"已移动到输出目录: {dest}")
+        with self._lock:
+            self.moved.append(dest)
+        return dest
+
+    def wait(self):
+        """等待已提交的搬运全部完成"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,156 @@
+"""
+直播录制测试
+用本地 http.server 做 HLS 替身服务器（不访问外网），播放列表每次请求前进一个分片，
+验证初始化段重试、fMP4/TS 输出扩展名、分片去重和 ENDLIST 结束。
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from live_record import LiveRecorder
+
+INIT_DATA = b'ftypisom-moov-init'
+
+class StandInHLSHandler(BaseHTTPRequestHandler):
+    """HLS 替身：/live.m3u8 为滑动窗口播放列表，/init.mp4 与 /seg<N>.<ext> 返回固定内容"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+        if self.path == '/live.m3u8':
+            # 第一次请求是录制器解析地址（判断是否主播放列表），与第二次返回同一窗口
+            self._send(200, server.playlist(max(hits - 1, 1)).encode('utf-8'))
+        elif self.path == '/init.mp4':
+            if hits <= server.init_failures:
+                self._send(503)
+            else:
+                self._send(200, INIT_DATA)
+        elif self.path.startswith('/seg'):
+            self._send(200, segment_data(int(self.path[4:].split('.')[0])))
+        else:
+            self._send(404)
+
+def segment_data(seq):
+    return f'segment-{seq:04d};'.encode('ascii')
+
+class StandInHLS:
+    """
+    参数:
+      fmp4: 是否为 fMP4 直播（带 EXT-X-MAP）
+      total: 直播总分片数，全部出现后加上 ENDLIST
+      window: 播放列表窗口内的分片数
+      init_failures: 初始化段前几次请求返回 503
+    """
+
+    def __init__(self, fmp4=True, total=6, window=3, init_failures=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHLSHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits = {}
+        self.server.init_failures = init_failures
+        self.server.playlist = self.playlist
+        self.fmp4 = fmp4
+        self.total = total
+        self.window = window
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/live.m3u8"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def playlist(self, request_number):
+        last = min(request_number + self.window - 1, self.total) - 1
+        first = max(0, last - self.window + 1)
+        ext = 'm4s' if self.fmp4 else 'ts'
+        lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-TARGETDURATION:1', f'#EXT-X-MEDIA-SEQUENCE:{first}']
+        if self.fmp4:
+            lines.append('#EXT-X-MAP:URI="init.mp4"')
+        for seq in range(first, last + 1):
+            lines += ['#EXTINF:1.0,', f'seg{seq}.{ext}']
+        if last == self.total - 1:
+            lines.append('#EXT-X-ENDLIST')
+        return '\n'.join(lines) + '\n'
+
+    def hits(self, path):
+        return self.server.hits.get(path, 0)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class LiveRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp(prefix='live_record_test_')
+        self.stand_in = None
+
+    def tearDown(self):
+        if self.stand_in is not None:
+            self.stand_in.close()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def record(self, **kwargs):
+        kwargs.setdefault('idle_timeout', 5)
+        recorder = LiveRecorder(self.stand_in.url, self.output_dir, 'live', retries=3, timeout=5, **kwargs)
+        return recorder.record()
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_fmp4_stream_is_written_as_mp4(self):
+        self.stand_in = StandInHLS(fmp4=True, total=6)
+        stats = self.record()
+        self.assertEqual(stats['segments'], 6)
+        self.assertEqual(stats['gaps'], 0)
+        self.assertEqual(len(stats['files']), 1)
+        self.assertTrue(stats['files'][0].endswith('.mp4'))
+        expected = INIT_DATA + b''.join(segment_data(seq) for seq in range(6))
+        self.assertEqual(self.read(stats['files'][0]), expected)
+        self.assertEqual(self.stand_in.hits('/init.mp4'), 1)
+
+    def test_ts_stream_is_written_as_ts(self):
+        self.stand_in = StandInHLS(fmp4=False, total=4)
+        stats = self.record()
+        self.assertTrue(stats['files'][0].endswith('.ts'))
+        self.assertEqual(self.read(stats['files'][0]), b''.join(segment_data(seq) for seq in range(4)))
+
+    def test_init_segment_is_retried(self):
+        self.stand_in = StandInHLS(fmp4=True, total=3, init_failures=1)
+        stats = self.record()
+        self.assertEqual(self.stand_in.hits('/init.mp4'), 2)
+        self.assertEqual(stats['reconnects'], 0)
+        self.assertTrue(self.read(stats['files'][0]).startswith(INIT_DATA))
+
+    def test_init_failure_reconnects_instead_of_crashing(self):
+        # 初始化段连续失败超过重试次数：作为一次重连处理，之后恢复录制
+        self.stand_in = StandInHLS(fmp4=True, total=3, init_failures=3)
+        stats = self.record(idle_timeout=30)
+        self.assertEqual(stats['reconnects'], 1)
+        self.assertEqual(stats['segments'], 3)
+        self.assertTrue(self.read(stats['files'][0]).startswith(INIT_DATA))
+
+    def test_rotation_writes_init_into_every_file(self):
+        self.stand_in = StandInHLS(fmp4=True, total=4)
+        stats = self.record(segment_time=2)
+        self.assertEqual(len(stats['files']), 2)
+        for path in stats['files']:
+            self.assertTrue(path.endswith('.mp4'))
+            self.assertTrue(self.read(path).startswith(INIT_DATA))
+
+if __name__ == '__main__':
+    unittest.main()
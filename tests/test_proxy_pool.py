@@ -0,0 +1,143 @@
+"""
+代理池健康探测测试
+用本地 http.server 做代理替身（不访问外网）：按 mode 对代理请求返回 204、
+407（要求代理认证）或拒绝 CONNECT，验证剔除与恢复逻辑。
+运行: python -m pytest tests 或 python -m unittest discover tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from proxy_pool import ProxyPool
+
+PROBE_URL = 'http://probe.invalid/generate_204'
+HTTPS_PROBE_URL = 'https://probe.invalid/generate_204'
+
+class StandInProxyHandler(BaseHTTPRequestHandler):
+    """代理替身：'ok' 时直接应答 204，'auth' 时对普通请求和 CONNECT 都返回 407"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reject(self):
+        self.send_response(407)
+        self.send_header('Proxy-Authenticate', 'Basic realm="stand-in"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.server.mode == 'auth':
+            self._reject()
+            return
+        self.send_response(204)
+        self.end_headers()
+
+    def do_CONNECT(self):
+        self.server.requests += 1
+        # 不做真正的隧道转发，'ok' 时同样拒绝，只用于验证 CONNECT 被拒绝算失败
+        self._reject()
+
+class StandInProxy:
+    def __init__(self, mode='ok'):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInProxyHandler)
+        self.server.mode = mode
+        self.server.requests = 0
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def set_mode(self, mode):
+        self.server.mode = mode
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class ProxyPoolProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.good = StandInProxy('ok')
+        self.bad = StandInProxy('auth')
+
+    def tearDown(self):
+        self.good.close()
+        self.bad.close()
+
+    def make_pool(self, proxies, probe_url=PROBE_URL, **kwargs):
+        kwargs.setdefault('eject_after', 2)
+        kwargs.setdefault('readmit_after', 0)
+        return ProxyPool(proxies, probe_url=probe_url, probe_timeout=2, **kwargs)
+
+    def test_204_is_healthy(self):
+        pool = self.make_pool([self.good.url])
+        self.assertTrue(pool.probe(self.good.url))
+        self.assertEqual(self.good.server.requests, 1)
+        self.assertIsNotNone(pool.metrics()[self.good.url]['latency'])
+
+    def test_407_is_unhealthy(self):
+        pool = self.make_pool([self.bad.url])
+        self.assertFalse(pool.probe(self.bad.url))
+        self.assertEqual(pool.metrics()[self.bad.url]['failures'], 1)
+
+    def test_rejected_connect_is_unhealthy(self):
+        pool = self.make_pool([self.bad.url], probe_url=HTTPS_PROBE_URL)
+        self.assertFalse(pool.probe(self.bad.url))
+        self.assertEqual(self.bad.server.requests, 1)
+
+    def test_unreachable_proxy_is_unhealthy(self):
+        url = self.bad.url
+        self.bad.close()
+        self.bad = StandInProxy('auth')
+        pool = self.make_pool([url])
+        self.assertFalse(pool.probe(url))
+
+    def test_ejected_proxy_is_not_assigned(self):
+        pool = self.make_pool([self.good.url, self.bad.url])
+        pool.probe_all()
+        pool.probe_all()
+        self.assertTrue(pool.metrics()[self.bad.url]['ejected'])
+        self.assertFalse(pool.metrics()[self.good.url]['ejected'])
+        for i in range(4):
+            self.assertEqual(pool.acquire(f'job-{i}'), self.good.url)
+
+    def test_eject_and_readmit(self):
+        pool = self.make_pool([self.bad.url], readmit_after=0.3)
+        pool.probe_all()
+        self.assertIsNotNone(pool.acquire('job'))
+        pool.release('job')
+        pool.probe_all()
+        self.assertTrue(pool.metrics()[self.bad.url]['ejected'])
+        # 没有可用代理时直连
+        self.assertIsNone(pool.acquire('job'))
+
+        # 代理恢复后，未满 readmit_after 不重新加入
+        self.bad.set_mode('ok')
+        self.assertTrue(pool.probe(self.bad.url))
+        self.assertTrue(pool.metrics()[self.bad.url]['ejected'])
+
+        time.sleep(0.35)
+        self.assertTrue(pool.probe(self.bad.url))
+        self.assertFalse(pool.metrics()[self.bad.url]['ejected'])
+        self.assertEqual(pool.acquire('job'), self.bad.url)
+
+    def test_background_probe_readmits(self):
+        pool = ProxyPool([self.bad.url], probe_url=PROBE_URL, probe_interval=0.1, probe_timeout=2,
+                         eject_after=1, readmit_after=0)
+        pool.start()
+        try:
+            self.assertTrue(pool.metrics()[self.bad.url]['ejected'])
+            self.bad.set_mode('ok')
+            deadline = time.monotonic() + 5
+            while pool.metrics()[self.bad.url]['ejected'] and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertFalse(pool.metrics()[self.bad.url]['ejected'])
+        finally:
+            pool.stop()
+
+if __name__ == '__main__':
+    unittest.main()
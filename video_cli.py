@@ -12,18 +12,37 @@ import sys
 import argparse
 import json
 import glob
-
-# 检查yt-dlp版本
+import time
+import hashlib
+import contextlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from concurrency import AdaptiveConcurrencyController, FragmentTuner, TaskFeedback, classify_error, get_host
+from config_loader import deep_update, read_config_file
+from proxy_pool import ProxyPool
+import ytdlp_cache
+from hedged_extract import HedgedExtractor
+from format_probe import probe_fallback_format
+from staging import StagingMover
+from library import Library, DownloadTracker
+from format_table import compact_formats
+from live_record import LiveRecorder
+from integrity import DownloadVerifier, IntegrityError
+from library_index import LibraryIndex, IndexRecorder
+import checksum
+
+# 检查yt-dlp版本（输出到stderr，避免干扰 --json 的标准输出）
 try:
     yt_dlp_version = yt_dlp.version.__version__
-    print(f"当前yt-dlp版本: {yt_dlp_version}")
-    print("更新yt-dlp版本使用指令: pip install -U yt-dlp")
-    print("如遇到'您不是机器人'问题，请使用浏览器Cookie认证")
+    print(f"当前yt-dlp版本: {yt_dlp_version}", file=sys.stderr)
+    print("更新yt-dlp版本使用指令: pip install -U yt-dlp", file=sys.stderr)
+    print("如遇到'您不是机器人'问题，请使用浏览器Cookie认证", file=sys.stderr)
     # 如果版本过旧，提示更新
     if yt_dlp_version < "2025":
-        print("⚠️ 您的yt-dlp版本可能较旧，建议更新: pip install -U yt-dlp")
+        print("⚠️ 您的yt-dlp版本可能较旧，建议更新: pip install -U yt-dlp", file=sys.stderr)
 except:
-    print("⚠️ 无法检测yt-dlp版本")
+    print("⚠️ 无法检测yt-dlp版本", file=sys.stderr)
 
 def sanitize_filename(name: str) -> str:
     """
@@ -32,7 +51,7 @@ def sanitize_filename(name: str) -> str:
     """
     return re.sub(r'[\\/:*?"<>|]', '_', name).strip()
 
-def setup_authentication(force_auth=False, no_auth=False, cookies_file=None, browser=None):
+def setup_authentication(force_auth=False, no_auth=False, cookies_file=None, browser=None, interactive=True):
     """
     设置YouTube视频下载认证
 
@@ -41,6 +60,8 @@ def setup_authentication(force_auth=False, no_auth=False, cookies_file=None, bro
       no_auth (bool): 是否跳过认证
       cookies_file (str): 指定cookie文件路径
       browser (str): 指定浏览器类型
+      interactive (bool): 为False时不询问用户（并发批量模式的工作线程），
+                          没有通过参数指定可用的认证方式时直接抛出 DownloadError
     返回:
       auth_opts (dict): 认证相关的yt-dlp选项
     """
@@ -70,6 +91,9 @@ def setup_authentication(force_auth=False, no_auth=False, cookies_file=None, bro
         else:
             print(f"警告: 不支持的浏览器类型: {browser}")
 
+    if not interactive:
+        raise yt_dlp.utils.DownloadError("非交互模式下无法选择认证方式，请使用 --cookies、--browser 或 --no-auth 指定")
+
     # 交互式认证选择（与原始video.py相同）
     print("\n===== YouTube认证设置 =====")
     if force_auth:
@@ -151,12 +175,15 @@ def setup_authentication(force_auth=False, no_auth=False, cookies_file=None, bro
 
     return auth_opts
 
-def parse_formats(page_url: str, auth_opts=None):
+def parse_formats(page_url: str, auth_opts=None, cache_dir=None, hedger=None, proxy=None, interactive=True):
     """
     使用 yt-dlp 提取视频信息，包括标题和所有可用格式。
+    cache_dir 为共享的 yt-dlp 缓存目录（签名函数等），为None时使用 yt-dlp 默认位置。
+    hedger 为对冲解析器，设置后用多个客户端并发解析，取最先返回的结果。
+    proxy 为本任务分配的代理（解析与下载走同一个代理），为None时直连。
     返回:
       title (str): 视频标题（若无则空字符串）
-      formats (list): 所有可用的格式信息，每个元素是一个 dict
+      formats (list): 所有可用格式的精简记录（FormatRecord，只含格式选择所需字段）
       auth_opts (dict): 认证选项，便于后续使用
     """
     # 获取认证选项
@@ -169,13 +196,20 @@ def parse_formats(page_url: str, auth_opts=None):
         'skip_download': True,
         **auth_opts  # 添加认证选项
     }
+    if cache_dir:
+        ydl_opts['cachedir'] = cache_dir
+    if proxy:
+        ydl_opts['proxy'] = proxy
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(page_url, download=False)
+        if hedger is not None:
+            info = hedger.extract(page_url, ydl_opts)
+        else:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(page_url, download=False)
     except Exception as e:
         error_str = str(e)
-        if "Sign in to confirm you're not a bot" in error_str or "确认你不是机器人" in error_str:
+        if interactive and ("Sign in to confirm you're not a bot" in error_str or "确认你不是机器人" in error_str):
             print("\n⚠️ YouTube检测到机器人行为，需要认证才能继续")
             # 强制要求认证
             auth_opts = setup_authentication(force_auth=True)
@@ -186,7 +220,9 @@ def parse_formats(page_url: str, auth_opts=None):
             raise  # 重新抛出其他类型的异常
 
     title = info.get("title") or ""
-    formats = info.get("formats", [])
+    # 只保留精简记录，原始 info（URL、分片列表等）在此之后即可释放
+    formats = compact_formats(info.get("formats"))
+    del info
     return title, formats, auth_opts  # 返回认证选项以便后续使用
 
 def categorize_formats(formats):
@@ -240,14 +276,81 @@ def pick_resolution(single_map, video_map):
     sorted_heights = sorted(all_heights, reverse=True)
     return sorted_heights
 
-def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_retries=3):
+class RecordingLogger:
+    """
+    yt-dlp 日志转发器：原样输出日志，同时记录错误信息。
+    ignoreerrors 模式下 yt-dlp 不抛出异常，需要靠它获知403/429等错误；
+    下载存档模式下还记录因"已在存档中"被跳过的视频（跳过时返回码为0且没有输出文件）。
+    """
+
+    ARCHIVED_MARKER = 'has already been recorded in the archive'
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.errors = []
+        self.archived = []
+
+    def debug(self, msg):
+        if self.ARCHIVED_MARKER in msg:
+            self.archived.append(msg)
+        print(f"{self.prefix}{msg}")
+
+    def info(self, msg):
+        if self.ARCHIVED_MARKER in msg:
+            self.archived.append(msg)
+        print(f"{self.prefix}{msg}")
+
+    def warning(self, msg):
+        print(f"{self.prefix}{msg}", file=sys.stderr)
+
+    def error(self, msg):
+        self.errors.append(msg)
+        print(f"{self.prefix}{msg}", file=sys.stderr)
+
+# 说明代理本身可能有问题的网络错误特征
+PROXY_ERROR_MARKERS = (
+    'urlopen error',
+    'timed out',
+    'Unable to connect',
+    'Connection refused',
+    'Connection reset',
+    'ProxyError',
+    'Tunnel connection failed',
+)
+
+def acquire_proxy(page_url, proxy_pool=None):
+    """
+    任务使用的代理：有代理池时按URL粘性分配（用完调用 proxy_pool.release），
+    否则取环境变量 HTTPS_PROXY/HTTP_PROXY，都没有时为None（直连）
+    """
+    if proxy_pool is not None:
+        return proxy_pool.acquire(page_url)
+    return os.environ.get('HTTPS_PROXY') or os.environ.get('HTTP_PROXY') or None
+
+def next_proxy(page_url, proxy_pool=None):
+    """代理失败后的下一个代理：有代理池时换用池中其他代理，否则直连（None）"""
+    if proxy_pool is None:
+        return None
+    proxy = proxy_pool.reassign(page_url)
+    print(f"切换代理: {proxy or '直连'}")
+    return proxy
+
+def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_retries=3,
+                         controller=None, interactive=True, proxy_pool=None, fragment_tuner=None, verify=None):
     """
     以多轮、每轮多次重试的方式调用 yt-dlp 下载。
     - max_rounds: 最多轮数
     - max_retries: 每轮尝试次数 (在 yt-dlp 里一般只有一次下载机会，出错就需要下一轮)
+    - controller: 自适应并发控制器，提供分片并发数并接收成功/失败反馈
+    - interactive: 为False时不询问用户（并发批量模式），失败后自动进入下一轮
+    - proxy_pool: 代理池，代理出错时换用池中其他代理而不是直接禁用代理
+    - fragment_tuner: 分片并发调优器，按实测吞吐选择 concurrent_fragment_downloads
+    - verify: 下载后完整性校验，'probe' 比对容器时长/流/大小，'keyframes' 另做关键帧解码扫描，
+      None 不校验；校验失败的文件会被删除并按下载错误重试
 
     当出现下载错误时，允许用户输入 y/n 决定是否继续下一轮。
-    针对HTTP 403错误提供特殊处理和格式回退选项。
+    针对HTTP 403错误提供特殊处理和格式回退选项：首次403时先并行探测各格式URL，
+    直接选用确实可下载的最佳格式，探测无果再逐个尝试备选格式。
     """
     # 可在HTTP 403错误时尝试的备选格式
     fallback_formats = [
@@ -256,20 +359,100 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
         'b/w',  # worst quality as last resort
     ]
     current_format_index = -1  # 用于跟踪当前使用的fallback_formats索引
+    host = get_host(page_url)
+    probed = False  # 每次下载只做一轮并行探测
+
+    def try_probed_format():
+        """并行探测可用格式，找到时更新 ydl_opts['format'] 并返回True"""
+        nonlocal probed
+        if probed:
+            return False
+        probed = True
+        print("并行探测可用格式...")
+        probed_format = probe_fallback_format(page_url, ydl_opts)
+        if not probed_format:
+            return False
+        print(f"探测到可用格式: {probed_format}")
+        ydl_opts['format'] = probed_format
+        return True
+
+    # 统计传输量，供代理池计算吞吐
+    transfer = {'bytes': 0, 'seconds': 0.0}
+    if proxy_pool is not None:
+        def track_transfer(d):
+            if d.get('status') == 'finished':
+                transfer['bytes'] += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+                transfer['seconds'] += d.get('elapsed') or 0
+        ydl_opts['progress_hooks'] = list(ydl_opts.get('progress_hooks') or []) + [track_transfer]
+
+    # 分片下载完成时把实测吞吐反馈给调优器（finished 事件不带分片信息，需先记下分片文件）
+    if fragment_tuner is not None:
+        fragmented_files = set()
+        def track_fragments(d):
+            if d.get('status') == 'finished':
+                if d.get('filename') in fragmented_files:
+                    fragment_tuner.observe(host, ydl_opts.get('concurrent_fragment_downloads'),
+                                           d.get('total_bytes'), d.get('elapsed'))
+            elif d.get('fragment_count'):
+                fragmented_files.add(d.get('filename'))
+        ydl_opts['progress_hooks'] = list(ydl_opts.get('progress_hooks') or []) + [track_fragments]
+
+    verifier = None
+    if verify:
+        verifier = DownloadVerifier(keyframes=(verify == 'keyframes'))
+        verifier.install(ydl_opts)
 
     for round_idx in range(1, max_rounds + 1):
         for retry_idx in range(1, max_retries + 1):
             print(f"\n----- 第 {round_idx} 轮, 第 {retry_idx} 次尝试下载 -----")
+            logger = None
+            if verifier is not None:
+                verifier.reset()
+            # 每次尝试都使用调优器建议、并受控制器上限约束的分片并发数
+            fragments = fragment_tuner.suggest(host) if fragment_tuner is not None else None
+            if controller is not None:
+                limit = controller.fragment_limit(host)
+                fragments = min(fragments, limit) if fragments else limit
+            if fragments:
+                ydl_opts['concurrent_fragment_downloads'] = fragments
+            if controller is not None or proxy_pool is not None or ydl_opts.get('download_archive'):
+                logger = RecordingLogger(prefix=f"[{host}] ")
+                ydl_opts['logger'] = logger
             try:
                 # 尝试使用当前的配置下载
                 with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([page_url])
+                    retcode = ydl.download([page_url])
+                if retcode:
+                    # ignoreerrors 吞掉的错误按异常处理，交给下面的重试逻辑（没有记录日志时也不能当作成功）
+                    raise yt_dlp.utils.DownloadError(
+                        logger.errors[-1] if logger is not None and logger.errors
+                        else f"yt-dlp 返回 {retcode}，下载未完成")
+                if logger is not None and logger.archived and (verifier is None or not verifier.files):
+                    # 下载存档中已有该视频（文件仍在库中），yt-dlp 直接跳过，没有需要校验的文件
+                    print("该视频已在下载存档中，跳过下载")
+                elif verifier is not None:
+                    # 截断或不完整合并的文件在这里被发现，抛出后按普通错误重试
+                    verifier.verify()
+                if controller is not None:
+                    controller.record_success(host)
+                if proxy_pool is not None and ydl_opts.get('proxy'):
+                    proxy_pool.report_success(ydl_opts['proxy'], transfer['bytes'], transfer['seconds'])
                 return True
 
+            except IntegrityError as e:
+                # 错误信息中含有字节数，不能交给 classify_error 按状态码判断
+                if controller is not None:
+                    controller.record_error(host, 'error')
+                print(f"{e}，重新下载...")
+
             except yt_dlp.networking.exceptions.HTTPError as http_err:
+                if controller is not None:
+                    controller.record_error(host, classify_error(str(http_err)))
                 # 针对HTTP 403 Forbidden错误的特殊处理
                 if '403' in str(http_err):
                     print(f"遇到HTTP 403错误: {http_err}")
+                    if try_probed_format():
+                        continue
 
                     # 尝试修改格式字符串
                     if current_format_index < len(fallback_formats) - 1:
@@ -280,10 +463,10 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
 
                         # 禁用可能导致问题的设置
                         if retry_idx > 1:
-                            # 尝试禁用代理
+                            # 尝试禁用代理（有代理池时换用其他代理）
                             if ydl_opts.get('proxy'):
                                 print("尝试禁用代理...")
-                                ydl_opts['proxy'] = None
+                                ydl_opts['proxy'] = next_proxy(page_url, proxy_pool)
 
                             # 修改User-Agent
                             print("尝试修改User-Agent...")
@@ -297,8 +480,10 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
                 print(f"下载出错: {http_err}")
 
             except yt_dlp.utils.ExtractorError as e:
+                if controller is not None:
+                    controller.record_error(host, classify_error(str(e)))
                 # 这是格式问题，尝试使用列出格式后再选择
-                if "Requested format is not available" in str(e) and retry_idx == 1:
+                if "Requested format is not available" in str(e) and retry_idx == 1 and interactive:
                     print(f"请求的格式不可用，尝试列出所有格式并重新选择...")
                     try:
                         # 修改选项来列出所有格式
@@ -315,13 +500,14 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
                             ydl_opts['format'] = format_id
                             # 直接尝试使用新格式下载
                             with yt_dlp.YoutubeDL(ydl_opts) as ydl_new:
-                                ydl_new.download([page_url])
+                                if ydl_new.download([page_url]):
+                                    raise yt_dlp.utils.DownloadError(f"格式 {format_id} 下载失败")
                             return True
                     except Exception as list_err:
                         print(f"尝试列出格式失败: {list_err}")
                 # 检查是否是YouTube机器人检测问题
                 error_str = str(e)
-                if "Sign in to confirm you're not a bot" in error_str or "确认你不是机器人" in error_str:
+                if interactive and ("Sign in to confirm you're not a bot" in error_str or "确认你不是机器人" in error_str):
                     print("\n⚠️ YouTube检测到机器人行为，需要认证才能继续")
                     print("正在尝试重新设置认证...")
 
@@ -339,7 +525,9 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
 
             except Exception as e:
                 error_str = str(e)
-                if "Sign in to confirm you're not a bot" in error_str or "确认你不是机器人" in error_str:
+                if controller is not None:
+                    controller.record_error(host, classify_error(error_str))
+                if interactive and ("Sign in to confirm you're not a bot" in error_str or "确认你不是机器人" in error_str):
                     print("\n⚠️ YouTube检测到机器人行为，需要认证才能继续")
                     print("正在尝试重新设置认证...")
 
@@ -355,6 +543,15 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
 
                 print(f"下载出错: {e}")
 
+                # yt-dlp 通常把403包装成 DownloadError，同样先做一轮并行探测
+                if '403' in error_str and try_probed_format():
+                    continue
+
+                # 代理池模式下，代理相关的网络错误立即换代理
+                if proxy_pool is not None and ydl_opts.get('proxy') and any(m in error_str for m in PROXY_ERROR_MARKERS):
+                    ydl_opts['proxy'] = next_proxy(page_url, proxy_pool)
+                    continue
+
                 # 如果是网络相关错误，尝试禁用代理
                 if "urlopen error" in str(e) and ydl_opts.get('proxy') and retry_idx == max_retries:
                     print("尝试禁用代理并重试...")
@@ -370,6 +567,9 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
                 ydl_opts['downloader'] = None
                 ydl_opts['downloader_args'] = {}
 
+            if not interactive:
+                print("本轮失败，自动进入下一轮...")
+                continue
             cont = input("本轮失败，是否继续下一轮下载？(y/n): ").strip().lower()
             if cont != 'y':
                 print("已终止下载流程。")
@@ -378,10 +578,11 @@ def multi_round_download(page_url, ydl_opts, auth_opts=None, max_rounds=3, max_r
             print("已达到最大轮数，仍然全部失败。")
             return False
 
-def list_formats(url, auth_opts=None):
+def list_formats(url, auth_opts=None, cache_dir=None, hedger=None, proxy=None, interactive=True):
     """列出所有可用格式，用于交互式选择"""
     print(f"\n正在解析视频信息: {url}")
-    title_raw, formats, auth_opts = parse_formats(url, auth_opts)
+    title_raw, formats, auth_opts = parse_formats(url, auth_opts, cache_dir=cache_dir, hedger=hedger, proxy=proxy,
+                                                  interactive=interactive)
     title_clean = sanitize_filename(title_raw)
     if not title_clean:
         title_clean = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -396,7 +597,7 @@ def list_formats(url, auth_opts=None):
 
     if not sorted_heights:
         print("未检测到可识别的分辨率")
-        return None, None, None, None, auth_opts
+        return title_clean, None, None, None, None, auth_opts
 
     print("\n检测到以下清晰度可供选择:")
     option_idx = 1
@@ -423,9 +624,92 @@ def list_formats(url, auth_opts=None):
 
     return title_clean, resolution_options, single_map, video_map, audio_list, auth_opts
 
+def collect_output_files(ydl_opts):
+    """
+    注册 yt-dlp 的 post_hooks，收集所有后处理（合并等）完成后的最终文件路径。
+    返回: 会被逐步填充的文件路径列表
+    """
+    output_files = []
+    def record(filepath):
+        if filepath not in output_files:
+            output_files.append(filepath)
+    ydl_opts['post_hooks'] = list(ydl_opts.get('post_hooks') or []) + [record]
+    return output_files
+
+def stage_output_files(output_files, stager, output_dir):
+    """把暂存目录中完成的文件提交给后台搬运到输出目录（不等待完成）"""
+    for filepath in output_files:
+        if os.path.exists(filepath):
+            stager.submit(filepath, output_dir)
+
+def library_hit(library, url):
+    """下载库中已有该视频时更新其使用时间并返回True"""
+    if library is None:
+        return False
+    paths = library.lookup(url)
+    if paths:
+        print("下载库中已有该视频，跳过下载:")
+        for path in paths:
+            print(f"  {path}")
+    return bool(paths)
+
+def prepare_library(ydl_opts, library, url):
+    """
+    库模式下启用下载存档、按文件预留空间并执行保留期限策略
+    返回: DownloadTracker，未启用下载库时返回None
+    """
+    if library is None:
+        return None
+    ydl_opts['download_archive'] = library.archive_file
+    if library.unarchive_missing(url):
+        print("下载存档中有该视频但文件已不在库中，已删除存档记录以便重新下载")
+    tracker = DownloadTracker(library, url)
+    ydl_opts['progress_hooks'] = list(ydl_opts.get('progress_hooks') or []) + [tracker.progress_hook]
+    library.ensure_space()
+    return tracker
+
+def run_download(url, ydl_opts, output_dir, controller=None, interactive=True, proxy_pool=None,
+                 fragment_tuner=None, verify=None, stager=None, library=None, index=None, checksums=False):
+    """
+    执行下载并完成收尾：释放代理、登记下载库、写入校验和清单与媒体库索引、提交暂存文件搬运
+    返回: 是否成功
+    """
+    output_files = collect_output_files(ydl_opts)
+    tracker = prepare_library(ydl_opts, library, url)
+    recorder = None
+    if index is not None:
+        recorder = IndexRecorder(index)
+        recorder.install(ydl_opts)
+    hasher = None
+    if checksums:
+        # aria2c 多连接乱序写文件，只能在下载完成后计算
+        hasher = checksum.IncrementalHasher(incremental=not ydl_opts.get('downloader'))
+        hasher.install(ydl_opts)
+    success = multi_round_download(url, ydl_opts, max_rounds=3, max_retries=3,
+                                   controller=controller, interactive=interactive, proxy_pool=proxy_pool,
+                                   fragment_tuner=fragment_tuner, verify=verify)
+    if proxy_pool is not None:
+        proxy_pool.release(url)
+    if tracker is not None:
+        tracker.finish(output_files, output_dir, success)
+    digests = hasher.digests if hasher is not None else None
+    if success and digests:
+        manifest = checksum.update_manifest(output_dir, digests)
+        print(f"SHA-256 已写入清单: {manifest}")
+        if hasher.hashed_after:
+            print(f"其中 {hasher.hashed_after} 个合并输出文件在合并完成后计算")
+    if success and recorder is not None:
+        recorder.commit(output_dir if stager is not None else None, digests)
+    if success and stager is not None:
+        stage_output_files(output_files, stager, output_dir)
+    return success
+
 def download_with_options(url, resolution_option_idx=None, audio_option_idx=None,
                          custom_name=None, output_dir="./download",
-                         no_auth=False, cookies_file=None, browser=None):
+                         no_auth=False, cookies_file=None, browser=None, auth_opts=None,
+                         controller=None, interactive=True, proxy_pool=None,
+                         concurrent_fragments=4, fragment_tuner=None, cache_dir=None, hedger=None,
+                         stager=None, library=None, verify='probe', index=None, checksums=False):
     """
     使用指定选项下载视频
 
@@ -438,36 +722,91 @@ def download_with_options(url, resolution_option_idx=None, audio_option_idx=None
       no_auth: 是否跳过认证
       cookies_file: cookie文件路径
       browser: 浏览器类型
+      auth_opts: 已确定的认证选项（可选），设置后不再调用 setup_authentication（批量模式由主线程统一确定一次）
+      controller: 自适应并发控制器（可选）
+      interactive: 为False时不进行任何交互，未指定的分辨率/音频选项使用第1项
+      proxy_pool: 代理池（可选），为本任务粘性分配代理
+      concurrent_fragments: DASH/HLS 分片并发下载数
+      fragment_tuner: 分片并发调优器（可选），设置后覆盖 concurrent_fragments
+      cache_dir: 共享的 yt-dlp 缓存目录（可选）
+      hedger: 对冲解析器（可选），下载时沿用解析胜出的客户端
+      stager: 暂存目录搬运器（可选），下载与合并在暂存目录进行，完成后后台移动到 output_dir
+      library: 下载库（可选），按配额淘汰旧文件，已在库中的视频直接复用
+      verify: 下载后完整性校验方式（'probe'、'keyframes' 或 None）
+      index: 媒体库索引（可选），记录每个下载完成文件的元数据
+      checksums: 是否边下载边计算 SHA-256，写入输出目录的 SHA256SUMS 清单和媒体库索引
     """
+    if not interactive:
+        resolution_option_idx = resolution_option_idx or 1
+        audio_option_idx = audio_option_idx or 1
+
+    if library_hit(library, url):
+        return True
+
     # 设置认证
-    auth_opts = setup_authentication(no_auth=no_auth, cookies_file=cookies_file, browser=browser)
+    if auth_opts is None:
+        auth_opts = setup_authentication(no_auth=no_auth, cookies_file=cookies_file, browser=browser,
+                                         interactive=interactive)
+    else:
+        auth_opts = dict(auth_opts)
+    # 解析和下载使用同一个（粘性分配的）代理，未进入下载就结束时释放分配
+    proxy = acquire_proxy(url, proxy_pool)
+
+    def release_proxy():
+        if proxy_pool is not None:
+            proxy_pool.release(url)
 
     # 如果指定了分辨率选项索引，直接使用
     if resolution_option_idx is not None:
         # 需要先获取格式信息
-        title_clean, resolution_options, single_map, video_map, audio_list, auth_opts = list_formats(url, auth_opts)
+        try:
+            result = list_formats(url, auth_opts, cache_dir=cache_dir, hedger=hedger, proxy=proxy,
+                                  interactive=interactive)
+        except Exception:
+            release_proxy()
+            raise
+        title_clean, resolution_options, single_map, video_map, audio_list, auth_opts = result
         if not resolution_options:
             print("无法获取格式信息，尝试使用默认下载方式...")
-            return download_default(url, title_clean or "video", output_dir, auth_opts)
+            return download_default(url, title_clean or "video", output_dir, auth_opts,
+                                    controller=controller, interactive=interactive, proxy_pool=proxy_pool,
+                                    concurrent_fragments=concurrent_fragments, fragment_tuner=fragment_tuner,
+                                    cache_dir=cache_dir, stager=stager, library=library, verify=verify,
+                                    index=index, checksums=checksums, hedger=hedger)
 
         idx = resolution_option_idx - 1
         if 0 <= idx < len(resolution_options):
             chosen_height, prefer_single_file = resolution_options[idx]
         else:
             print(f"错误: 分辨率选项索引 {resolution_option_idx} 无效")
+            release_proxy()
             return False
     else:
         # 交互式选择
-        result = list_formats(url, auth_opts)
+        try:
+            result = list_formats(url, auth_opts, cache_dir=cache_dir, hedger=hedger, proxy=proxy,
+                                  interactive=interactive)
+        except Exception:
+            release_proxy()
+            raise
         if not result:
+            release_proxy()
             return False
         title_clean, resolution_options, single_map, video_map, audio_list, auth_opts = result
+        if not resolution_options:
+            print("无法获取格式信息，尝试使用默认下载方式...")
+            return download_default(url, title_clean or "video", output_dir, auth_opts,
+                                    controller=controller, interactive=interactive, proxy_pool=proxy_pool,
+                                    concurrent_fragments=concurrent_fragments, fragment_tuner=fragment_tuner,
+                                    cache_dir=cache_dir, stager=stager, library=library, verify=verify,
+                                    index=index, checksums=checksums, hedger=hedger)
 
         # 交互式选择分辨率
         while True:
             choice = input("\n请输入要下载的选项编号(如 '1'), 或输入 'q' 放弃: ").strip().lower()
             if choice == 'q':
                 print("已放弃操作。")
+                release_proxy()
                 return False
 
             if choice.isdigit():
@@ -488,22 +827,29 @@ def download_with_options(url, resolution_option_idx=None, audio_option_idx=None
     out_name = f"{title_clean}_{chosen_res_str}.%(ext)s"
     os.makedirs(output_dir, exist_ok=True)
 
+    # aria2c 多连接乱序写文件，SHA-256 无法边下载边计算；计算校验和时改用原生下载器
+    use_aria2c = os.system('aria2c --version > /dev/null 2>&1') == 0
+    if use_aria2c and checksums:
+        print("计算校验和时使用原生下载器（aria2c 乱序写入，无法边下载边计算SHA-256）")
+        use_aria2c = False
+
     # 构造 yt-dlp 的下载参数
     ydl_opts = {
-        'outtmpl': os.path.join(output_dir, out_name),
+        'outtmpl': os.path.join(stager.scratch_dir if stager is not None else output_dir, out_name),
         'format': None,
         'merge_output_format': 'mp4',
         'retries': 10,
         'fragment_retries': 10,
+        'concurrent_fragment_downloads': concurrent_fragments,
         'throttled_rate': '1M',
         'ignoreerrors': True,
         'cookiefile': 'cookies.txt' if os.path.exists('cookies.txt') else None,
         # Make aria2c optional with a fallback
-        'downloader': 'aria2c' if os.system('aria2c --version > /dev/null 2>&1') == 0 else None,
+        'downloader': 'aria2c' if use_aria2c else None,
         'downloader_args': {
             'http': ['--min-split-size=1M', '--max-connection-per-server=16', '--split=32', '--auto-file-renaming=false'],
             'https': ['--min-split-size=1M', '--max-connection-per-server=16', '--split=32', '--auto-file-renaming=false'],
-        } if os.system('aria2c --version > /dev/null 2>&1') == 0 else {},
+        } if use_aria2c else {},
         'extractor_args': {
             'youtube': {
                 'player_skip': ['configs'],
@@ -523,12 +869,20 @@ def download_with_options(url, resolution_option_idx=None, audio_option_idx=None
         },
         'socket_timeout': 300,
         'retry_sleep': 30,
-        'proxy': os.environ.get('HTTPS_PROXY') or os.environ.get('HTTP_PROXY') or None,
+        'proxy': proxy,
         'force-ipv4': True,
         'nocheckcertificate': True,
         'verbose': True,
         **auth_opts
     }
+    if not interactive:
+        # 并发下载时多个进度条交错输出没有意义
+        ydl_opts['noprogress'] = True
+    if cache_dir:
+        ydl_opts['cachedir'] = cache_dir
+    if hedger is not None and hedger.winner(url):
+        # 下载时沿用解析阶段最快返回的客户端
+        ydl_opts['extractor_args']['youtube']['player_client'] = [hedger.winner(url)]
 
     # 根据选择进行相应设置
     if prefer_single_file:
@@ -591,7 +945,9 @@ def download_with_options(url, resolution_option_idx=None, audio_option_idx=None
         print(f"\n已选择{chosen_height}p（视频+音频分离），yt-dlp会自动下载并合并。")
 
     # 进行多轮、多次重试下载
-    success = multi_round_download(url, ydl_opts, max_rounds=3, max_retries=3)
+    success = run_download(url, ydl_opts, output_dir, controller=controller, interactive=interactive,
+                           proxy_pool=proxy_pool, fragment_tuner=fragment_tuner, verify=verify,
+                           stager=stager, library=library, index=index, checksums=checksums)
 
     if success:
         print(f"\n下载完成！请查看下载文件夹：{output_dir}")
@@ -600,21 +956,574 @@ def download_with_options(url, resolution_option_idx=None, audio_option_idx=None
 
     return success
 
-def download_default(url, title_clean, output_dir, auth_opts):
-    """默认下载方式"""
+def download_default(url, title_clean, output_dir, auth_opts, controller=None, interactive=True,
+                     proxy_pool=None, concurrent_fragments=4, fragment_tuner=None, cache_dir=None,
+                     stager=None, library=None, verify='probe', index=None, checksums=False, hedger=None):
+    """默认下载方式（hedger 为对冲解析器时沿用解析胜出的客户端）"""
+    if library_hit(library, url):
+        return True
     ydl_opts = {
-        'outtmpl': os.path.join(output_dir, f'{title_clean}.%(ext)s'),
+        'outtmpl': os.path.join(stager.scratch_dir if stager is not None else output_dir, f'{title_clean}.%(ext)s'),
         'format': 'best',
         'merge_output_format': 'mp4',
+        'concurrent_fragment_downloads': concurrent_fragments,
         **auth_opts
     }
-    success = multi_round_download(url, ydl_opts, max_rounds=3, max_retries=3)
+    ydl_opts['proxy'] = acquire_proxy(url, proxy_pool)
+    if cache_dir:
+        ydl_opts['cachedir'] = cache_dir
+    if hedger is not None and hedger.winner(url):
+        ydl_opts['extractor_args'] = {'youtube': {'player_client': [hedger.winner(url)]}}
+    success = run_download(url, ydl_opts, output_dir, controller=controller, interactive=interactive,
+                           proxy_pool=proxy_pool, fragment_tuner=fragment_tuner, verify=verify,
+                           stager=stager, library=library, index=index, checksums=checksums)
     if success:
         print(f"\n下载完成！请查看下载文件夹：{output_dir}")
     else:
         print("\n下载未完成，请检查网络或重试")
     return success
 
+# 元数据缓存目录（--plan 等只读场景复用，避免重复解析）
+INFO_CACHE_DIR = os.path.expanduser('~/.videodownloader/info_cache')
+INFO_CACHE_TTL = 24 * 3600
+
+def _info_cache_path(url, auth_opts=None):
+    """
+    缓存文件路径：按URL和认证方式区分（未登录与用cookie解析得到的格式列表可能不同，
+    如会员、年龄限制视频），换cookie文件或浏览器后不会读到其他身份的结果
+    """
+    auth_opts = auth_opts or {}
+    cookiefile = auth_opts.get('cookiefile')
+    browser = auth_opts.get('cookiesfrombrowser')
+    key = json.dumps([url, os.path.abspath(cookiefile) if cookiefile else None, browser[0] if browser else None])
+    return os.path.join(INFO_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+def load_cached_info(url, ttl=INFO_CACHE_TTL, auth_opts=None):
+    """读取缓存的视频元数据（与 auth_opts 的认证方式对应），过期或损坏时返回None"""
+    path = _info_cache_path(url, auth_opts)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    info['formats'] = compact_formats(info.get('formats'))
+    return info
+
+def store_cached_info(url, info, auth_opts=None):
+    """写入元数据缓存（先写临时文件再替换，多线程写入安全）"""
+    path = _info_cache_path(url, auth_opts)
+    try:
+        os.makedirs(INFO_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**info, 'formats': [fmt.to_dict() for fmt in info['formats']]}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"警告: 写入元数据缓存失败: {e}")
+
+def fetch_info(url, auth_opts=None, use_cache=True, cache_dir=None, hedger=None, proxy=None):
+    """
+    非交互地提取视频元数据，只保留规划所需字段。
+    proxy 为解析使用的代理，为None时直连。
+    返回:
+      info (dict): {'id', 'title', 'duration', 'formats'}，formats 为精简记录列表
+    """
+    if use_cache:
+        cached = load_cached_info(url, auth_opts=auth_opts)
+        if cached is not None:
+            cached['cached'] = True
+            return cached
+
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        **(auth_opts or {})
+    }
+    if cache_dir:
+        ydl_opts['cachedir'] = cache_dir
+    if proxy:
+        ydl_opts['proxy'] = proxy
+    if hedger is not None:
+        raw = hedger.extract(url, ydl_opts)
+    else:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            raw = ydl.extract_info(url, download=False)
+
+    info = {
+        'id': raw.get('id'),
+        'title': raw.get('title') or '',
+        'duration': raw.get('duration'),
+        'formats': compact_formats(raw.get('formats')),
+    }
+    del raw
+    if use_cache:
+        store_cached_info(url, info, auth_opts)
+    info['cached'] = False
+    return info
+
+def estimate_format_bytes(fmt, duration):
+    """
+    估算单个格式的字节数。
+    优先使用 filesize，其次 filesize_approx，最后用 tbr(kbps) * duration 推算。
+    无法估算时返回0。
+    """
+    if not fmt:
+        return 0
+    for key in ('filesize', 'filesize_approx'):
+        if fmt.get(key):
+            return int(fmt[key])
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return 0
+
+def select_plan_formats(formats, resolution_option_idx=None, audio_option_idx=None):
+    """
+    与 download_with_options 相同的非交互格式选择逻辑（不下载）。
+    分辨率选项索引超出范围时抛出 ValueError（下载时同样会报错退出）；
+    音频选项索引无效时与下载一致，使用最高音质。
+    返回:
+      (chosen_height, [选中的格式记录]) ，无法选择时 chosen_height 为 None
+    """
+    single_map, video_map, audio_list = categorize_formats(formats)
+    sorted_heights = pick_resolution(single_map, video_map)
+    by_id = {f.get('format_id'): f for f in formats}
+
+    if not sorted_heights:
+        # 与 download_default 一致：'best'，取最后一个同时含音画的格式近似
+        best = [f for f in formats if f.get('vcodec', 'none') != 'none' and f.get('acodec', 'none') != 'none']
+        return None, best[-1:]
+
+    resolution_options = []
+    for h in sorted_heights:
+        if h in single_map:
+            resolution_options.append((h, True))
+        if h in video_map:
+            resolution_options.append((h, False))
+
+    idx = (resolution_option_idx or 1) - 1
+    if not 0 <= idx < len(resolution_options):
+        raise ValueError(f"分辨率选项索引 {resolution_option_idx} 无效（共 {len(resolution_options)} 个选项）")
+    chosen_height, prefer_single_file = resolution_options[idx]
+
+    if prefer_single_file:
+        return chosen_height, [by_id[single_map[chosen_height]]]
+
+    selected = [by_id[video_map[chosen_height]]]
+    if audio_list:
+        audio_idx = (audio_option_idx or 1) - 1
+        if not 0 <= audio_idx < len(audio_list):
+            audio_idx = 0
+        selected.append(by_id[audio_list[audio_idx][1]])
+    return chosen_height, selected
+
+def plan_item(url, auth_opts=None, resolution_option_idx=None, audio_option_idx=None, use_cache=True,
+              cache_dir=None, hedger=None, proxy_pool=None):
+    """对单个URL做格式选择和体积估算，返回规划记录"""
+    item = {'url': url}
+    try:
+        info = fetch_info(url, auth_opts, use_cache=use_cache, cache_dir=cache_dir, hedger=hedger,
+                          proxy=acquire_proxy(url, proxy_pool))
+    except Exception as e:
+        item['error'] = str(e)
+        return item
+    finally:
+        if proxy_pool is not None:
+            proxy_pool.release(url)
+
+    duration = info.get('duration')
+    try:
+        chosen_height, selected = select_plan_formats(info['formats'], resolution_option_idx, audio_option_idx)
+    except ValueError as e:
+        item.update({'title': info.get('title'), 'error': str(e)})
+        return item
+    sizes = [estimate_format_bytes(f, duration) for f in selected]
+    estimated_bytes = sum(sizes)
+    merge = len(selected) > 1
+
+    item.update({
+        'title': info.get('title'),
+        'duration': duration,
+        'cached': info.get('cached', False),
+        'height': chosen_height,
+        'format': '+'.join(f.get('format_id', '') for f in selected) or 'best',
+        'estimated_bytes': estimated_bytes,
+        # 合并时分离的音视频流与合并后的输出同时存在于磁盘
+        'peak_temp_bytes': estimated_bytes * 2 if merge else estimated_bytes,
+        'merge': merge,
+        'size_known': bool(selected) and all(sizes),
+    })
+    return item
+
+def plan_batch(urls, auth_opts=None, resolution_option_idx=None, audio_option_idx=None,
+               bandwidth=None, jobs=4, use_cache=True, cache_dir=None, hedger=None, proxy_pool=None):
+    """
+    并行提取（或读取缓存）所有URL的元数据并做格式选择，汇总体积、耗时与临时磁盘需求。
+    - bandwidth: 可用带宽（字节/秒），用于估算下载耗时
+    - jobs: 并行解析数，同时也视为下载并发数估算峰值磁盘占用
+    - cache_dir: 共享的 yt-dlp 缓存目录
+    - hedger: 对冲解析器（可选）
+    - proxy_pool: 代理池（可选），每个URL解析时分配代理
+    """
+    jobs = max(1, jobs or 1)
+    items = [None] * len(urls)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(plan_item, url, auth_opts, resolution_option_idx, audio_option_idx,
+                            use_cache, cache_dir, hedger, proxy_pool): i
+            for i, url in enumerate(urls)
+        }
+        for future in as_completed(futures):
+            items[futures[future]] = future.result()
+
+    ok_items = [item for item in items if 'error' not in item]
+    total_bytes = sum(item['estimated_bytes'] for item in ok_items)
+    # 并发下载时最坏情况是临时占用最大的 jobs 个任务同时进行
+    peak_temps = sorted((item['peak_temp_bytes'] for item in ok_items), reverse=True)
+    totals = {
+        'items': len(items),
+        'planned': len(ok_items),
+        'failed': len(items) - len(ok_items),
+        'unknown_size': sum(1 for item in ok_items if not item['size_known']),
+        'total_bytes': total_bytes,
+        'total_duration': sum(item['duration'] or 0 for item in ok_items),
+        'jobs': jobs,
+        'peak_temp_bytes': sum(peak_temps[:jobs]),
+        'bandwidth': bandwidth,
+        'expected_seconds': round(total_bytes / bandwidth, 1) if bandwidth else None,
+    }
+    return {'items': items, 'totals': totals}
+
+def list_item(url, auth_opts=None, use_cache=True, cache_dir=None, hedger=None, proxy_pool=None):
+    """
+    提取单个URL的格式信息并按单文件/视频流/音频流分类（与 list_formats 的分类一致）
+    返回: 可直接序列化为JSON的记录，失败时包含 error 字段
+    """
+    try:
+        info = fetch_info(url, auth_opts, use_cache=use_cache, cache_dir=cache_dir, hedger=hedger,
+                          proxy=acquire_proxy(url, proxy_pool))
+        single_map, video_map, audio_list = categorize_formats(info['formats'])
+    except Exception as e:
+        return {'url': url, 'error': str(e)}
+    finally:
+        if proxy_pool is not None:
+            proxy_pool.release(url)
+
+    duration = info.get('duration')
+    by_id = {f.get('format_id'): f for f in info['formats']}
+
+    def describe(format_id, **extra):
+        fmt = by_id[format_id]
+        return {'format_id': format_id, **extra, 'ext': fmt.get('ext'),
+                'vcodec': fmt.get('vcodec'), 'acodec': fmt.get('acodec'),
+                'bytes': estimate_format_bytes(fmt, duration) or None}
+
+    return {
+        'url': url,
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'duration': duration,
+        'cached': info.get('cached', False),
+        'single': [describe(single_map[h], height=h) for h in sorted(single_map, reverse=True)],
+        'video': [describe(video_map[h], height=h) for h in sorted(video_map, reverse=True)],
+        'audio': [describe(audio_id, abr=abr) for abr, audio_id in audio_list],
+    }
+
+def list_batch(urls, out, auth_opts=None, jobs=4, use_cache=True, cache_dir=None, hedger=None, proxy_pool=None):
+    """
+    以有限并发提取所有URL的格式信息，每完成一个URL立即向 out 写出一行JSON（NDJSON）。
+    同时在途的任务不超过 jobs 的两倍，URL数量很大时内存占用也保持稳定。
+    输出顺序为完成顺序，每条记录带有 url 字段以便对应。
+    返回: (成功数, 失败数)
+    """
+    jobs = max(1, jobs or 1)
+    succeeded = failed = 0
+    pending = set()
+    url_iter = iter(urls)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            for url in url_iter:
+                pending.add(executor.submit(list_item, url, auth_opts, use_cache, cache_dir, hedger, proxy_pool))
+                if len(pending) >= jobs * 2:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                if 'error' in record:
+                    failed += 1
+                else:
+                    succeeded += 1
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+    return succeeded, failed
+
+def format_bytes(num):
+    """将字节数格式化为便于阅读的字符串"""
+    num = float(num or 0)
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if num < 1024 or unit == 'TB':
+            return f"{num:.1f}{unit}"
+        num /= 1024
+
+def print_plan(plan):
+    """以表格形式输出批量规划结果"""
+    print(f"\n{'='*50}")
+    print("批量下载规划（未下载任何文件）")
+    print(f"{'='*50}")
+    for i, item in enumerate(plan['items'], 1):
+        if 'error' in item:
+            print(f"{i}. {item['url']}\n   无法规划: {item['error']}")
+            continue
+        height = f"{item['height']}p" if item['height'] else 'best'
+        size = format_bytes(item['estimated_bytes']) if item['size_known'] else f"≥{format_bytes(item['estimated_bytes'])}"
+        print(f"{i}. {item['title']}")
+        print(f"   格式: {item['format']} ({height}{'，需合并' if item['merge'] else ''})  预计大小: {size}"
+              f"{'  [缓存]' if item['cached'] else ''}")
+
+    totals = plan['totals']
+    print(f"\n共 {totals['items']} 个，成功规划 {totals['planned']} 个，失败 {totals['failed']} 个")
+    if totals['unknown_size']:
+        print(f"其中 {totals['unknown_size']} 个无法获得准确大小，估算值偏小")
+    print(f"预计下载总量: {format_bytes(totals['total_bytes'])}")
+    print(f"峰值临时磁盘需求（{totals['jobs']} 并发）: {format_bytes(totals['peak_temp_bytes'])}")
+    if totals['expected_seconds'] is not None:
+        minutes = totals['expected_seconds'] / 60
+        print(f"按 {format_bytes(totals['bandwidth'])}/s 估算耗时: {totals['expected_seconds']:.0f} 秒（约{minutes:.1f}分钟）")
+
+def adaptive_batch_download(urls, controller, max_workers, **download_kwargs):
+    """
+    由自适应并发控制器调度的并发批量下载（非交互）。
+    每个任务在下载前向控制器申请对应主机的名额，控制器根据403/429等反馈调整并发上限。
+    返回:
+      metrics (dict): 每个任务的结果以及控制器当前的并发上限
+    """
+    items = [None] * len(urls)
+
+    def worker(i, url):
+        host = get_host(url)
+        with controller.slot(host):
+            start = time.time()
+            item = {'url': url, 'host': host}
+            print(f"\n[{i + 1}/{len(urls)}] 开始下载: {url}")
+            # 每次重试都会报告错误，经 TaskFeedback 汇总后每个任务只计入一次结果
+            feedback = TaskFeedback(controller)
+            try:
+                item['success'] = bool(download_with_options(
+                    url, controller=feedback, interactive=False, **download_kwargs))
+            except Exception as e:
+                item['success'] = False
+                item['error'] = str(e)
+                feedback.record_error(host, classify_error(str(e)))
+            feedback.finish()
+            item['seconds'] = round(time.time() - start, 1)
+            print(f"[{i + 1}/{len(urls)}] {'完成' if item['success'] else '失败'}: {url} ({item['seconds']}秒)")
+            return item
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(worker, i, url): i for i, url in enumerate(urls)}
+        for future in as_completed(futures):
+            items[futures[future]] = future.result()
+
+    return {
+        'items': items,
+        'succeeded': sum(1 for item in items if item['success']),
+        'failed': sum(1 for item in items if not item['success']),
+        'concurrency': controller.metrics(),
+    }
+
+def print_proxy_metrics(metrics):
+    """输出代理池中各代理的状态"""
+    print("\n代理池状态:")
+    for url, state in metrics.items():
+        latency = f"{state['latency'] * 1000:.0f}ms" if state['latency'] is not None else '未知'
+        throughput = f"{format_bytes(state['throughput'])}/s" if state['throughput'] else '未知'
+        print(f"  {url}: {'已剔除' if state['ejected'] else '可用'}，延迟 {latency}，吞吐 {throughput}，"
+              f"成功 {state['successes']}，失败 {state['failures']}")
+
+def create_proxy_pool(config):
+    """根据配置创建并启动代理池，未配置代理时返回None"""
+    pool_config = config['network']['proxy_pool']
+    proxies = [p for p in (pool_config.get('proxies') or []) if p]
+    if not proxies:
+        return None
+    proxy_pool = ProxyPool(
+        proxies,
+        probe_url=pool_config['probe_url'],
+        probe_interval=pool_config['probe_interval'],
+        probe_timeout=pool_config['probe_timeout'],
+        eject_after=pool_config['eject_after'],
+        readmit_after=pool_config['readmit_after'],
+    )
+    print(f"正在探测 {len(proxies)} 个代理...")
+    proxy_pool.start()
+    return proxy_pool
+
+def print_fragment_tuning(metrics):
+    """输出分片并发调优结果"""
+    print("\n分片并发调优:")
+    for host, state in metrics.items():
+        levels = '，'.join(f"{level}并发 {format_bytes(tp)}/s" for level, tp in state['throughput'].items())
+        print(f"  {host}: 当前采用 {state['best']}{'（正在尝试 ' + str(state['trying']) + '）' if state['trying'] else ''}"
+              f"{'，实测: ' + levels if levels else ''}")
+
+def create_fragment_settings(args, config):
+    """
+    解析分片并发设置（命令行 --fragments 优先于配置文件）
+    返回:
+      (concurrent_fragments, fragment_tuner)，设置为 auto 时启用调优器
+    """
+    advanced = config['advanced']
+    value = str(args.fragments or advanced['concurrent_fragments']).strip().lower()
+    if value == 'auto':
+        concurrency = config['concurrency']
+        tuner = FragmentTuner(
+            min_fragments=concurrency['min_fragments'],
+            max_fragments=concurrency['max_fragments'],
+            initial=concurrency['initial_fragments'],
+            state_file=os.path.expanduser(advanced['fragment_tuning_file']),
+        )
+        return concurrency['initial_fragments'], tuner
+    try:
+        return max(1, int(value)), None
+    except ValueError:
+        print(f"警告: 无效的分片并发设置 '{value}'，使用默认值4")
+        return 4, None
+
+def get_cache_dir(config):
+    """配置中的共享 yt-dlp 缓存目录，留空表示使用 yt-dlp 默认位置"""
+    cache_dir = config['advanced'].get('cache_dir')
+    return os.path.expanduser(cache_dir) if cache_dir else None
+
+def create_hedger(args, config):
+    """启用对冲解析时（--hedge 或配置 hedged_extraction）创建解析器，否则返回None"""
+    advanced = config['advanced']
+    if not (args.hedge or advanced['hedged_extraction']):
+        return None
+    return HedgedExtractor(clients=advanced['hedge_clients'], hedge_delay=advanced['hedge_delay'])
+
+def create_stager(args, config):
+    """配置了暂存目录（--scratch 或 advanced.scratch_dir）时创建搬运器，否则返回None"""
+    scratch_dir = args.scratch or config['advanced'].get('scratch_dir')
+    if not scratch_dir:
+        return None
+    stager = StagingMover(scratch_dir, workers=config['advanced']['stage_workers'])
+    print(f"使用暂存目录: {stager.scratch_dir}")
+    return stager
+
+def create_library_index(config):
+    """打开媒体库索引（library.record_downloads 关闭时返回None）"""
+    library_config = config['library']
+    if not library_config['record_downloads']:
+        return None
+    try:
+        return LibraryIndex(library_config['index_db'])
+    except sqlite3.Error as e:
+        print(f"警告: 无法打开媒体库索引 {library_config['index_db']}: {e}")
+        return None
+
+def create_library(args, config, index=None):
+    """启用下载库（--library 或 library.enabled）时以输出目录创建，否则返回None"""
+    library_config = config['library']
+    if not (args.library or library_config['enabled']):
+        return None
+    quota = args.quota or library_config['quota']
+    quota_bytes = None
+    if quota:
+        quota_bytes = yt_dlp.utils.parse_bytes(str(quota))
+        if not quota_bytes:
+            print(f"警告: 无法解析下载库配额: {quota}，不限制容量")
+    library = Library(args.output, quota_bytes=quota_bytes, max_age_days=library_config['max_age_days'],
+                      on_evict=index.mark_removed if index is not None else None)
+    print(f"下载库: {library.root}，已用 {format_bytes(library.usage())}"
+          + (f" / 配额 {format_bytes(quota_bytes)}" if quota_bytes else ""))
+    return library
+
+def record_live(url, args, config):
+    """直播录制模式：跟随直播播放列表，按 segment_time 轮换输出文件，直到直播结束或按 Ctrl+C"""
+    live_config = config['live']
+    auth_opts = setup_authentication(no_auth=args.no_auth, cookies_file=args.cookies, browser=args.browser)
+    # 页面解析和分片下载都走代理池分配的同一个代理
+    proxy_pool = create_proxy_pool(config)
+    proxy = acquire_proxy(url, proxy_pool)
+    ydl_opts = {**auth_opts}
+    if proxy:
+        ydl_opts['proxy'] = proxy
+    cache_dir = get_cache_dir(config)
+    if cache_dir:
+        ydl_opts['cachedir'] = cache_dir
+    recorder = LiveRecorder(
+        url,
+        args.output,
+        sanitize_filename(args.name) if args.name else 'live',
+        segment_time=args.segment_time or live_config['segment_time'],
+        idle_timeout=live_config['idle_timeout'],
+        max_height=live_config['max_height'],
+        ydl_opts=ydl_opts,
+        proxy=proxy,
+    )
+    print(f"开始录制直播: {url}（每 {recorder.segment_time} 秒一个文件，按 Ctrl+C 停止）")
+    try:
+        stats = recorder.record()
+    finally:
+        if proxy_pool is not None:
+            proxy_pool.release(url)
+            proxy_pool.stop()
+    print(f"\n录制结束: 共 {stats['segments']} 个分片，{format_bytes(stats['bytes'])}，"
+          f"{len(stats['files'])} 个文件，重连 {stats['reconnects']} 次，缺口 {stats['gaps']} 处")
+    for path in stats['files']:
+        print(f"  {path}")
+    return stats
+
+def get_verify_mode(args, config):
+    """下载后完整性校验方式：None（不校验）、'probe'（头部探测）或 'keyframes'（另做关键帧扫描）"""
+    advanced = config['advanced']
+    if args.no_verify or not advanced['verify_downloads']:
+        return None
+    if args.verify_keyframes or advanced['verify_keyframes']:
+        return 'keyframes'
+    return 'probe'
+
+def close_download_resources(download_kwargs):
+    """等待后台搬运完成并停止代理池探测"""
+    if download_kwargs['stager'] is not None:
+        print("等待暂存文件移动到输出目录...")
+        download_kwargs['stager'].close()
+    if download_kwargs['proxy_pool'] is not None:
+        download_kwargs['proxy_pool'].stop()
+    if download_kwargs['library'] is not None:
+        print(f"下载库已用: {format_bytes(download_kwargs['library'].usage())}")
+    if download_kwargs['index'] is not None:
+        download_kwargs['index'].close()
+
+def prepare_shared_cache(cache_dir, sample_url, auth_opts=None, proxy_pool=None):
+    """
+    批量任务开始前：检查播放器版本（变化时清除旧签名缓存），并用第一个URL预热缓存
+    两个请求都通过为 sample_url 分配的代理发出
+    """
+    if not cache_dir:
+        return
+    proxy = acquire_proxy(sample_url, proxy_pool)
+    try:
+        player_version = ytdlp_cache.prepare_cache(cache_dir, proxy=proxy)
+        if player_version:
+            print(f"YouTube播放器版本: {player_version}")
+        ytdlp_cache.warm_cache(sample_url, cache_dir, {**(auth_opts or {}), 'proxy': proxy} if proxy else auth_opts)
+    finally:
+        if proxy_pool is not None:
+            proxy_pool.release(sample_url)
+
+def print_concurrency_metrics(metrics):
+    """输出各主机的并发控制状态"""
+    print("\n并发控制状态:")
+    for host, state in metrics.items():
+        print(f"  {host}: 并发下载上限 {state['download_limit']}，分片并发 {state['fragment_limit']}，"
+              f"成功 {state['successes']}，失败 {state['errors']}（限流 {state['throttles']}），"
+              f"错误率 {state['error_rate']:.0%}")
+
 def load_config():
     """加载配置文件"""
     config = {
@@ -638,48 +1547,59 @@ def load_config():
             'proxy': None,
             'timeout': 300,
             'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.6367.93 Safari/537.36',
+            'proxy_pool': {
+                'proxies': [],
+                'probe_url': 'https://www.youtube.com/generate_204',
+                'probe_interval': 60,
+                'probe_timeout': 10,
+                'eject_after': 3,
+                'readmit_after': 120,
+            },
         },
         'advanced': {
             'use_aria2c': True,
             'verbose': True,
             'no_check_certificate': False,
+            'concurrent_fragments': 4,
+            'fragment_tuning_file': '~/.videodownloader/fragment_tuning.json',
+            'cache_dir': '~/.videodownloader/ytdlp_cache',
+            'hedged_extraction': False,
+            'hedge_clients': ['web', 'android', 'mweb'],
+            'hedge_delay': 2,
+            'scratch_dir': None,
+            'stage_workers': 1,
+            'verify_downloads': True,
+            'verify_keyframes': False,
+            'checksums': False,
+        },
+        'library': {
+            'record_downloads': True,
+            'index_db': '~/.videodownloader/library.db',
+            'enabled': False,
+            'quota': None,
+            'max_age_days': None,
+        },
+        'live': {
+            'segment_time': 3600,
+            'idle_timeout': 300,
+            'max_height': None,
+        },
+        'concurrency': {
+            'initial_downloads': 2,
+            'min_fragments': 1,
+            'max_fragments': 16,
+            'initial_fragments': 4,
+            'increase_every': 3,
+            'decrease_factor': 0.5,
+            'error_threshold': 0.1,
         }
     }
 
-    # 尝试加载YAML配置文件
-    config_paths = [
-        './config.yaml',
-        './config.yml',
-        '~/.videodownloader/config.yaml',
-        '~/.videodownloader/config.yml',
-    ]
-
-    for path in config_paths:
-        expanded_path = os.path.expanduser(path)
-        if os.path.exists(expanded_path):
-            try:
-                # 尝试导入yaml模块
-                import yaml
-                with open(expanded_path, 'r', encoding='utf-8') as f:
-                    user_config = yaml.safe_load(f)
-                    if user_config:
-                        # 深度合并配置
-                        def deep_update(target, source):
-                            for key, value in source.items():
-                                if key in target and isinstance(target[key], dict) and isinstance(value, dict):
-                                    deep_update(target[key], value)
-                                else:
-                                    target[key] = value
-
-                        deep_update(config, user_config)
-                        print(f"已加载配置文件: {expanded_path}")
-                        return config
-            except ImportError:
-                print(f"注意: 未安装PyYAML，无法读取配置文件 {expanded_path}")
-                print("安装命令: pip install pyyaml")
-            except Exception as e:
-                print(f"警告: 读取配置文件失败 {expanded_path}: {e}")
-
+    # 加载YAML配置文件（与 convert.py 共用，见 config_loader）
+    path, user_config = read_config_file()
+    if user_config:
+        deep_update(config, user_config)
+        print(f"已加载配置文件: {path}", file=sys.stderr)
     return config
 
 def apply_config_to_args(args, config):
@@ -700,7 +1620,150 @@ def apply_config_to_args(args, config):
 
     return args
 
+def build_download_kwargs(args, config):
+    """由命令行参数和配置组装 download_with_options 的公共参数"""
+    concurrent_fragments, fragment_tuner = create_fragment_settings(args, config)
+    index = create_library_index(config)
+    return {
+        'resolution_option_idx': args.resolution,
+        'audio_option_idx': args.audio,
+        'custom_name': args.name,
+        'output_dir': args.output,
+        'no_auth': args.no_auth,
+        'cookies_file': args.cookies,
+        'browser': args.browser,
+        'proxy_pool': create_proxy_pool(config),
+        'concurrent_fragments': concurrent_fragments,
+        'fragment_tuner': fragment_tuner,
+        'cache_dir': get_cache_dir(config),
+        'hedger': create_hedger(args, config),
+        'stager': create_stager(args, config),
+        'library': create_library(args, config, index),
+        'index': index,
+        'verify': get_verify_mode(args, config),
+        'checksums': args.checksum or config['advanced']['checksums'],
+    }
+
+def print_library_rows(rows):
+    """以表格形式打印媒体库记录"""
+    if not rows:
+        print("没有匹配的记录")
+        return
+    for row in rows:
+        height = f"{row['height']}p" if row['height'] else '-'
+        duration = f"{int(row['duration'] // 60)}:{int(row['duration'] % 60):02d}" if row['duration'] else '-'
+        added = datetime.fromtimestamp(row['downloaded_at']).strftime('%Y-%m-%d %H:%M') if row['downloaded_at'] else '-'
+        removed = '' if row['present'] else ' [已删除]'
+        print(f"{row['id']:>6}  {added}  {height:>6}  {duration:>7}  {format_bytes(row['filesize'] or 0):>10}  "
+              f"{row['title'] or '-'}{removed}")
+        print(f"        {row['uploader'] or '-'} | {row['video_id'] or '-'} | {row['path']}")
+
+def library_command(argv):
+    """
+    媒体库查询子命令: library list / search / stats
+    只读本地索引数据库，不访问网络也不扫描目录
+    返回: 进程退出码（索引不存在时为2）
+    """
+    parser = argparse.ArgumentParser(prog='video_cli.py library', description='查询本地媒体库索引')
+    parser.add_argument('action', choices=['list', 'search', 'stats'], help='list: 最近下载；search: 检索；stats: 统计')
+    parser.add_argument('query', nargs='?', help='search 的检索词（标题、上传者、视频ID或URL）')
+    parser.add_argument('--limit', type=int, default=50, help='最多显示条数（默认: 50）')
+    parser.add_argument('--all', action='store_true', help='包括已被删除/淘汰的文件')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    parser.add_argument('--db', help='索引数据库路径（默认取配置 library.index_db）')
+    args = parser.parse_args(argv)
+    if args.action == 'search' and not args.query:
+        parser.error('search 需要检索词')
+
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        config = load_config()
+    db_path = os.path.expanduser(args.db or config['library']['index_db'])
+    if not os.path.exists(db_path):
+        print(f"错误: 媒体库索引不存在: {db_path}", file=sys.stderr)
+        return 2
+    index = LibraryIndex(db_path)
+    start = time.perf_counter()
+    if args.action == 'list':
+        result = index.list(limit=args.limit, include_removed=args.all)
+    elif args.action == 'search':
+        result = index.search(args.query, limit=args.limit, include_removed=args.all)
+    else:
+        result = index.stats()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    index.close()
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif args.action == 'stats':
+        print(f"文件数: {result['files']}（{result['videos']} 个视频），已删除记录: {result['removed']}")
+        print(f"总大小: {format_bytes(result['bytes'])}，总时长: {result['duration'] / 3600:.1f} 小时")
+        if result['by_height']:
+            print("按分辨率: " + "，".join(f"{h}{'p' if h != 'unknown' else ''} {n}个"
+                                          for h, n in result['by_height'].items()))
+        for item in result['top_uploaders']:
+            print(f"  {item['uploader']}: {item['files']} 个")
+        print(f"（查询耗时 {elapsed_ms:.1f} 毫秒）")
+    else:
+        print_library_rows(result)
+        print(f"\n共 {len(result)} 条（查询耗时 {elapsed_ms:.1f} 毫秒）")
+
+def verify_command(argv):
+    """
+    校验和验证子命令: 按 SHA256SUMS 清单和/或媒体库索引中的摘要并行重新计算并比对
+    返回: 进程退出码（全部通过为0）
+    """
+    parser = argparse.ArgumentParser(prog='video_cli.py verify', description='按下载时记录的SHA-256校验文件')
+    parser.add_argument('paths', nargs='*', help='SHA256SUMS 清单文件或包含清单的目录（默认: 下载目录）')
+    parser.add_argument('--library', action='store_true', help='校验媒体库索引中记录了摘要的所有文件')
+    parser.add_argument('--jobs', type=int, default=4, help='并行校验数（默认: 4）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    args = parser.parse_args(argv)
+
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        config = load_config()
+        entries = {}
+        paths = args.paths or ([] if args.library else [config['defaults']['download_dir']])
+        for path in paths:
+            manifest = os.path.join(path, checksum.MANIFEST_NAME) if os.path.isdir(path) else path
+            try:
+                entries.update(checksum.read_manifest(manifest))
+            except OSError as e:
+                print(f"错误: 无法读取清单 {manifest}: {e}")
+                return 2
+        if args.library:
+            # 只读查询，不能让 LibraryIndex 新建一个空数据库后报告"没有可校验的文件"
+            index_db = os.path.expanduser(config['library']['index_db'])
+            if not os.path.exists(index_db):
+                print(f"错误: 媒体库索引不存在: {index_db}")
+                return 2
+            index = LibraryIndex(index_db)
+            entries.update(index.checksums())
+            index.close()
+        if not entries:
+            print("没有可校验的文件")
+            return 0
+        print(f"校验 {len(entries)} 个文件（并行 {args.jobs}）...")
+        start = time.time()
+        results = checksum.verify_files(entries, jobs=args.jobs)
+        elapsed = time.time() - start
+
+    failed = [(path, status) for path, status in results if status != 'ok']
+    if args.json:
+        print(json.dumps({'checked': len(results), 'failed': [{'path': p, 'status': st} for p, st in failed],
+                          'seconds': round(elapsed, 1)}, ensure_ascii=False, indent=2))
+    else:
+        for path, status in failed:
+            print(f"{status.upper():>9}  {path}")
+        print(f"共校验 {len(results)} 个文件，通过 {len(results) - len(failed)} 个，失败 {len(failed)} 个（{elapsed:.1f}秒）")
+    return 1 if failed else 0
+
 def main():
+    # 媒体库查询、校验和验证子命令
+    if len(sys.argv) > 1 and sys.argv[1] == 'library':
+        sys.exit(library_command(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'verify':
+        sys.exit(verify_command(sys.argv[2:]))
+
     # 加载配置文件
     config = load_config()
 
@@ -716,11 +1779,15 @@ def main():
   %(prog)s https://youtube.com/watch?v=xxx --output ./videos  # 指定输出目录
   %(prog)s https://youtube.com/watch?v=xxx --no-auth          # 跳过认证
   %(prog)s https://youtube.com/watch?v=xxx --cookies ~/cookies.txt  # 使用指定cookie文件
+  %(prog)s --batch urls.txt --plan --bandwidth 20M           # 批量下载前估算体积、耗时和磁盘需求
+  %(prog)s --batch urls.txt --list --jobs 16 > formats.ndjson  # 并发列出格式，每个URL输出一行JSON
+  %(prog)s library search "关键词"                            # 检索本地媒体库（list/search/stats）
+  %(prog)s verify ./download --jobs 8                        # 按SHA256SUMS清单并行校验已下载文件
         """
     )
 
     parser.add_argument('url', nargs='?', help='YouTube视频URL')
-    parser.add_argument('-l', '--list', action='store_true', help='仅列出可用格式，不下载')
+    parser.add_argument('-l', '--list', action='store_true', help='仅列出可用格式，不下载（配合--batch时并发提取，逐行输出NDJSON）')
     parser.add_argument('-r', '--resolution', type=int, help='分辨率选项编号（从1开始）')
     parser.add_argument('-a', '--audio', type=int, help='音频选项编号（从1开始）')
     parser.add_argument('-o', '--output', default='./download', help='输出目录（默认: ./download）')
@@ -730,6 +1797,27 @@ def main():
     parser.add_argument('--browser', choices=['chrome', 'firefox', 'edge', 'safari', 'opera', 'brave', 'chromium'],
                        help='指定浏览器类型（用于提取cookies）')
     parser.add_argument('--batch', help='批量下载URL文件（每行一个URL）')
+    parser.add_argument('--plan', action='store_true', help='配合--batch使用：仅规划，估算体积、耗时和临时磁盘需求，不下载')
+    parser.add_argument('--bandwidth', help='规划时假定的带宽（字节/秒，支持K/M/G后缀，如 20M）')
+    parser.add_argument('--jobs', type=int, default=4, help='并行数（默认: 4）')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出结果')
+    parser.add_argument('--no-cache', action='store_true', help='不使用元数据缓存')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='配合--batch使用：自适应并发下载，遇到403/429自动降速（--jobs为并发上限）')
+    parser.add_argument('--metrics', help='将批量下载结果和并发控制状态写入指定JSON文件')
+    parser.add_argument('--fragments', help='DASH/HLS分片并发数，或 auto 按实测吞吐自动调优（默认取配置，4）')
+    parser.add_argument('--hedge', action='store_true', help='对冲解析：首选客户端超过延迟阈值未返回时追加其他客户端，采用最先返回的结果')
+    parser.add_argument('--live', action='store_true', help='直播录制模式：跟随直播流写入滚动分段文件，断线自动重连')
+    parser.add_argument('--segment-time', type=int, help='直播录制时每个文件的时长（秒，默认3600）')
+    parser.add_argument('--no-verify', action='store_true', help='下载后不做完整性校验')
+    parser.add_argument('--verify-keyframes', action='store_true', help='完整性校验时额外做关键帧解码扫描（较慢）')
+    parser.add_argument('--checksum', action='store_true',
+                        help='边下载边计算SHA-256（不使用aria2c），写入输出目录的SHA256SUMS清单和媒体库索引'
+                             '（用 verify 命令校验）；音视频合并的输出在合并完成后计算')
+    parser.add_argument('--library', action='store_true',
+                        help='下载库模式：记录每个文件的使用时间，超出配额时淘汰最久未使用的文件')
+    parser.add_argument('--quota', help='下载库容量配额（支持K/M/G/T后缀，如 500G）')
+    parser.add_argument('--scratch', help='暂存目录（如本地SSD/tmpfs），下载和合并在此进行，完成后移动到输出目录')
 
     args = parser.parse_args()
 
@@ -745,21 +1833,107 @@ def main():
         with open(args.batch, 'r') as f:
             urls = [line.strip() for line in f if line.strip()]
 
+        if args.list:
+            # 过程信息转到stderr，标准输出只有NDJSON记录
+            out = sys.stdout
+            with contextlib.redirect_stdout(sys.stderr):
+                auth_opts = setup_authentication(no_auth=args.no_auth, cookies_file=args.cookies, browser=args.browser)
+                cache_dir = get_cache_dir(config)
+                proxy_pool = create_proxy_pool(config)
+                if urls:
+                    prepare_shared_cache(cache_dir, urls[0], auth_opts, proxy_pool)
+                start = time.time()
+                succeeded, failed = list_batch(urls, out, auth_opts, jobs=args.jobs, use_cache=not args.no_cache,
+                                               cache_dir=cache_dir, hedger=create_hedger(args, config),
+                                               proxy_pool=proxy_pool)
+                if proxy_pool is not None:
+                    proxy_pool.stop()
+                print(f"已列出 {succeeded} 个，失败 {failed} 个（{time.time() - start:.1f}秒）")
+            return
+
+        if args.plan:
+            bandwidth = None
+            if args.bandwidth:
+                bandwidth = yt_dlp.utils.parse_bytes(args.bandwidth)
+                if not bandwidth:
+                    print(f"错误: 无法解析带宽: {args.bandwidth}")
+                    return
+            # JSON模式下把过程信息转到stderr，保证标准输出是合法JSON
+            with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+                auth_opts = setup_authentication(no_auth=args.no_auth, cookies_file=args.cookies, browser=args.browser)
+                cache_dir = get_cache_dir(config)
+                proxy_pool = create_proxy_pool(config)
+                if urls:
+                    prepare_shared_cache(cache_dir, urls[0], auth_opts, proxy_pool)
+                plan = plan_batch(
+                    urls,
+                    auth_opts,
+                    resolution_option_idx=args.resolution,
+                    audio_option_idx=args.audio,
+                    bandwidth=bandwidth,
+                    jobs=args.jobs,
+                    use_cache=not args.no_cache,
+                    cache_dir=cache_dir,
+                    hedger=create_hedger(args, config),
+                    proxy_pool=proxy_pool
+                )
+                if proxy_pool is not None:
+                    proxy_pool.stop()
+            if args.json:
+                print(json.dumps(plan, ensure_ascii=False, indent=2))
+            else:
+                print_plan(plan)
+            return
+
         print(f"找到 {len(urls)} 个视频需要下载")
-        for i, url in enumerate(urls, 1):
-            print(f"\n{'='*50}")
-            print(f"下载第 {i}/{len(urls)} 个视频: {url}")
-            print(f"{'='*50}")
-            download_with_options(
-                url,
-                resolution_option_idx=args.resolution,
-                audio_option_idx=args.audio,
-                custom_name=args.name,
-                output_dir=args.output,
-                no_auth=args.no_auth,
-                cookies_file=args.cookies,
-                browser=args.browser
+        download_kwargs = build_download_kwargs(args, config)
+        proxy_pool = download_kwargs['proxy_pool']
+        if urls:
+            # 认证方式在主线程确定一次，所有任务共用（并发任务不能各自询问，也避免每个URL重复提取浏览器cookies）
+            download_kwargs['auth_opts'] = setup_authentication(no_auth=args.no_auth, cookies_file=args.cookies,
+                                                                browser=args.browser)
+        if urls and download_kwargs['cache_dir']:
+            # 预热一次共享缓存，后续（并发）任务直接复用签名函数
+            prepare_shared_cache(download_kwargs['cache_dir'], urls[0], download_kwargs['auth_opts'], proxy_pool)
+        if args.adaptive:
+            concurrency = config['concurrency']
+            controller = AdaptiveConcurrencyController(
+                max_downloads=args.jobs,
+                initial_downloads=concurrency['initial_downloads'],
+                min_fragments=concurrency['min_fragments'],
+                max_fragments=concurrency['max_fragments'],
+                initial_fragments=concurrency['initial_fragments'],
+                increase_every=concurrency['increase_every'],
+                decrease_factor=concurrency['decrease_factor'],
+                error_threshold=concurrency['error_threshold'],
             )
+            metrics = adaptive_batch_download(urls, controller, args.jobs, **download_kwargs)
+            print(f"\n批量下载结束: 成功 {metrics['succeeded']} 个，失败 {metrics['failed']} 个")
+            print_concurrency_metrics(metrics['concurrency'])
+            if proxy_pool is not None:
+                metrics['proxies'] = proxy_pool.metrics()
+                print_proxy_metrics(metrics['proxies'])
+            if download_kwargs['fragment_tuner'] is not None:
+                metrics['fragment_tuning'] = download_kwargs['fragment_tuner'].metrics()
+                print_fragment_tuning(metrics['fragment_tuning'])
+            if download_kwargs['hedger'] is not None:
+                metrics['extraction_clients'] = download_kwargs['hedger'].metrics()
+            if args.metrics:
+                with open(args.metrics, 'w', encoding='utf-8') as f:
+                    json.dump(metrics, f, ensure_ascii=False, indent=2)
+                print(f"指标已写入: {args.metrics}")
+        else:
+            for i, url in enumerate(urls, 1):
+                print(f"\n{'='*50}")
+                print(f"下载第 {i}/{len(urls)} 个视频: {url}")
+                print(f"{'='*50}")
+                download_with_options(url, **download_kwargs)
+            if proxy_pool is not None:
+                print_proxy_metrics(proxy_pool.metrics())
+            if download_kwargs['fragment_tuner'] is not None:
+                print_fragment_tuning(download_kwargs['fragment_tuner'].metrics())
+
+        close_download_resources(download_kwargs)
         return
 
     # 单个URL模式
@@ -770,10 +1944,21 @@ def main():
             print("未输入链接，程序退出。")
             return
 
+    # 直播录制模式
+    if args.live:
+        record_live(args.url, args, config)
+        return
+
     # 仅列出格式模式
     if args.list:
         auth_opts = setup_authentication(no_auth=args.no_auth, cookies_file=args.cookies, browser=args.browser)
-        result = list_formats(args.url, auth_opts)
+        proxy_pool = create_proxy_pool(config)
+        try:
+            result = list_formats(args.url, auth_opts, cache_dir=get_cache_dir(config),
+                                  hedger=create_hedger(args, config), proxy=acquire_proxy(args.url, proxy_pool))
+        finally:
+            if proxy_pool is not None:
+                proxy_pool.stop()
         if result:
             title_clean, resolution_options, single_map, video_map, audio_list, _ = result
             if audio_list:
@@ -783,16 +1968,9 @@ def main():
         return
 
     # 下载模式
-    download_with_options(
-        args.url,
-        resolution_option_idx=args.resolution,
-        audio_option_idx=args.audio,
-        custom_name=args.name,
-        output_dir=args.output,
-        no_auth=args.no_auth,
-        cookies_file=args.cookies,
-        browser=args.browser
-    )
+    download_kwargs = build_download_kwargs(args, config)
+    download_with_options(args.url, **download_kwargs)
+    close_download_resources(download_kwargs)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
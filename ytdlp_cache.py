@@ -0,0 +1,140 @@
+"""
+yt-dlp 共享缓存目录管理
+yt-dlp 会把解析 YouTube 播放器JS得到的签名函数、n参数函数缓存在 cachedir 中。
+这里提供一个受管理的共享缓存目录:
+- 批量任务开始时预热一次（解析一个视频即可填充缓存），之后各并发任务直接复用
+- yt-dlp 写缓存是"写临时文件再改名"，并发读取是安全的；清理操作加文件锁
+- 记录当前播放器版本，版本变化时清除旧的签名缓存，防止缓存无限增长或使用过期数据
+"""
+import json
+import os
+import re
+import shutil
+import time
+
+import requests
+import yt_dlp
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.videodownloader/ytdlp_cache')
+
+# 与播放器版本绑定的缓存分区
+SIGNATURE_SECTIONS = ('youtube-sigfuncs', 'youtube-nsig')
+PLAYER_VERSION_FILE = 'player_version.json'
+LOCK_FILE = '.lock'
+IFRAME_API_URL = 'https://www.youtube.com/iframe_api'
+
+def fetch_player_version(proxy=None, timeout=10):
+    """从 iframe_api 获取当前播放器版本号（8位十六进制），失败时返回None"""
+    try:
+        response = requests.get(IFRAME_API_URL, timeout=timeout,
+                                proxies={'http': proxy, 'https': proxy} if proxy else None)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"警告: 获取YouTube播放器版本失败: {e}")
+        return None
+    match = re.search(r'player\\?/([0-9a-fA-F]{8})\\?/', response.text)
+    return match.group(1) if match else None
+
+def _acquire_lock(cache_dir, timeout=30, stale_after=120):
+    """基于 O_EXCL 的简单文件锁（跨平台），超过 stale_after 秒的锁视为残留并清除"""
+    lock_path = os.path.join(cache_dir, LOCK_FILE)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            return lock_path
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.2)
+
+def read_player_version(cache_dir):
+    """读取缓存目录记录的播放器版本"""
+    try:
+        with open(os.path.join(cache_dir, PLAYER_VERSION_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f).get('player_version')
+    except (OSError, ValueError):
+        return None
+
+def prepare_cache(cache_dir=DEFAULT_CACHE_DIR, player_version=None, proxy=None):
+    """
+    准备共享缓存目录，播放器版本变化时清除旧的签名缓存。
+    参数:
+      player_version: 已知的播放器版本，为None时在线获取
+    返回:
+      当前播放器版本（获取失败时为None，此时不做清理）
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    if player_version is None:
+        player_version = fetch_player_version(proxy=proxy)
+    if player_version is None:
+        return None
+
+    cached_version = read_player_version(cache_dir)
+    if cached_version == player_version:
+        return player_version
+
+    lock_path = _acquire_lock(cache_dir)
+    if lock_path is None:
+        print("警告: 缓存目录被其他进程锁定，跳过清理")
+        return player_version
+    try:
+        # 拿到锁后再确认一次，可能已被其他进程更新
+        if read_player_version(cache_dir) != player_version:
+            for section in SIGNATURE_SECTIONS:
+                shutil.rmtree(os.path.join(cache_dir, section), ignore_errors=True)
+            tmp_path = os.path.join(cache_dir, f"{PLAYER_VERSION_FILE}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'player_version': player_version, 'updated': int(time.time())}, f)
+            os.replace(tmp_path, os.path.join(cache_dir, PLAYER_VERSION_FILE))
+            if cached_version:
+                print(f"YouTube播放器版本已更新 ({cached_version} -> {player_version})，已清除旧的签名缓存")
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+    return player_version
+
+def cache_stats(cache_dir=DEFAULT_CACHE_DIR):
+    """各缓存分区的条目数"""
+    stats = {}
+    for section in SIGNATURE_SECTIONS:
+        section_dir = os.path.join(cache_dir, section)
+        try:
+            stats[section] = len(os.listdir(section_dir))
+        except OSError:
+            stats[section] = 0
+    return stats
+
+def warm_cache(url, cache_dir=DEFAULT_CACHE_DIR, ydl_opts=None):
+    """
+    解析一个视频以预热签名缓存（不下载）。
+    返回:
+      是否成功
+    """
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        **(ydl_opts or {}),
+        'cachedir': cache_dir,
+    }
+    start = time.time()
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.extract_info(url, download=False)
+    except Exception as e:
+        print(f"警告: 预热yt-dlp缓存失败: {e}")
+        return False
+    stats = cache_stats(cache_dir)
+    print(f"yt-dlp缓存已预热（{time.time() - start:.1f}秒）: "
+          + '，'.join(f"{section} {count}项" for section, count in stats.items()))
+    return True